@@ -0,0 +1,108 @@
+"""Size and latency tradeoff of compress_threshold.
+
+For markdown documents (prose with TEST_MARKDOWN_TEXT in between) and
+table-heavy reports of 4 KB - 1 MB, compares sending the content as a JSON
+string with sending it zlib-compressed as a binary arg, at several zlib
+levels. The estimated
+latency is compression + transfer at the given link speed + inflating, with
+Python's zlib standing in for the browser's DecompressionStream.
+
+It ends with the size from which compression pays off for each link speed,
+a starting point for compress_threshold. Streamlit doesn't compress
+its websocket by default (server.enableWebsocketCompression), so the raw
+numbers are what goes over the wire.
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_compression.py
+"""
+import json
+import random
+import time
+import zlib
+
+from streamlit_markdown import TEST_MARKDOWN_TEXT
+from streamlit_markdown.compression import COMPRESSION_LEVEL
+
+SIZES = [4_000, 16_000, 64_000, 256_000, 1_000_000]
+LEVELS = [1, 6, 9]
+LINKS_MBIT = [1, 10, 100, 1000]
+
+
+def markdown_document(size):
+    # repeating one sample would compress far better than real text
+    rng = random.Random(0)
+    words = ["".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=rng.randint(2, 10))) for _ in range(5000)]
+    parts = []
+    while sum(map(len, parts)) < size:
+        parts.append(f"## {' '.join(rng.choices(words, k=4))}\n")
+        for _ in range(rng.randint(2, 5)):
+            parts.append(" ".join(rng.choices(words, k=rng.randint(30, 90))) + "\n")
+        if rng.random() < 0.3:
+            parts.append(TEST_MARKDOWN_TEXT)
+    return "\n".join(parts)[:size]
+
+
+def table_report(size):
+    rng = random.Random(0)
+    lines = ["| region | product | units | revenue | margin |", "|---|---|---|---|---|"]
+    while sum(map(len, lines)) < size:
+        lines.append(
+            f"| {rng.choice(['north', 'south', 'east', 'west'])} | item-{rng.randint(1, 500)}"
+            f" | {rng.randint(1, 10_000)} | {rng.uniform(0, 1e6):.2f} | {rng.uniform(-0.2, 0.6):.1%} |"
+        )
+    return "\n".join(lines)[:size]
+
+
+def best_of(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def transfer_seconds(n_bytes, mbit):
+    return n_bytes * 8 / (mbit * 1e6)
+
+
+def main():
+    # (document, link) -> smallest size from which every larger one pays off
+    break_even = {}
+    print(
+        f"{'document':<10} {'size':>9} {'level':>5} {'bytes':>9} {'ratio':>6} {'compress':>9} {'inflate':>8}"
+        + "".join(f" {f'{mbit}Mbit raw/zlib':>20}" for mbit in LINKS_MBIT)
+    )
+    for name, make in [("markdown", markdown_document), ("tables", table_report)]:
+        for size in SIZES:
+            content = make(size)
+            raw = len(json.dumps(content, ensure_ascii=False).encode())
+            data = content.encode()
+            for level in LEVELS:
+                compressed, compress_s = best_of(lambda: zlib.compress(data, level))
+                _, inflate_s = best_of(lambda: zlib.decompress(compressed))
+                row = (
+                    f"{name:<10} {size:>9} {level:>5} {len(compressed):>9} {raw / len(compressed):>5.1f}x"
+                    f" {compress_s * 1000:>7.2f}ms {inflate_s * 1000:>6.2f}ms"
+                )
+                for mbit in LINKS_MBIT:
+                    raw_ms = transfer_seconds(raw, mbit) * 1000
+                    zlib_ms = (compress_s + transfer_seconds(len(compressed), mbit) + inflate_s) * 1000
+                    row += f" {raw_ms:>9.1f}/{zlib_ms:>7.1f}ms"
+                    if level == COMPRESSION_LEVEL:
+                        if zlib_ms >= raw_ms:
+                            break_even[(name, mbit)] = None
+                        elif break_even.get((name, mbit)) is None:
+                            break_even[(name, mbit)] = size
+                print(row)
+    print()
+    for mbit in LINKS_MBIT:
+        found = [
+            f"{name} from {break_even[(name, mbit)]} B" if break_even.get((name, mbit)) else f"{name} never"
+            for name in ["markdown", "tables"]
+        ]
+        print(f"{mbit:>4} Mbit/s: level {COMPRESSION_LEVEL} pays off for {', '.join(found)}")
+
+
+if __name__ == "__main__":
+    main()
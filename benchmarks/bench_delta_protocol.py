@@ -0,0 +1,56 @@
+"""Measure the bytes sent by st_streaming_markdown for long documents.
+
+Compares resending the full document on every token with the delta-append
+protocol (`delta_protocol=True`). Only the serialized component args are
+counted, which is what grows with the document.
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_delta_protocol.py
+"""
+import json
+import random
+
+from streamlit_markdown import TEST_MARKDOWN_TEXT
+from streamlit_markdown.streaming import DeltaEncoder
+
+
+def tokens(content, seed=0):
+    rng = random.Random(seed)
+    length = 0
+    while length < len(content):
+        n_chars = rng.randint(5, 15)
+        yield content[length : length + n_chars]
+        length += n_chars
+
+
+def full_resend_bytes(content):
+    total = 0
+    streamed = ""
+    for token in tokens(content):
+        streamed += token
+        total += len(json.dumps({"content": streamed}))
+    return total
+
+
+def delta_bytes(content, snapshot_every=50):
+    total = 0
+    streamed = ""
+    encoder = DeltaEncoder(snapshot_every)
+    for token in tokens(content):
+        streamed += token
+        total += len(json.dumps({"content": "", "stream": encoder.encode(streamed)}))
+    total += len(json.dumps({"content": "", "stream": encoder.encode(streamed, done=True)}))
+    return total
+
+
+def main():
+    print(f"{'doc size':>10} {'full resend':>14} {'delta':>12} {'ratio':>8}")
+    for size in [1_000, 5_000, 20_000, 100_000]:
+        content = (TEST_MARKDOWN_TEXT * (size // len(TEST_MARKDOWN_TEXT) + 1))[:size]
+        full = full_resend_bytes(content)
+        delta = delta_bytes(content)
+        print(f"{size:>10} {full:>14} {delta:>12} {full / delta:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
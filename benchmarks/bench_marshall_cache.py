@@ -0,0 +1,113 @@
+"""Measure the rerun cost of many unchanged st_hack_markdown components.
+
+First the args of one component are serialized as without the cache
+(dumps_args) and with it on a hit: args_hash, which `cached=True` needs
+anyway for the frontend's cache, and the lookup of the last run's string.
+The hash is taken of the same content object, as kept in session_state,
+and of a new copy, as read again from a file or database on every rerun.
+
+Then a page of N keyed components with the same content is rerun, once as
+plain components and once with `cached=True`. It reports the median time of
+a rerun and of the marshall_component calls in it. The test document is
+repeated 20 and 125 times, 16 KB and 100 KB. The serialization saved is
+small next to a rerun of 0.8 KB documents.
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_marshall_cache.py
+"""
+import statistics
+import time
+import timeit
+
+from streamlit.testing.v1 import AppTest
+
+import streamlit_markdown.st_hack as st_hack
+from streamlit_markdown import TEST_MARKDOWN_TEXT
+from streamlit_markdown.st_hack_common import args_hash, dumps_args, get_serializer, snapshot
+from streamlit_markdown.themes import GRAY_THEME
+
+APP = """
+from streamlit_markdown import TEST_MARKDOWN_TEXT, st_hack_markdown
+
+content = TEST_MARKDOWN_TEXT * {repeat}
+for i in range({n}):
+    st_hack_markdown(content, cached={cached}, key=f"message-{{i}}")
+"""
+
+
+marshall_seconds = 0.0
+marshall_component = st_hack.marshall_component
+
+
+def timed_marshall_component(*args, **kwargs):
+    global marshall_seconds
+    start = time.perf_counter()
+    try:
+        return marshall_component(*args, **kwargs)
+    finally:
+        marshall_seconds += time.perf_counter() - start
+
+
+st_hack.marshall_component = timed_marshall_component
+
+
+def median_rerun_ms(n, repeat, cached, reruns=20):
+    global marshall_seconds
+    at = AppTest.from_string(APP.format(n=n, repeat=repeat, cached=cached), default_timeout=60).run()
+    reruns_ms, marshall_ms = [], []
+    for _ in range(reruns):
+        marshall_seconds = 0.0
+        start = time.perf_counter()
+        at.run()
+        reruns_ms.append((time.perf_counter() - start) * 1000)
+        marshall_ms.append(marshall_seconds * 1000)
+    assert not at.exception, at.exception
+    return statistics.median(reruns_ms), statistics.median(marshall_ms)
+
+
+def best_us(function, number):
+    return min(timeit.repeat(function, number=number, repeat=5)) / number * 1e6
+
+
+def serialize_us(repeat):
+    content = TEST_MARKDOWN_TEXT * repeat
+    args = dict(content=content, richContent=True, theme_color="green", **GRAY_THEME.args(), default=None)
+    number = max(10, 20_000 // repeat)
+
+    def lookup():
+        # what _serialize_args compares besides the hash
+        return snapshot({"default": args["default"]})
+
+    def rehash_new_copy():
+        return args_hash({**args, "content": content[:1] + content[1:]})
+
+    def new_copy():
+        return {**args, "content": content[:1] + content[1:]}
+
+    dumps = best_us(lambda: dumps_args(args), number)
+    hit = best_us(lambda: args_hash(args), number) + best_us(lookup, number)
+    hit_new_copy = best_us(rehash_new_copy, number) - best_us(new_copy, number) + best_us(lookup, number)
+    return len(content.encode()) // 1000, dumps, hit, hit_new_copy
+
+
+def main():
+    print(f"serialize_args per component, {get_serializer().__name__}")
+    print(f"{'KB':>6} {'no cache':>10} {'hit':>9} {'hit, new str':>13}")
+    for repeat in [1, 20, 125, 1250]:
+        size, dumps, hit, hit_new_copy = serialize_us(repeat)
+        print(f"{size:>6} {dumps:>8.1f}us {hit:>7.1f}us {hit_new_copy:>11.1f}us")
+    print()
+    print(f"{'components':>10} {'repeat':>6} {'rerun':>20} {'marshall_component':>24}")
+    print(f"{'':>10} {'':>6} {'no cache':>10} {'cache':>9} {'no cache':>14} {'cache':>9}")
+    for repeat in [20, 125]:
+        for n in [30, 100, 300]:
+            uncached = median_rerun_ms(n, repeat, cached=False)
+            cached = median_rerun_ms(n, repeat, cached=True)
+            print(
+                f"{n:>10} {repeat:>6} {uncached[0]:>8.1f}ms {cached[0]:>7.1f}ms"
+                f" {uncached[1]:>12.1f}ms {cached[1]:>7.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Memory of streaming 1 MB documents, alone and in many concurrent sessions.
+
+The first part compares accumulating a stream with `str +=` to ContentBuffer.
+Tokens of a few characters are appended and the document is read at flush
+points, every `--flush-every` tokens, the way st_streaming_markdown does. A
+reference to every flushed document is kept until the next flush, like a
+render in flight. For delta updates only the new text is read between
+snapshots.
+
+The second part streams the document with st_streaming_markdown in
+`--sessions` AppTest sessions. AppTest runs one script per process at a time,
+so the sessions run one after the other but all stay alive. That is what
+concurrent sessions cost on top of a single stream: what each one keeps
+afterwards. It reports the memory still held once they are done, per
+session, and the peak traced for the whole process (tracemalloc).
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_memory.py [--size 1000000] [--sessions 1 4 16]
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+from streamlit.testing.v1 import AppTest
+
+from streamlit_markdown.streaming import ContentBuffer, DeltaEncoder
+
+
+class StrAccumulator:
+    """The `content += token` accumulation ContentBuffer replaces"""
+
+    def __init__(self):
+        self.content = ""
+
+    def append(self, text):
+        self.content += text
+
+    def getvalue(self):
+        return self.content
+
+    def since(self, offset):
+        return self.content[offset:]
+
+    def __len__(self):
+        return len(self.content)
+
+
+def synthetic_tokens(size, mean_chars, seed=0):
+    rng = random.Random(seed)
+    alphabet = "abcdefghijklmnopqrstuvwxyz     \n"
+    length = 0
+    while length < size:
+        token = "".join(rng.choices(alphabet, k=rng.randint(1, 2 * mean_chars - 1)))
+        length += len(token)
+        yield token
+
+
+def accumulate(make, tokens, flush_every, delta):
+    encoder = DeltaEncoder() if delta else None
+    buffer = make()
+    # held like the args of a render, so `str +=` can't extend the string in place
+    in_flight = None
+    for index, token in enumerate(tokens):
+        buffer.append(token)
+        if index % flush_every == 0:
+            in_flight = encoder.encode(buffer) if encoder else buffer.getvalue()
+    return encoder.encode(buffer, done=True) if encoder else buffer.getvalue()
+
+
+def compare_accumulators(size, mean_chars, flush_every):
+    tokens = list(synthetic_tokens(size, mean_chars))
+    print(f"{len(tokens)} tokens, flushed every {flush_every}")
+    print(f"{'accumulator':<14} {'mode':<9} {'ms':>9} {'peak KiB':>9}")
+    for name, make in [("str +=", StrAccumulator), ("ContentBuffer", ContentBuffer)]:
+        for delta in [False, True]:
+            start = time.perf_counter()
+            accumulate(make, tokens, flush_every, delta)
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            accumulate(make, tokens, flush_every, delta)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            mode = "delta" if delta else "full"
+            print(f"{name:<14} {mode:<9} {elapsed * 1000:>9.1f} {peak // 1024:>9}")
+
+
+def app(size, mean_chars, delta_protocol):
+    # runs as a Streamlit script, so it only uses what it imports itself
+    import random
+
+    import streamlit as st
+    from streamlit_markdown import st_streaming_markdown
+
+    def token_stream():
+        rng = random.Random(0)
+        alphabet = "abcdefghijklmnopqrstuvwxyz     \n"
+        length = 0
+        while length < size:
+            token = "".join(rng.choices(alphabet, k=rng.randint(1, 2 * mean_chars - 1)))
+            length += len(token)
+            yield token
+
+    content = st_streaming_markdown(token_stream(), key="bench", delta_protocol=delta_protocol)
+    st.session_state["bench_result"] = len(content)
+
+
+def run_sessions(n_sessions, size, mean_chars, delta_protocol):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sessions = []
+    for _ in range(n_sessions):
+        at = AppTest.from_function(
+            app,
+            default_timeout=600,
+            kwargs={"size": size, "mean_chars": mean_chars, "delta_protocol": delta_protocol},
+        )
+        at.run()
+        assert not at.exception, at.exception
+        assert at.session_state["bench_result"] >= size
+        # keep the session alive, with everything it holds on to
+        sessions.append(at)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, held, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000)
+    parser.add_argument("--mean-chars", type=int, default=4, help="mean token length")
+    parser.add_argument("--flush-every", type=int, default=64, help="tokens per flush in the accumulator comparison")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    compare_accumulators(args.size, args.mean_chars, args.flush_every)
+    print()
+    # the first run pays for imports and the component registration
+    run_sessions(1, 1_000, args.mean_chars, False)
+    print(f"{'sessions':>8} {'mode':<6} {'s/session':>10} {'held MiB':>9} {'MiB/session':>12} {'peak MiB':>9}")
+    for n_sessions in args.sessions:
+        for delta_protocol in [False, True]:
+            elapsed, held, peak = run_sessions(n_sessions, args.size, args.mean_chars, delta_protocol)
+            mode = "delta" if delta_protocol else "full"
+            print(
+                f"{n_sessions:>8} {mode:<6} {elapsed / n_sessions:>10.1f} {held / 2**20:>9.1f}"
+                f" {held / 2**20 / n_sessions:>12.1f} {peak / 2**20:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
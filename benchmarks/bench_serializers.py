@@ -0,0 +1,59 @@
+"""Compare the component args serializers on 1 KB - 1 MB documents.
+
+Each installed backend (json, orjson, msgspec) serializes the args of a
+st_hack_markdown call, its output is checked to parse to the same value as
+the json backend's, and the median time per call is reported. `json.dumps` with
+its default settings, what was used before, is listed for reference.
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_serializers.py
+"""
+import json
+import timeit
+
+from streamlit_markdown import TEST_MARKDOWN_TEXT
+from streamlit_markdown.st_hack_common import SERIALIZERS
+from streamlit_markdown.themes import GRAY_THEME
+
+
+def component_args(size):
+    content = (TEST_MARKDOWN_TEXT * (size // len(TEST_MARKDOWN_TEXT) + 1))[:size]
+    args = {
+        "content": content,
+        "richContent": True,
+        "theme_color": "green",
+        "mermaid_theme": "forest",
+        "mermaid_theme_CSS": "",
+        "incremental": False,
+        "mermaid_cache_size": 64,
+        "virtualized": False,
+        "virtual_height": 600,
+        "worker": False,
+    }
+    args.update(GRAY_THEME.args(raw=False))
+    args.update(default=None, key="bench")
+    return args
+
+
+def median_us(serializer, args):
+    number = max(1, 20_000_000 // len(args["content"]) // 100)
+    timings = timeit.repeat(lambda: serializer(args), number=number, repeat=5)
+    return sorted(timings)[2] / number * 1e6
+
+
+def main():
+    backends = {"json.dumps (before)": json.dumps, **SERIALIZERS}
+    print(f"{'size':>8}" + "".join(f"{name:>22}" for name in backends))
+    for size in [1_000, 10_000, 100_000, 1_000_000]:
+        args = component_args(size)
+        expected = json.loads(SERIALIZERS["json"](args))
+        for name, serializer in SERIALIZERS.items():
+            assert json.loads(serializer(args)) == expected, f"{name} output differs from json"
+        row = f"{size:>8}"
+        for serializer in backends.values():
+            row += f"{median_us(serializer, args):>20.1f}us"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
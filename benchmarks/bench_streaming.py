@@ -0,0 +1,207 @@
+"""Headless benchmark of the Python render path, with stored baselines.
+
+Drives st_markdown, st_hack_markdown and st_streaming_markdown through
+Streamlit's AppTest harness on 1 KB - 1 MB documents. Streams are synthetic
+token streams like `simulated_token_stream` without the sleeps, split into a
+fixed number of tokens so that every size runs in reasonable time.
+
+For every scenario and size it records:
+    us_per_token  Python time per token (per call for static content)
+    messages      ForwardMsgs emitted by the script
+    bytes         total size of these ForwardMsgs
+    peak_kib      peak memory allocated while rendering (tracemalloc)
+
+The delta_protocol scenario is measured as sent to a frontend build that
+reads deltas, whichever build is committed.
+
+Timing, message counting and memory tracing run in separate passes so they
+don't skew each other. Results are compared with benchmarks/baselines/
+streaming.json, and the script exits with 1 on a regression. Timings depend
+on the machine, rerun with --save on the machine that checks them.
+
+usage:
+    PYTHONPATH=. python benchmarks/bench_streaming.py [--sizes 1000 10000] [--save]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+# re-exported by every Streamlit with AppTest, wherever the module defining it lives
+from streamlit.runtime.scriptrunner import ScriptRunContext
+from streamlit.testing.v1 import AppTest
+
+BASELINES = Path(__file__).resolve().parent / "baselines" / "streaming.json"
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+N_TOKENS = 200
+# the timing pass is repeated and its fastest run kept, a single static call is noisy
+TIMING_RUNS = 3
+
+# allowed relative increase before a metric counts as a regression
+TOLERANCES = {"us_per_token": 0.5, "messages": 0.05, "bytes": 0.05, "peak_kib": 0.25}
+
+SCENARIOS = {
+    "st_markdown": {"function": "st_markdown", "kwargs": {}},
+    "st_hack_markdown": {"function": "st_hack_markdown", "kwargs": {}},
+    "st_streaming_markdown": {
+        "function": "st_streaming_markdown",
+        "kwargs": {"flush_interval_ms": 0},
+    },
+    "st_streaming_markdown_delta": {
+        "function": "st_streaming_markdown",
+        "kwargs": {"flush_interval_ms": 0, "delta_protocol": True},
+        # measured as with a frontend build that reads deltas, the committed one may predate them
+        "features": ["stream"],
+    },
+}
+
+
+def app(function, size, n_tokens, kwargs, features, trace_memory):
+    # runs as a Streamlit script, so it only uses what it imports itself
+    import random
+    import time
+    import tracemalloc
+
+    import streamlit as st
+    import streamlit_markdown
+    import streamlit_markdown.frontend_features
+    from streamlit_markdown import TEST_MARKDOWN_TEXT
+
+    content = (TEST_MARKDOWN_TEXT * (size // len(TEST_MARKDOWN_TEXT) + 1))[:size]
+
+    def synthetic_token_stream():
+        rng = random.Random(0)
+        mean = max(1, size // n_tokens)
+        length = 0
+        while length < len(content):
+            n_chars = rng.randint(mean // 2 + 1, mean + mean // 2 + 1)
+            yield content[length : length + n_chars]
+            length += n_chars
+
+    render = getattr(streamlit_markdown, function)
+    served_features = streamlit_markdown.frontend_features._features
+    if features is not None:
+        streamlit_markdown.frontend_features._features = frozenset(features)
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        if function == "st_streaming_markdown":
+            tokens = list(synthetic_token_stream())
+            render((token for token in tokens), key="bench", **kwargs)
+        else:
+            tokens = [content]
+            render(content, key="bench", **kwargs)
+        elapsed = time.perf_counter() - start
+    finally:
+        streamlit_markdown.frontend_features._features = served_features
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    st.session_state["bench_result"] = {"seconds": elapsed, "tokens": len(tokens), "peak": peak}
+
+
+class MessageCounter:
+    """Counts the ForwardMsgs enqueued by the script thread, before any coalescing"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    def __enter__(self):
+        self.enqueue = ScriptRunContext.enqueue
+        counter = self
+
+        def enqueue(ctx, msg):
+            counter.messages += 1
+            counter.bytes += msg.ByteSize()
+            return counter.enqueue(ctx, msg)
+
+        ScriptRunContext.enqueue = enqueue
+        return self
+
+    def __exit__(self, *exc_info):
+        ScriptRunContext.enqueue = self.enqueue
+
+
+def run(scenario, size, trace_memory=False):
+    at = AppTest.from_function(
+        app,
+        default_timeout=600,
+        kwargs={
+            "function": scenario["function"],
+            "size": size,
+            "n_tokens": N_TOKENS,
+            "kwargs": scenario["kwargs"],
+            "features": scenario.get("features"),
+            "trace_memory": trace_memory,
+        },
+    )
+    at.run()
+    assert not at.exception, at.exception
+    return at.session_state["bench_result"]
+
+
+def measure(scenario, size):
+    timing = min((run(scenario, size) for _ in range(TIMING_RUNS)), key=lambda result: result["seconds"])
+    with MessageCounter() as counter:
+        run(scenario, size)
+    memory = run(scenario, size, trace_memory=True)
+    return {
+        "us_per_token": round(timing["seconds"] / timing["tokens"] * 1e6, 1),
+        "messages": counter.messages,
+        "bytes": counter.bytes,
+        "peak_kib": round(memory["peak"] / 1024),
+    }
+
+
+def regressions(results, baselines):
+    for name, sizes in results.items():
+        for size, metrics in sizes.items():
+            baseline = baselines.get(name, {}).get(size)
+            if baseline is None:
+                continue
+            for metric, value in metrics.items():
+                limit = baseline[metric] * (1 + TOLERANCES[metric])
+                if value > limit:
+                    yield f"{name} {size}: {metric} {value} > {baseline[metric]} (+{TOLERANCES[metric]:.0%})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--save", action="store_true", help="store the results as the new baselines")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'scenario':<30} {'size':>8} {'us/token':>10} {'messages':>9} {'bytes':>12} {'peak KiB':>9}")
+    for name in args.scenarios:
+        # the first run pays for imports and the component registration
+        run(SCENARIOS[name], 1_000)
+        for size in args.sizes:
+            metrics = measure(SCENARIOS[name], size)
+            results.setdefault(name, {})[str(size)] = metrics
+            print(
+                f"{name:<30} {size:>8} {metrics['us_per_token']:>10} {metrics['messages']:>9}"
+                f" {metrics['bytes']:>12} {metrics['peak_kib']:>9}"
+            )
+
+    baselines = json.loads(BASELINES.read_text()) if BASELINES.exists() else {}
+    if args.save:
+        for name, sizes in results.items():
+            baselines.setdefault(name, {}).update(sizes)
+        BASELINES.parent.mkdir(exist_ok=True)
+        BASELINES.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"saved baselines to {BASELINES}")
+        return
+    failures = list(regressions(results, baselines))
+    for failure in failures:
+        print("REGRESSION", failure)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Report the size of the frontend bundle and its time to first paint.
+
+The initial payload is what index.html loads before the first render, the
+lazy chunks (mermaid, latex.js, KaTeX, highlight.js, ...) are only fetched
+when a document needs them. Sizes are reported raw and gzipped.
+
+With playwright installed (`pip install playwright && playwright install
+chromium`) the first contentful paint of the built page is measured too.
+
+usage:
+    cd streamlit_markdown/frontend && yarn run build && cd -
+    python benchmarks/bundle_report.py
+"""
+import functools
+import gzip
+import http.server
+import re
+import threading
+from pathlib import Path
+
+FRONTEND_OUT = Path(__file__).resolve().parent.parent / "streamlit_markdown" / "frontend" / "out"
+BASE_PATH = "/component/streamlit_markdown.streamlit_markdown"
+
+
+def sizes(path):
+    data = path.read_bytes()
+    return len(data), len(gzip.compress(data))
+
+
+def initial_assets(index_html):
+    links = re.findall(r'(?:src|href)="([^"]+\.(?:js|css))"', index_html)
+    return {FRONTEND_OUT / link[len(BASE_PATH) + 1 :] for link in links if link.startswith(BASE_PATH)}
+
+
+def print_table(title, rows):
+    raw = sum(row[1] for row in rows)
+    gz = sum(row[2] for row in rows)
+    print(f"{title}: {len(rows)} files, {raw / 1024:.0f} KiB, {gz / 1024:.0f} KiB gzipped")
+    for name, size, gz_size in sorted(rows, key=lambda row: -row[1])[:10]:
+        print(f"  {name:<50} {size / 1024:>8.0f} KiB {gz_size / 1024:>8.0f} KiB")
+
+
+def first_contentful_paint(runs=5):
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        return None
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def translate_path(self, path):
+            if path.startswith(BASE_PATH):
+                path = path[len(BASE_PATH) :]
+            return super().translate_path(path)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(
+        ("127.0.0.1", 0), functools.partial(Handler, directory=str(FRONTEND_OUT))
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}{BASE_PATH}/index.html"
+    timings = []
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch()
+            for _ in range(runs):
+                page = browser.new_page()
+                page.goto(url, wait_until="load")
+                timings.append(
+                    page.evaluate(
+                        "new Promise((resolve) => new PerformanceObserver((list) => resolve("
+                        "list.getEntriesByName('first-contentful-paint')[0].startTime"
+                        ")).observe({ type: 'paint', buffered: true }))"
+                    )
+                )
+                page.close()
+            browser.close()
+    finally:
+        server.shutdown()
+    return sorted(timings)[len(timings) // 2]
+
+
+def main():
+    index = FRONTEND_OUT / "index.html"
+    if not index.exists():
+        raise SystemExit(f"{index} not found, build the frontend first")
+    initial = initial_assets(index.read_text())
+    static = FRONTEND_OUT / "_next" / "static"
+    rows = {"initial": [], "lazy": [], "media": []}
+    for path in static.rglob("*"):
+        if not path.is_file():
+            continue
+        if path in initial:
+            group = "initial"
+        elif path.suffix in (".js", ".css"):
+            group = "lazy"
+        else:
+            group = "media"
+        rows[group].append((str(path.relative_to(static)), *sizes(path)))
+    print_table("initial payload", rows["initial"])
+    print_table("lazy chunks", rows["lazy"])
+    print_table("fonts and media (fetched by the CSS that uses them)", rows["media"])
+    fcp = first_contentful_paint()
+    if fcp is None:
+        print("first contentful paint: install playwright to measure it")
+    else:
+        print(f"first contentful paint: {fcp:.0f} ms (median of 5 loads)")
+
+
+if __name__ == "__main__":
+    main()
@@ -95,6 +95,7 @@ with right:
             custom_color=custom_color,
             custom_css=custom_css,
             key="streaming_from_server",
+            background=True,
         )
     if streaming == "streaming content":
         token_stream = simulated_token_stream(content)
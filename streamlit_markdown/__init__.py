@@ -1,11 +1,30 @@
 import os
 import inspect
 import time
-from typing import Literal, Any, Callable, Generator, Literal, Optional, Union, TypedDict
+from typing import Literal, Any, AsyncIterator, Callable, Generator, List, Literal, Optional, Union, TypedDict
 
 import streamlit as st
 from streamlit import _main
 from streamlit_markdown.st_hack import st_hack_component
+from streamlit_markdown.st_hack_common import args_hash
+from streamlit_markdown.math_prerender import MathRenderer, prerender_math as _prerender_math
+from streamlit_markdown.themes import ThemePreset, get_theme, register_theme
+from streamlit_markdown.compression import content_args
+from streamlit_markdown.frontend_features import frontend_supports, use_frontend_source
+from streamlit_markdown.metrics import MarkdownMetrics, MetricsCallback, get_markdown_metrics, instrumented, record_frontend_metrics
+from streamlit_markdown.streaming import (
+    ContentBuffer,
+    DeltaEncoder,
+    TokenCoalescer,
+    ThreadedTokenProducer,
+    AsyncTokenProducer,
+    SharedStream,
+    shared_stream,
+    shared_streams,
+    resumable_stream,
+    forget_resumable_stream,
+    discard_resumable_stream,
+)
 
 import streamlit.components.v1 as components
 
@@ -28,6 +47,7 @@ else:
         COMPONENT_NAME,
         url="http://localhost:35335",
     )
+    use_frontend_source()
 
 GLOBAL_THEME_COLOR = Literal["blue", "orange", "green", "red", "purple", "pink", "indigo", "yellow", "teal", "cyan", "gray", "slate", "dark", "light", "null", "custom"]
 MERMAID_THEME = Literal["default", "forest", "dark", "neutral", "base"]
@@ -61,6 +81,16 @@ class CUSTOM_CSS(TypedDict):
     th_class: str = ""
     td_class: str = ""
     blockquote_class: str = ""
+class MESSAGE(TypedDict, total=False):
+    content: str
+    richContent: bool
+    theme_color: GLOBAL_THEME_COLOR
+    mermaid_theme: MERMAID_THEME
+    mermaid_theme_CSS: str
+    custom_color: CUSTOM_COLOR
+    custom_css: CUSTOM_CSS
+    incremental: bool
+    worker: bool
 
 def st_markdown(
     content: str,
@@ -72,6 +102,20 @@ def st_markdown(
     custom_css: Optional[CUSTOM_CSS] = None,
     key=None,
     default: Any = None,
+    *,
+    incremental: bool = False,
+    mermaid_cache_size: int = 64,
+    prerender_math: bool = False,
+    math_renderer: Optional[MathRenderer] = None,
+    virtualized: bool = False,
+    virtual_height: int = 600,
+    worker: bool = False,
+    shared_cache: bool = False,
+    compress_threshold: Optional[int] = None,
+    cached: bool = False,
+    theme: Union[str, ThemePreset] = "default",
+    instrument: bool = False,
+    on_metrics: Optional[MetricsCallback] = None,
     **kwargs,
 ):
     """
@@ -90,62 +134,112 @@ def st_markdown(
     mermaid_theme_CSS: Optional[str]
         The CSS string to style the mermaid diagram. If set, mermaid_theme will be ignored
     custom_color: Optional[dict]
-        Custom color for the component
+        Custom color for the component, overrides the classes of the theme preset
     custom_css: Optional[dict]
-        Custom CSS for the component
+        Custom CSS for the component, overrides the classes of the theme preset
     key: Optional[str]
         An optional key that makes the component unique
+    default: Any
+        The value returned before the frontend sends one
+
+    The options below are keyword-only.
+
+    incremental: bool
+        Parse the document block by block and only re-parse blocks that changed.
+        Finished blocks are memoized, which keeps streaming updates cheap for long
+        documents. Footnotes and reference links spanning blocks are not resolved.
+    mermaid_cache_size: int
+        How many rendered mermaid diagrams the browser tab keeps, keyed by diagram
+        source and mermaid theme. The cache lives in sessionStorage and survives
+        reruns and component remounts. 0 disables it
+    prerender_math: bool
+        Render the `$...$` and `$$...$$` formulas in Python, once per formula in a
+        bounded process-wide cache, and send the HTML to the frontend instead of
+        typesetting them with KaTeX in the browser. Formulas that could not be
+        prerendered fall back to KaTeX. Needs `pip install latex2mathml` or a
+        math_renderer
+    math_renderer: Optional[Callable[[str, bool], str]]
+        Renders (formula, display) to HTML for prerender_math. Defaults to
+        MathML through latex2mathml
+    virtualized: bool
+        Render the document in a scroll area of `virtual_height` pixels and only
+        mount the blocks near the visible part of it. Use it for very long
+        documents, it implies incremental
+    virtual_height: int
+        The height in pixels of the virtualized scroll area
+    worker: bool
+        Parse, typeset math and highlight code in a Web Worker, so large
+        documents don't block scrolling and input in the component. Only the
+        conversion of the parsed tree to React runs on the main thread
+    shared_cache: bool
+        Share rendered mermaid diagrams, highlighted code and typeset math with
+        the other components of the browser tab that enable it too, over a
+        BroadcastChannel. A diagram or snippet repeated across messages is
+        rendered once per tab instead of once per component
+    compress_threshold: Optional[int]
+        Send content over this many UTF-8 bytes zlib-compressed, as a binary
+        arg, and inflate it in the browser. Worth it for long reports to
+        remote users on slow links, see benchmarks/bench_compression.py to pick
+        the threshold. None sends the content as is
+    cached: bool
+        For static documents shown on every rerun, e.g. a chat history. The
+        args are serialized once and reused while their hash doesn't change
+        (they are still sent on every run), and the frontend keeps the parsed
+        document by a hash of the content and options, so a remounted
+        component only converts it to React. Needs a key
+    theme: Union[str, ThemePreset]
+        The theme preset, by name or as returned by register_theme. The
+        custom_color and custom_css classes given here override those of the preset
+    instrument: bool
+        Record the time spent marshalling and serializing the args and their
+        size on every call, and have the frontend report how long parsing,
+        KaTeX, highlight.js, mermaid and the React commit took, plus the
+        frame height updates. Query them with get_markdown_metrics(key).
+        Needs a key. A frontend report reruns the script, like a widget change
+    on_metrics: Optional[Callable[[MarkdownMetrics], None]]
+        With instrument, called with the metrics after every call and every
+        new frontend report
 
     Returns: current text that already rendered to markdown
     """
     if not mermaid_theme_CSS:
         mermaid_theme_CSS = ""
-    if not custom_color:
-        custom_color = {
-            "bg": "bg-gray-100",
-            "border": "border-gray-300",
-            "text": "text-green-900",
-            "hover_bg": "hover:bg-gray-200",
-            "hover_text": "hover:text-gray-900",
-        }
-    if not custom_css:
-        custom_css = {
-            "a_class": "",
-            "h1_class": "",
-            "h2_class": "",
-            "h3_class": "",
-            "h4_class": "",
-            "h5_class": "",
-            "h6_class": "",
-            "p_class": "",
-            "strong_class": "",
-            "em_class": "",
-            "code_class": "",
-            "code_button_class": "",
-            "code_latex_class": "",
-            "code_mermaid_class": "",
-            "pre_class": "",
-            "ul_class": "",
-            "ol_class": "",
-            "li_class": "",
-            "table_class": "",
-            "thead_class": "",
-            "th_class": "",
-            "td_class": "",
-            "blockquote_class": "",
-        }
-    return _markdown(
+    if prerender_math:
+        kwargs["prerendered_math"] = _prerender_math(content, math_renderer)
+    kwargs.update(get_theme(theme).args(custom_color, custom_css, raw=False))
+    args = dict(
         theme_color=theme_color,
-        content=content,
         richContent=richContent,
         mermaid_theme=mermaid_theme,
         mermaid_theme_CSS=mermaid_theme_CSS,
-        custom_color=custom_color,
-        custom_css=custom_css,
-        key=key,
-        default=default,
+        incremental=incremental,
+        mermaid_cache_size=mermaid_cache_size,
+        virtualized=virtualized,
+        virtual_height=virtual_height,
+        worker=worker,
+        shared_cache=shared_cache,
+        **content_args(content, compress_threshold),
         **kwargs,
     )
+    if instrument:
+        assert key is not None, "key must be provided to instrument the component"
+        args["instrument"] = True
+    if cached:
+        assert key is not None, "key must be provided to cache the component"
+        args["content_hash"] = args_hash(args)
+
+    def component():
+        if cached:
+            # st_hack serializes the args once and reuses them while the hash doesn't change
+            return st_hack_component(_main, _markdown, key, default, **args)
+        return _markdown(key=key, default=default, **args)
+
+    if not instrument:
+        return component()
+    with instrumented(key, args, on_metrics, binary_bytes=len(args.get("content_zlib", b""))):
+        value = component()
+    # the frontend reports through the component value, it is not a return value
+    return default if record_frontend_metrics(key, value, on_metrics) else value
 
 
 def st_hack_markdown(
@@ -158,6 +252,20 @@ def st_hack_markdown(
     custom_css: Optional[CUSTOM_CSS] = None,
     key=None,
     default: Any = None,
+    *,
+    incremental: bool = False,
+    mermaid_cache_size: int = 64,
+    prerender_math: bool = False,
+    math_renderer: Optional[MathRenderer] = None,
+    virtualized: bool = False,
+    virtual_height: int = 600,
+    worker: bool = False,
+    shared_cache: bool = False,
+    compress_threshold: Optional[int] = None,
+    theme: Union[str, ThemePreset] = "gray",
+    cached: bool = False,
+    instrument: bool = False,
+    on_metrics: Optional[MetricsCallback] = None,
     **kwargs,
 ):
     """hack streamlt to prevent re-rendering or throw DuplicateWidgetID
@@ -168,52 +276,39 @@ def st_hack_markdown(
 
     if not mermaid_theme_CSS:
         mermaid_theme_CSS = ""
-    if not custom_color:
-        custom_color = {
-            "bg": "bg-gray-100",
-            "border": "border-gray-300",
-            "text": "text-gray-900",
-            "hover_bg": "hover:bg-gray-200",
-            "hover_text": "hover:text-gray-900",
-        }
-    if not custom_css:
-        custom_css = {
-            "a_class": "",
-            "h1_class": "",
-            "h2_class": "",
-            "h3_class": "",
-            "h4_class": "",
-            "h5_class": "",
-            "h6_class": "",
-            "p_class": "",
-            "strong_class": "",
-            "em_class": "",
-            "code_class": "",
-            "code_button_class": "",
-            "code_latex_class": "",
-            "code_mermaid_class": "",
-            "pre_class": "",
-            "ul_class": "",
-            "ol_class": "",
-            "li_class": "",
-            "table_class": "",
-            "thead_class": "",
-            "th_class": "",
-            "td_class": "",
-            "blockquote_class": "",
-        }
-    kwargs["content"] = content
+    kwargs.update(content_args(content, compress_threshold))
     kwargs["richContent"] = richContent
     kwargs["theme_color"] = theme_color
     kwargs["mermaid_theme"] = mermaid_theme
     kwargs["mermaid_theme_CSS"] = mermaid_theme_CSS
-    kwargs["custom_color"] = custom_color
-    kwargs["custom_css"] = custom_css
-    return st_hack_component(_main, _markdown, key, default, **kwargs)
+    kwargs.update(get_theme(theme).args(custom_color, custom_css))
+    kwargs["incremental"] = incremental
+    kwargs["mermaid_cache_size"] = mermaid_cache_size
+    kwargs["virtualized"] = virtualized
+    kwargs["virtual_height"] = virtual_height
+    kwargs["worker"] = worker
+    kwargs["shared_cache"] = shared_cache
+    if prerender_math:
+        kwargs["prerendered_math"] = _prerender_math(content, math_renderer)
+    if instrument:
+        assert key is not None, "key must be provided to instrument the component"
+        kwargs["instrument"] = True
+    if cached:
+        assert key is not None, "key must be provided to cache the component"
+        kwargs["content_hash"] = args_hash(kwargs)
+    if not instrument:
+        return st_hack_component(_main, _markdown, key, default, **kwargs)
+    with instrumented(key, on_metrics=on_metrics, binary_bytes=len(kwargs.get("content_zlib", b""))):
+        value = st_hack_component(_main, _markdown, key, default, **kwargs)
+    return default if record_frontend_metrics(key, value, on_metrics) else value
+
+
+DEFAULT_FLUSH_INTERVAL_MS = 16
+"""Flush interval of streams pulled in the background, about one frame."""
 
 
 def st_streaming_markdown(
-    token_stream: Union[Generator[str, str, str], Callable[[], str], str],
+    token_stream: Union[Generator[str, str, str], AsyncIterator[str], Callable[[], str], SharedStream, str],
     richContent: bool = True,
     theme_color: GLOBAL_THEME_COLOR = "green",
     mermaid_theme: MERMAID_THEME = "forest",
@@ -222,18 +317,71 @@ def st_streaming_markdown(
     custom_css: Optional[CUSTOM_CSS] = None,
     key=None,
     default: Any = None,
+    *,
+    delta_protocol: bool = False,
+    snapshot_every: int = 50,
+    flush_interval_ms: Optional[float] = None,
+    min_chars: int = 0,
+    max_latency_ms: Optional[float] = 100,
+    background: bool = False,
+    queue_size: int = 256,
+    resumable: bool = False,
     **kwargs,
 ):
+    """Render a stream of markdown tokens into a single component
+
+    Args:
+        token_stream: a generator or async iterator of tokens, a callable returning one, or a plain string.
+            Async iterators are driven by a shared event loop thread. A SharedStream,
+            see `shared_stream`, is replayed from its start and then followed live.
+        delta_protocol: send only the text appended since the last snapshot on each
+            update instead of the whole document. The frontend rebuilds the content from the pieces.
+            Ignored when the frontend build predates it, see frontend_features.
+            Can't be combined with prerender_math
+        snapshot_every: with delta_protocol, send a full snapshot every
+            `snapshot_every` updates so a remounted component can resync
+        flush_interval_ms: rerender at most once per `flush_interval_ms`,
+            tokens arriving in between are batched. 0 rerenders on every token.
+            None is 16 when the tokens are pulled in the background (async
+            iterators, SharedStream, background=True) and 0 otherwise: a
+            generator read in the script thread can't be flushed while it
+            blocks, so a held token would wait for the next one
+        min_chars: wait until at least `min_chars` characters are pending before rerendering
+        max_latency_ms: rerender anyway once a token has waited `max_latency_ms`,
+            regardless of `min_chars`. None disables it
+        background: pull tokens from the generator in a worker thread, so a
+            stalled generator doesn't block the script thread. The stream is
+            cancelled when the session reruns or disconnects. Async iterators
+            are always pulled in the background
+        queue_size: with background, how many tokens the producer may read ahead
+        resumable: keep the stream going when the script reruns. The stream is
+            produced in the background and kept in the session under `key`, a
+            rerun shows what arrived so far at once and follows the rest,
+            without calling the generator again. token_stream must then be a
+            callable returning the stream. Once a run has shown the whole stream
+            it is forgotten, and the next run starts a new one.
+            `discard_resumable_stream(key)` starts over before that
+        others: same as st_markdown, except instrument
+
+    Returns: the full streamed content
+    """
     assert key is not None, "key must be provided to prevent re-rendering"
+    if delta_protocol and kwargs.get("prerender_math"):
+        # the deltas are sent instead of the content the math is taken from
+        raise ValueError("prerender_math can't be used with delta_protocol")
+    if kwargs.get("instrument"):
+        # the frontend reports through the component value, which reruns the script mid-stream
+        raise ValueError("instrument can't be used with st_streaming_markdown, instrument the final st_markdown instead")
     placeholder = st.empty()
-    # Order matters!
-    if callable(token_stream):
-        token_stream = token_stream()
-    if isinstance(token_stream, str):
+
+    def render(content: str, stream: Optional[dict] = None):
+        if stream is not None:
+            kwargs["stream"] = stream
+            content = ""
         placeholder.empty()
         with placeholder.container():
             st_hack_markdown(
-                token_stream,
+                content,
                 richContent,
                 theme_color,
                 mermaid_theme,
@@ -244,39 +392,140 @@ def st_streaming_markdown(
                 default=default,
                 **kwargs,
             )
+
+    resumed = None
+    if resumable and not isinstance(token_stream, (str, SharedStream)):
+        resumed = token_stream = resumable_stream(key, token_stream)
+    # Order matters!
+    if callable(token_stream):
+        token_stream = token_stream()
+    if isinstance(token_stream, str):
+        render(token_stream)
         return token_stream
-    elif inspect.isgenerator(token_stream):
-        content = ""
-        for token in token_stream:
-            if isinstance(token, str):
-                content += token
-            elif callable(token):
-                content += token()
-            else:
-                raise TypeError(
-                    f"token must be str or callable[() -> str], not {type(token)}"
-                )
-            placeholder.empty()
-            with placeholder.container():
-                st_hack_markdown(
-                    content,
-                    richContent,
-                    theme_color,
-                    mermaid_theme,
-                    mermaid_theme_CSS,
-                    custom_color,
-                    custom_css,
-                    key=key,
-                    default=default,
-                    **kwargs,
-                )
-        return content
+    elif (
+        inspect.isgenerator(token_stream)
+        or hasattr(token_stream, "__aiter__")
+        or isinstance(token_stream, SharedStream)
+    ):
+        # a frontend that can't rebuild the content from deltas gets the whole document
+        encoder = DeltaEncoder(snapshot_every) if delta_protocol and frontend_supports("stream") else None
+        producer = None
+        tokens = token_stream
+        if isinstance(token_stream, SharedStream):
+            producer = token_stream.reader()
+        elif hasattr(token_stream, "__aiter__"):
+            producer = AsyncTokenProducer(token_stream, queue_size).start()
+        elif background:
+            producer = ThreadedTokenProducer(token_stream, queue_size).start()
+        if flush_interval_ms is None:
+            flush_interval_ms = DEFAULT_FLUSH_INTERVAL_MS if producer else 0
+        coalescer = TokenCoalescer(flush_interval_ms, min_chars, max_latency_ms)
+        if producer:
+            tokens = producer.tokens(coalescer.deadline)
+        content = ContentBuffer()
+        try:
+            for token in tokens:
+                if callable(token):
+                    token = token()
+                if not isinstance(token, str):
+                    raise TypeError(
+                        f"token must be str or callable[() -> str], not {type(token)}"
+                    )
+                if token:
+                    content.append(token)
+                    due = coalescer.push(len(token))
+                else:
+                    due = coalescer.due()
+                if due:
+                    if encoder:
+                        render("", encoder.encode(content))
+                    else:
+                        render(content.getvalue())
+                    coalescer.flushed()
+        finally:
+            if producer:
+                producer.cancel()
+        if encoder:
+            # always finish with a full snapshot, it is what a remounted
+            # iframe sees once the script has ended
+            render("", encoder.encode(content, done=True))
+        elif coalescer.pending:
+            render(content.getvalue())
+        if resumed is not None and resumed.done and resumed.error is None and len(content) == len(resumed.buffer):
+            # shown to completion, a rerun with this key starts a new generation
+            forget_resumable_stream(key, resumed)
+        return content.getvalue()
     else:
         raise TypeError(
-            f"token_stream must be generator or callable, not {type(token_stream)}"
+            f"token_stream must be generator, async iterator, SharedStream or callable, not {type(token_stream)}"
         )
 
 
+def st_markdown_batch(
+    messages: List[Union[str, MESSAGE]],
+    richContent: bool = True,
+    theme_color: GLOBAL_THEME_COLOR = "green",
+    mermaid_theme: MERMAID_THEME = "forest",
+    mermaid_theme_CSS: Optional[str] = None,
+    custom_color: Optional[CUSTOM_COLOR] = None,
+    custom_css: Optional[CUSTOM_CSS] = None,
+    key=None,
+    default: Any = None,
+    **kwargs,
+):
+    """Render many markdown documents, e.g. a whole chat history, in one component
+
+    A single iframe loads the frontend and initializes mermaid, KaTeX and
+    highlight.js once for all the messages, instead of once per st_markdown.
+
+    Args:
+        messages: the documents to render, in order. Each one is either the
+            markdown content, or a dict with "content" and any of the theme
+            options (richContent, theme_color, mermaid_theme, mermaid_theme_CSS,
+            custom_color, custom_css, incremental, worker) to override for that message
+        others: same as st_markdown, used for messages that don't override them
+
+    When the frontend build predates batches, see frontend_features, the
+    messages are joined into one document and their overrides are ignored.
+
+    Returns: same as st_markdown
+    """
+    batch = []
+    for message in messages:
+        if isinstance(message, str):
+            message = {"content": message}
+        elif not isinstance(message, dict) or not isinstance(message.get("content"), str):
+            raise TypeError(
+                f"message must be str or a dict with a str content, not {message!r}"
+            )
+        # None means "use the shared option", like in st_markdown
+        batch.append({k: v for k, v in message.items() if v is not None})
+    math_renderer = kwargs.pop("math_renderer", None)
+    if kwargs.pop("prerender_math", False):
+        # the math of every message goes in one map, the frontend looks formulas up by hash
+        kwargs["prerendered_math"] = {}
+        for message in batch:
+            kwargs["prerendered_math"].update(_prerender_math(message["content"], math_renderer))
+    if frontend_supports("messages"):
+        content = ""
+        kwargs["messages"] = batch
+    else:
+        # a frontend that predates batches gets the messages as one document
+        content = "\n\n".join(message["content"] for message in batch)
+    return st_markdown(
+        content,
+        richContent,
+        theme_color,
+        mermaid_theme,
+        mermaid_theme_CSS,
+        custom_color,
+        custom_css,
+        key=key,
+        default=default,
+        **kwargs,
+    )
+
+
 def simulated_token_stream(content):
     import random
 
@@ -0,0 +1,29 @@
+from __future__ import annotations
+import zlib
+from typing import *
+
+from streamlit_markdown.frontend_features import frontend_supports
+
+COMPRESSION_LEVEL = 6
+"""zlib level, see benchmarks/bench_compression.py for the tradeoff."""
+
+
+def content_args(content: str, compress_threshold: Optional[int], level: int = COMPRESSION_LEVEL) -> Dict[str, Any]:
+    """The component args carrying `content`, compressed if it is over `compress_threshold` bytes.
+
+    Compressed content is sent as zlib bytes in `content_zlib`, which Streamlit
+    transfers as a binary arg instead of inside the JSON args, and `content`
+    is left empty. The frontend inflates it with DecompressionStream. The
+    content is sent as is when compression is off (None), when it is under
+    the threshold, when compressing doesn't make it smaller, or when the
+    frontend build predates `content_zlib`, see frontend_features.
+    """
+    if compress_threshold is None or not frontend_supports("content_zlib"):
+        return {"content": content}
+    data = content.encode()
+    if len(data) <= compress_threshold:
+        return {"content": content}
+    compressed = zlib.compress(data, level)
+    if len(compressed) >= len(data):
+        return {"content": content}
+    return {"content": "", "content_zlib": compressed}
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+
+def _base36(number: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    out = ""
+    while True:
+        number, remainder = divmod(number, 36)
+        out = digits[remainder] + out
+        if not number:
+            return out
+
+
+def content_hash(text: str) -> str:
+    """32-bit FNV-1a hash of a string, as a short base-36 key.
+
+    Same as `hashString` in frontend/libs/content-hash.ts: it hashes UTF-16
+    code units, so keys computed here match the ones computed in the browser.
+    """
+    data = text.encode("utf-16-le", "surrogatepass")
+    h = 0x811C9DC5
+    for i in range(0, len(data), 2):
+        h ^= data[i] | (data[i + 1] << 8)
+        h = (h * 0x01000193) & 0xFFFFFFFF
+    return _base36(h)
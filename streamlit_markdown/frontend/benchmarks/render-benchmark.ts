@@ -0,0 +1,323 @@
+/**
+ * Render benchmark of the markdown pipeline in Node with jsdom.
+ *
+ * Static documents are timed phase by phase:
+ *   parse      markdown -> hast (remark, gfm, math, remark-rehype)
+ *   katex      rehype-katex on the parsed tree
+ *   highlight  rehype-highlight on the parsed tree
+ *   mermaid    every diagram through `renderMermaid`, starting from an empty cache
+ *   compile    hast -> React elements (rehype-react)
+ *   commit     React render + commit of these elements into the jsdom document
+ *
+ * Streaming documents are appended to token by token and re-rendered through
+ * `MarkdownContent`, with the full document parsed on every update and with
+ * `incremental` blocks.
+ *
+ * jsdom has no layout, so mermaid measures text with a fixed-width font and
+ * the numbers are only comparable between runs on the same machine. Compare
+ * two builds with `--compare`:
+ *
+ *   yarn bench --out before.json
+ *   yarn bench --compare before.json
+ *
+ * usage: yarn bench [--sizes 1000 10000] [--runs 5] [--tokens 100] [--content file.md] [--out file.json] [--compare file.json]
+ */
+import { readFileSync, writeFileSync } from "fs";
+import path from "path";
+import { Root } from "hast";
+import { JSDOM } from "jsdom";
+import type { CustomColor, CustomCSS } from "@/hooks/use-markdown-processor";
+
+type Options = {
+  sizes: number[];
+  runs: number;
+  tokens: number;
+  content: string;
+  out?: string;
+  compare?: string;
+};
+
+const CSS_CLASSES = "a h1 h2 h3 h4 h5 h6 p strong em code code_button code_latex code_mermaid pre ul ol li table thead th td blockquote";
+
+// the classes Python sends for the "default" preset of streamlit_markdown/themes.py
+const DEFAULT_THEME: { custom_color: CustomColor; custom_css: CustomCSS } = {
+  custom_color: {
+    bg: "bg-gray-100",
+    border: "border-gray-300",
+    text: "text-green-900",
+    hover_bg: "hover:bg-gray-200",
+    hover_text: "hover:text-gray-900",
+  },
+  custom_css: Object.fromEntries(CSS_CLASSES.split(" ").map((name) => [`${name}_class`, ""])) as CustomCSS,
+};
+
+type Timings = { median: number; min: number; max: number };
+
+type StaticResult = {
+  size: number;
+  blocks: number;
+  diagrams: number;
+  dom_nodes: number;
+  phases: Record<string, Timings>;
+};
+
+type StreamingResult = {
+  size: number;
+  mode: "full" | "incremental";
+  updates: number;
+  total_ms: number;
+  mean_ms: number;
+  p95_ms: number;
+  max_ms: number;
+};
+
+type Report = {
+  node: string;
+  date: string;
+  content: string;
+  runs: number;
+  static: StaticResult[];
+  streaming: StreamingResult[];
+};
+
+function parseOptions(argv: string[]): Options {
+  const options: Options = {
+    sizes: [1_000, 10_000, 100_000],
+    runs: 5,
+    tokens: 100,
+    content: path.join(__dirname, "test-markdown.md"),
+  };
+  let name = "";
+  const values: Record<string, string[]> = {};
+  for (const arg of argv) {
+    if (arg.startsWith("--")) {
+      name = arg;
+      values[name] = [];
+    } else if (name in values) {
+      values[name].push(arg);
+    } else {
+      throw new Error(`unexpected argument ${arg}`);
+    }
+  }
+  for (const [option, args] of Object.entries(values)) {
+    if (option === "--sizes") {
+      options.sizes = args.map(Number);
+    } else if (option === "--runs") {
+      options.runs = Number(args[0]);
+    } else if (option === "--tokens") {
+      options.tokens = Number(args[0]);
+    } else if (option === "--content") {
+      options.content = args[0];
+    } else if (option === "--out") {
+      options.out = args[0];
+    } else if (option === "--compare") {
+      options.compare = args[0];
+    } else {
+      throw new Error(`unknown option ${option}`);
+    }
+  }
+  return options;
+}
+
+// Globals React, mermaid and the components expect, set before they are imported
+function installDom() {
+  const dom = new JSDOM("<!DOCTYPE html><html><body></body></html>", { pretendToBeVisual: true });
+  const window = dom.window as any;
+  const globals = globalThis as any;
+  for (const name of ["window", "document", "navigator", "Element", "HTMLElement", "SVGElement", "Node", "DOMParser", "MutationObserver", "getComputedStyle", "requestAnimationFrame", "cancelAnimationFrame", "sessionStorage"]) {
+    if (!(name in globals) || name === "navigator") {
+      Object.defineProperty(globals, name, { value: window[name], configurable: true, writable: true });
+    }
+  }
+  // mermaid sizes its nodes from the rendered text, which jsdom doesn't lay out
+  window.SVGElement.prototype.getBBox = function () {
+    const length = (this.textContent ?? "").length;
+    return { x: 0, y: 0, width: length * 8, height: 16 };
+  };
+  window.SVGElement.prototype.getComputedTextLength = function () {
+    return (this.textContent ?? "").length * 8;
+  };
+  return window;
+}
+
+function scaled(content: string, size: number): string {
+  return content.repeat(Math.ceil(size / content.length)).slice(0, size);
+}
+
+function timings(samples: number[]): Timings {
+  const sorted = [...samples].sort((a, b) => a - b);
+  return {
+    median: round(sorted[Math.floor(sorted.length / 2)]),
+    min: round(sorted[0]),
+    max: round(sorted[sorted.length - 1]),
+  };
+}
+
+function round(ms: number): number {
+  return Math.round(ms * 1000) / 1000;
+}
+
+function time<T>(fn: () => T): [T, number] {
+  const start = performance.now();
+  const result = fn();
+  return [result, performance.now() - start];
+}
+
+async function timeAsync<T>(fn: () => Promise<T>): Promise<[T, number]> {
+  const start = performance.now();
+  const result = await fn();
+  return [result, performance.now() - start];
+}
+
+// let the effects scheduled by a commit (diagram renders, frame height) run
+const settle = () => new Promise((resolve) => setTimeout(resolve, 0));
+
+async function main() {
+  const options = parseOptions(process.argv.slice(2));
+  const window = installDom();
+
+  const { createElement } = await import("react");
+  const { createRoot } = await import("react-dom/client");
+  const { flushSync } = await import("react-dom");
+  const { unified } = await import("unified");
+  const { createHastProcessor } = await import("@/libs/markdown-pipeline");
+  const { loadRehypePlugin, loadedRehypePlugins } = await import("@/libs/rehype-plugins");
+  const { mermaidCache, renderMermaid } = await import("@/libs/mermaid-renderer");
+  const { splitMarkdownBlocks } = await import("@/libs/markdown-blocks");
+  const { hashString } = await import("@/libs/content-hash");
+  const { createHastCompiler } = await import("@/hooks/use-markdown-processor");
+  const { default: MarkdownContent } = await import("@/components/markdown-content");
+
+  await Promise.all([loadRehypePlugin("katex"), loadRehypePlugin("highlight")]);
+  const { katex, highlight } = loadedRehypePlugins();
+  const theme = DEFAULT_THEME;
+  // MarkdownContent logs its args on every render
+  console.log = () => undefined;
+
+  const parser = createHastProcessor();
+  const katexProcessor = unified().use(katex!);
+  const highlightProcessor = unified().use(highlight!, { ignoreMissing: true });
+  const compiler = createHastCompiler("custom", theme.custom_color, theme.custom_css);
+  const sample = readFileSync(options.content, "utf8");
+
+  const report: Report = {
+    node: process.version,
+    date: new Date().toISOString(),
+    content: path.basename(options.content),
+    runs: options.runs,
+    static: [],
+    streaming: [],
+  };
+
+  for (const size of options.sizes) {
+    const content = scaled(sample, size);
+    const diagrams = Array.from(content.matchAll(/^```mermaid\n([\s\S]*?)^```/gm), (match) => match[1]);
+    const samples: Record<string, number[]> = { parse: [], katex: [], highlight: [], mermaid: [], compile: [], commit: [] };
+    let domNodes = 0;
+    for (let run = 0; run < options.runs; run++) {
+      const [parsed, parseMs] = time(() => parser.runSync(parser.parse(content)));
+      const [withMath, katexMs] = time(() => katexProcessor.runSync(structuredClone(parsed) as Root));
+      const [tree, highlightMs] = time(() => highlightProcessor.runSync(withMath as Root) as Root);
+      mermaidCache.clear();
+      const [, mermaidMs] = await timeAsync(async () => {
+        for (let index = 0; index < diagrams.length; index++) {
+          const id = `mermaid-svg-${hashString(diagrams[index])}-${index}`;
+          await renderMermaid(id, diagrams[index], "default", "").catch(() => false);
+        }
+      });
+      // the diagrams are cached now, so the commit only measures React
+      const [element, compileMs] = time(() => compiler.stringify(tree));
+      const container = window.document.createElement("div");
+      window.document.body.appendChild(container);
+      const root = createRoot(container);
+      const [, commitMs] = time(() => flushSync(() => root.render(element as any)));
+      await settle();
+      domNodes = container.getElementsByTagName("*").length;
+      root.unmount();
+      container.remove();
+      samples.parse.push(parseMs);
+      samples.katex.push(katexMs);
+      samples.highlight.push(highlightMs);
+      samples.mermaid.push(mermaidMs);
+      samples.compile.push(compileMs);
+      samples.commit.push(commitMs);
+    }
+    const phases = Object.fromEntries(Object.entries(samples).map(([name, values]) => [name, timings(values)]));
+    report.static.push({ size, blocks: splitMarkdownBlocks(content).length, diagrams: diagrams.length, dom_nodes: domNodes, phases });
+    console.error(`static    ${String(size).padStart(8)} ${Object.entries(phases).map(([name, t]) => `${name} ${t.median.toFixed(1)}ms`).join("  ")}`);
+
+    for (const mode of ["full", "incremental"] as const) {
+      const step = Math.max(1, Math.ceil(size / options.tokens));
+      const container = window.document.createElement("div");
+      window.document.body.appendChild(container);
+      const root = createRoot(container);
+      const updates: number[] = [];
+      for (let length = step; length < size + step; length += step) {
+        const props = {
+          content: content.slice(0, length),
+          theme_color: "custom" as const,
+          mermaid_theme: "default",
+          custom_color: theme.custom_color,
+          custom_css: theme.custom_css,
+          incremental: mode === "incremental",
+        };
+        const [, updateMs] = time(() => flushSync(() => root.render(createElement(MarkdownContent, props))));
+        updates.push(updateMs);
+        await settle();
+      }
+      root.unmount();
+      container.remove();
+      const sorted = [...updates].sort((a, b) => a - b);
+      const total = updates.reduce((sum, ms) => sum + ms, 0);
+      report.streaming.push({
+        size,
+        mode,
+        updates: updates.length,
+        total_ms: round(total),
+        mean_ms: round(total / updates.length),
+        p95_ms: round(sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * 0.95))]),
+        max_ms: round(sorted[sorted.length - 1]),
+      });
+      console.error(`streaming ${String(size).padStart(8)} ${mode.padEnd(11)} ${updates.length} updates, ${total.toFixed(1)}ms total, ${(total / updates.length).toFixed(2)}ms mean`);
+    }
+  }
+
+  const json = JSON.stringify(report, null, 2);
+  if (options.out) {
+    writeFileSync(options.out, json + "\n");
+  } else if (!options.compare) {
+    process.stdout.write(json + "\n");
+  }
+  if (options.compare) {
+    compare(JSON.parse(readFileSync(options.compare, "utf8")), report);
+  }
+  // mermaid and jsdom keep timers around
+  process.exit(0);
+}
+
+// Median phase times of this run relative to a previous report
+function compare(before: Report, after: Report) {
+  console.error(`\ncompared with ${before.date} (${before.node})`);
+  for (const result of after.static) {
+    const previous = before.static.find((other) => other.size === result.size);
+    if (previous === undefined) {
+      continue;
+    }
+    const ratios = Object.entries(result.phases).map(([name, t]) => {
+      const base = previous.phases[name]?.median;
+      return `${name} ${base ? (t.median / base).toFixed(2) : "-"}x`;
+    });
+    console.error(`static    ${String(result.size).padStart(8)} ${ratios.join("  ")}`);
+  }
+  for (const result of after.streaming) {
+    const previous = before.streaming.find((other) => other.size === result.size && other.mode === result.mode);
+    if (previous !== undefined) {
+      console.error(`streaming ${String(result.size).padStart(8)} ${result.mode.padEnd(11)} total ${(result.total_ms / previous.total_ms).toFixed(2)}x  p95 ${(result.p95_ms / previous.p95_ms).toFixed(2)}x`);
+    }
+  }
+}
+
+main().catch((error) => {
+  console.error(error);
+  process.exit(1);
+});
@@ -1,6 +1,9 @@
-import React from "react";
+import React, { useLayoutEffect } from "react";
 import { classNames } from "@/libs/class-names";
-import { useMarkdownProcessor, ThemeColor, MermaidTheme, CustomColor, CustomCSS, classNameByTheme } from "@/hooks/use-markdown-processor";
+import { useMarkdownProcessor, ThemeColor, MermaidTheme, CustomColor, CustomCSS, PrerenderedMath, classNameByTheme } from "@/hooks/use-markdown-processor";
+import { DEFAULT_MERMAID_CACHE_SIZE } from "@/libs/mermaid-renderer";
+import { DEFAULT_VIRTUAL_HEIGHT } from "@/components/virtual-blocks";
+import { recordPhase } from "@/libs/render-metrics";
 
 interface MarkdownContentProps {
   theme_color?: ThemeColor;
@@ -10,6 +13,13 @@ interface MarkdownContentProps {
   mermaid_theme_CSS?: string;
   custom_color: CustomColor;
   custom_css: CustomCSS;
+  incremental?: boolean;
+  mermaid_cache_size?: number;
+  prerendered_math?: PrerenderedMath;
+  virtualized?: boolean;
+  height?: number;
+  worker?: boolean;
+  content_hash?: string;
 }
 
 function MarkdownContent({
@@ -20,6 +30,13 @@ function MarkdownContent({
   mermaid_theme_CSS = "",
   custom_color = {} as CustomColor,
   custom_css = {} as CustomCSS,
+  incremental = false,
+  mermaid_cache_size = DEFAULT_MERMAID_CACHE_SIZE,
+  prerendered_math = {},
+  virtualized = false,
+  height = DEFAULT_VIRTUAL_HEIGHT,
+  worker = false,
+  content_hash,
 }: MarkdownContentProps): JSX.Element {
   console.log("content", content);
   console.log("theme_color", theme_color);
@@ -27,7 +44,12 @@ function MarkdownContent({
   console.log("mermaid_theme_CSS", mermaid_theme_CSS);
   console.log("custom_color", custom_color);
   console.log("custom_css", custom_css);
-  const markdown_content = useMarkdownProcessor(content, theme_color, mermaid_theme, mermaid_theme_CSS, custom_color, custom_css);
+  const renderStart = performance.now();
+  const markdown_content = useMarkdownProcessor(content, theme_color, mermaid_theme, mermaid_theme_CSS, custom_color, custom_css, incremental, mermaid_cache_size, prerendered_math, virtualized, height, worker, content_hash);
+  // render + commit of new content, rerenders with the same content are not measured
+  useLayoutEffect(() => {
+    recordPhase("commit", performance.now() - renderStart);
+  }, [content]);
 
   return (
     <div
@@ -1,21 +1,67 @@
 import { useRenderData } from "streamlit-component-lib-react-hooks";
-import React from 'react';
+import React, { useMemo, useRef } from 'react';
 import MarkdownContent from '@/components/markdown-content';
+import { enableRenderMetrics } from "@/libs/render-metrics";
+import { installFrameHeightManager } from "@/libs/frame-height";
+import { enableSharedCache } from "@/libs/shared-render-cache";
+import { useCompressedContent } from "@/libs/compressed-content";
+import { applyStreamDelta, EMPTY_STREAM_STATE, StreamDelta, StreamState } from "@/libs/stream-delta";
+
+installFrameHeightManager();
 
 function StreamlitMarkdown() {
   const { theme, disabled, args } = useRenderData();
+  if (args.instrument) {
+    // before the first render of the content, so its parse is measured too
+    enableRenderMetrics();
+  }
+  if (args.shared_cache) {
+    enableSharedCache();
+  }
+  const stream = useRef<StreamState>(EMPTY_STREAM_STATE);
+
+  const delta: StreamDelta | undefined = args.stream;
+  const [plainContent, inflated] = useCompressedContent(args.content_zlib, args.content);
+  const content = useMemo(() => {
+    if (!delta) {
+      return plainContent;
+    }
+    stream.current = applyStreamDelta(stream.current, delta);
+    return stream.current.content;
+  }, [plainContent, delta?.stream, delta?.seq, delta?.snapshot]);
+
+  // `st_markdown_batch` renders many messages, each one overriding the shared options
+  const messages: Array<Record<string, any>> = args.messages ?? [{ content }];
+  // with `cached`, a hash of all the messages, only used once the content it was sent with is shown
+  const contentHash: string | undefined = inflated ? args.content_hash : undefined;
 
   return (
-    <div>
-      <MarkdownContent
-        theme_color={args.theme_color}
-        content={args.content}
-        richContent={args.richContent}
-        mermaid_theme_CSS={args.mermaid_theme_CSS}
-        mermaid_theme={args.mermaid_theme}
-        custom_color={args.custom_color}
-        custom_css={args.custom_css}
-      />
+    <div className={messages.length > 1 ? "flex flex-col gap-4" : undefined}>
+      {messages.map((message, index) => {
+        const options = { ...args, ...message };
+        // Python sends every class of the preset, a message overrides some of them
+        const custom_color = { ...args.custom_color, ...message.custom_color };
+        const custom_css = { ...args.custom_css, ...message.custom_css };
+        return (
+          <MarkdownContent
+            key={index}
+            theme_color={options.theme_color}
+            content={message.content}
+            richContent={options.richContent}
+            mermaid_theme_CSS={options.mermaid_theme_CSS}
+            mermaid_theme={options.mermaid_theme}
+            custom_color={custom_color}
+            custom_css={custom_css}
+            incremental={options.incremental}
+            mermaid_cache_size={options.mermaid_cache_size}
+            prerendered_math={options.prerendered_math}
+            virtualized={options.virtualized}
+            height={options.virtual_height}
+            worker={options.worker}
+            content_hash={contentHash && `${contentHash}-${index}`}
+          />
+        );
+      })}
     </div>
   );
 }
@@ -0,0 +1,120 @@
+import React, { ReactNode, memo, useCallback, useEffect, useLayoutEffect, useRef, useState } from "react";
+
+export const DEFAULT_VIRTUAL_HEIGHT = 600;
+
+// Blocks this far (in px) outside the visible area stay mounted, so fast
+// scrolling doesn't show blank space before they are measured.
+const OVERSCAN = 800;
+const LINE_HEIGHT = 20;
+const BLOCK_MARGIN = 24;
+
+export type MarkdownBlockData = {
+  key: string;
+  source: string;
+  node: ReactNode;
+};
+
+/**
+ * Helper function to guess the height of a block that was never mounted
+ */
+function estimateHeight(source: string): number {
+  let lines = 1;
+  for (let i = 0; i < source.length; i++) {
+    if (source.charCodeAt(i) === 10) {
+      lines++;
+    }
+  }
+  return lines * LINE_HEIGHT + BLOCK_MARGIN;
+}
+
+const MeasuredBlock = memo(function MeasuredBlock({ id, node, onHeight }: { id: string, node: ReactNode, onHeight: (id: string, height: number) => void }) {
+  const ref = useRef<HTMLDivElement>(null);
+
+  useLayoutEffect(() => {
+    const element = ref.current;
+    if (!element) {
+      return;
+    }
+    onHeight(id, element.offsetHeight);
+    const observer = new ResizeObserver(() => onHeight(id, element.offsetHeight));
+    observer.observe(element);
+    return () => observer.disconnect();
+  }, [id, onHeight]);
+
+  // flow-root keeps the margins of the content inside the measured box
+  return <div ref={ref} style={{ display: "flow-root" }}>{node}</div>;
+});
+
+/**
+ * Render only the blocks near the visible part of a fixed-height scroll area.
+ *
+ * The iframe keeps a constant height, so the frame height posted to Streamlit
+ * no longer depends on the document length. Unmounted blocks are replaced by
+ * spacers using their measured height, or an estimate from their line count.
+ * While the view is scrolled to the bottom it follows newly streamed content.
+ */
+export function VirtualBlocks({ blocks, height = DEFAULT_VIRTUAL_HEIGHT }: { blocks: MarkdownBlockData[], height?: number }) {
+  const scroller = useRef<HTMLDivElement>(null);
+  const heights = useRef(new Map<string, number>());
+  const stickToBottom = useRef(false);
+  const [scrollTop, setScrollTop] = useState(0);
+  const [, setLayoutVersion] = useState(0);
+
+  const onHeight = useCallback((id: string, blockHeight: number) => {
+    if (heights.current.get(id) !== blockHeight) {
+      heights.current.set(id, blockHeight);
+      setLayoutVersion((version) => version + 1);
+    }
+  }, []);
+
+  const offsets = [0];
+  for (const block of blocks) {
+    const blockHeight = heights.current.get(block.key) ?? estimateHeight(block.source);
+    offsets.push(offsets[offsets.length - 1] + blockHeight);
+  }
+  const total = offsets[offsets.length - 1];
+
+  let start = 0;
+  while (start < blocks.length - 1 && offsets[start + 1] < scrollTop - OVERSCAN) {
+    start++;
+  }
+  let end = start;
+  while (end < blocks.length && offsets[end] <= scrollTop + height + OVERSCAN) {
+    end++;
+  }
+
+  useEffect(() => {
+    // forget heights of blocks that are gone
+    const keys = new Set(blocks.map((block) => block.key));
+    heights.current.forEach((_, key) => {
+      if (!keys.has(key)) {
+        heights.current.delete(key);
+      }
+    });
+  }, [blocks]);
+
+  useLayoutEffect(() => {
+    const element = scroller.current;
+    if (element && stickToBottom.current) {
+      element.scrollTop = element.scrollHeight;
+    }
+  }, [total]);
+
+  return (
+    <div
+      ref={scroller}
+      style={{ height, overflowY: "auto" }}
+      onScroll={(event) => {
+        const element = event.currentTarget;
+        stickToBottom.current = element.scrollTop + element.clientHeight >= element.scrollHeight - 1;
+        setScrollTop(element.scrollTop);
+      }}
+    >
+      <div style={{ height: offsets[start] }} />
+      {blocks.slice(start, end).map(({ key, node }) => (
+        <MeasuredBlock key={key} id={key} node={node} onHeight={onHeight} />
+      ))}
+      <div style={{ height: total - offsets[end] }} />
+    </div>
+  );
+}
@@ -1,58 +1,44 @@
 import { classNames } from "@/libs/class-names";
+import { splitMarkdownBlocks } from "@/libs/markdown-blocks";
+import { hashString, mathKey, nodeText } from "@/libs/content-hash";
+import { DEFAULT_MERMAID_CACHE_SIZE, mermaidCache, renderMermaid } from "@/libs/mermaid-renderer";
+import { RehypePlugins, loadRehypePlugin, loadedRehypePlugins, requiredRehypePlugins } from "@/libs/rehype-plugins";
+import { loadLatex, loadRehypeStyles } from "@/libs/lazy-renderers";
+import { PrerenderedMath, createHastProcessor } from "@/libs/markdown-pipeline";
+import { ParseResult, cancelWorkerParse, parseInWorker, workerSupported } from "@/libs/markdown-worker";
+import { recordPhase, renderMetricsEnabled, timedPlugin } from "@/libs/render-metrics";
+import { getRenderedTrees, setRenderedTrees } from "@/libs/rendered-tree-cache";
+import { DEFAULT_VIRTUAL_HEIGHT, MarkdownBlockData, VirtualBlocks } from "@/components/virtual-blocks";
 import { CircleNotch, MathOperations, CheckFat, Copy, FlowArrow, Code } from "@phosphor-icons/react";
 import { Root } from "hast";
-import "highlight.js/styles/green-screen.css";
 // import "https://unpkg.com/browse/@highlightjs/cdn-assets@11.6.0/styles/base16/green-screen.min.css";
-import mermaid from "mermaid";
 import Link from "next/link";
 import {
   Children,
   Fragment,
+  ReactNode,
+  createContext,
   createElement,
   isValidElement,
+  memo,
+  useContext,
   useEffect,
+  useId,
   useMemo,
   useState,
   useRef,
 } from "react";
 import flattenChildren from "react-keyed-flatten-children";
-import rehypeHighlight from "rehype-highlight";
 import rehypeReact from "rehype-react";
-import remarkGfm from "remark-gfm";
-import remarkParse from "remark-parse";
-import remarkRehype from "remark-rehype";
-import rehypeKatex from 'rehype-katex'
-import remarkMath from 'remark-math'
-import { Plugin, unified } from "unified";
-import { visit } from "unist-util-visit";
-import { Streamlit } from "streamlit-component-lib"
-// @ts-expect-error
-import { HtmlGenerator, parse } from "latex.js";
+import { unified } from "unified";
 // import "node_modules/latex.js/dist/css/base.css"
 // import "node_modules/latex.js/dist/css/katex.css"
-import "katex/dist/katex.min.css"; // `rehype-katex` does not import the CSS for you;
 // import "highlight.js/styles/base16/green-screen.css";
 // import "@/styles/highlighting.green-screen.min.css";
 export const ANCHOR_CLASS_NAME = "font-semibold underline underline-offset-[2px] decoration-1 transition-colors";
 
-// Mixing arbitrary Markdown + Capsize leads to lots of challenges
-// with paragraphs and list items. This replaces paragraphs inside
-// list items into divs to avoid nesting Capsize.
-const rehypeListItemParagraphToDiv: Plugin<[], Root> = () => {
-  return (tree) => {
-    visit(tree, "element", (element) => {
-      if (element.tagName === "li") {
-        element.children = element.children.map((child) => {
-          if (child.type === "element" && child.tagName === "p") {
-            child.tagName = "div";
-          }
-          return child;
-        });
-      }
-    });
-    return tree;
-  };
-};
+export type { PrerenderedMath };
+
 export type ThemeColor = "blue" | "orange" | "green" | "red" | "purple" | "pink" | "indigo" | "yellow" | "teal" | "cyan" | "gray" | "slate" | "dark" | "light" | "null" | "custom";
 export type ThemeScope = "bg" | "border" | "text" | "hover_bg" | "hover_text";
 export type MermaidTheme = string | 'default' | 'forest' | 'dark' | 'neutral' | 'null';
@@ -210,6 +196,277 @@ export function classNameByTheme(theme_color: ThemeColor, theme_scope: Array<The
   }).join(" ");
 }
 
+const rehypeReactOptions = (
+  theme_color: ThemeColor,
+  custom_color: CustomColor,
+  custom_css: CustomCSS,
+  prerendered: { current: PrerenderedMath },
+) => ({
+  createElement,
+  Fragment,
+  components: {
+    a: ({ href, children }: JSX.IntrinsicElements["a"]) => (
+      <a
+        href={href}
+        target="_blank"
+        rel="noreferrer"
+        className={custom_css.a_class.length > 0 ? custom_css.a_class : classNames(
+          ANCHOR_CLASS_NAME,
+          classNameByTheme(theme_color, ["text", "hover_text"], custom_color),
+        )}
+      >
+        {children}
+      </a>
+    ),
+    h1: ({ children, id }: JSX.IntrinsicElements["h1"]) => (
+      <h1
+        className={custom_css.h1_class.length > 0 ? custom_css.h1_class : classNames(
+          "font-sans font-semibold text-2xl mb-6 mt-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h1>
+    ),
+    h2: ({ children, id }: JSX.IntrinsicElements["h2"]) => (
+      <h2
+        className={custom_css.h2_class.length > 0 ? custom_css.h2_class : classNames(
+          "font-sans font-medium text-2xl mb-6 mt-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h2>
+    ),
+    h3: ({ children, id }: JSX.IntrinsicElements["h3"]) => (
+      <h3
+        className={custom_css.h3_class.length > 0 ? custom_css.h3_class : classNames(
+          "font-sans font-semibold text-xl mb-6 mt-2",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h3>
+    ),
+    h4: ({ children, id }: JSX.IntrinsicElements["h4"]) => (
+      <h4
+        className={custom_css.h4_class.length > 0 ? custom_css.td_class : classNames(
+          "font-sans font-medium text-xl my-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h4>
+    ),
+    h5: ({ children, id }: JSX.IntrinsicElements["h5"]) => (
+      <h5
+        className={custom_css.h5_class.length > 0 ? custom_css.h5_class : classNames(
+          "font-sans font-semibold text-lg my-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h5>
+    ),
+    h6: ({ children, id }: JSX.IntrinsicElements["h6"]) => (
+      <h6
+        className={custom_css.h6_class.length > 0 ? custom_css.h6_class : classNames(
+          "font-sans font-medium text-lg my-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}
+        id={id}
+      >
+        {children}
+      </h6>
+    ),
+    p: (props: JSX.IntrinsicElements["p"]) => {
+      return (
+        <p className={custom_css.p_class.length > 0 ? custom_css.p_class : classNames(
+          "font-sans text-sm mb-6",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )}>
+          {props.children}
+        </p>
+      );
+    },
+    strong: ({ children }: JSX.IntrinsicElements["strong"]) => (
+      <strong className={custom_css.strong_class.length > 0 ? custom_css.strong_class : classNames(
+        "font-semibold",
+        classNameByTheme(theme_color, ["text"], custom_color),
+      )}>
+        {children}
+      </strong>
+    ),
+    em: ({ children }: JSX.IntrinsicElements["em"]) => (
+      <em className={
+        custom_css.em_class.length > 0 ? custom_css.em_class : classNames(
+          "italic",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )
+      }>{children}</em>
+    ),
+    code: ({ children, className }: JSX.IntrinsicElements["code"]) => (
+      <CodeBlock
+        className={className}
+        hash={hashString(nodeText(children))}
+        theme_color={theme_color}
+        custom_color={custom_color}
+        custom_css={custom_css}
+      >
+        {children}
+      </CodeBlock>
+    ),
+    pre: ({ children }: JSX.IntrinsicElements["pre"]) => {
+      return (
+        <div className="relative mb-6">
+          <pre className={custom_css.pre_class.length > 0 ? custom_css.pre_class : classNames(
+            "p-4 rounded-lg border-2 [&>code.hljs]:p-0 [&>code.hljs]:bg-transparent font-code text-sm overflow-x-auto flex items-start",
+            classNameByTheme(theme_color, ["border", "bg"], custom_color),
+          )}>
+            {children}
+          </pre>
+        </div>
+      );
+    },
+    ul: ({ children }: JSX.IntrinsicElements["ul"]) => (
+      <ul className={custom_css.ul_class.length > 0 ? custom_css.ul_class : classNames(
+        "flex flex-col gap-3 my-6 pl-3 [&_ol]:my-3 [&_ul]:my-3",
+        classNameByTheme(theme_color, ["text"], custom_color),
+      )}>
+        {Children.map(
+          flattenChildren(children).filter(isValidElement),
+          (child, index) => (
+            <li key={index} className="flex gap-2 items-start">
+              <div className="w-1 h-1 rounded-full bg-current block shrink-0 mt-1" />
+              {child}
+            </li>
+          )
+        )}
+      </ul>
+    ),
+    ol: ({ children }: JSX.IntrinsicElements["ol"]) => (
+      <ol className={custom_css.ol_class.length > 0 ? custom_css.ol_class : classNames(
+        "flex flex-col gap-3 my-6 pl-3 [&_ol]:my-3 [&_ul]:my-3",
+        classNameByTheme(theme_color, ["text"], custom_color),
+      )}>
+        {Children.map(
+          flattenChildren(children).filter(isValidElement),
+          (child, index) => (
+            <li key={index} className="flex gap-2 items-start">
+              <div
+                className={custom_css.li_class.length > 0 ? custom_css.li_class : classNames(
+                  "font-sans text-sm font-semibold shrink-0 min-w-[1.4ch]",
+                  classNameByTheme(theme_color, ["text"], custom_color),
+                )}
+                aria-hidden
+              >
+                {index + 1}.
+              </div>
+              {child}
+            </li>
+          )
+        )}
+      </ol>
+    ),
+    li: ({ children }: JSX.IntrinsicElements["li"]) => (
+      <div className={
+        custom_css.li_class.length > 0 ? custom_css.li_class : classNames(
+          "font-sans text-sm",
+          classNameByTheme(theme_color, ["text"], custom_color),
+        )
+      }>{children}</div>
+    ),
+    table: ({ children }: JSX.IntrinsicElements["table"]) => (
+      <div className="overflow-x-auto mb-6">
+        <table className={custom_css.table_class.length > 0 ? custom_css.table_class : classNames(
+          "table-auto border-2",
+          classNameByTheme(theme_color, ["border"], custom_color),
+        )}>
+          {children}
+        </table>
+      </div>
+    ),
+    thead: ({ children }: JSX.IntrinsicElements["thead"]) => (
+      <thead className={custom_css.thead_class.length > 0 ? custom_css.thead_class : classNames(
+        classNameByTheme(theme_color, ["bg"], custom_color),
+      )}>{children}</thead>
+    ),
+    th: ({ children }: JSX.IntrinsicElements["th"]) => (
+      <th className={custom_css.th_class.length > 0 ? custom_css.th_class : classNames(
+        "border-2 p-2 font-sans text-sm font-semibold",
+        classNameByTheme(theme_color, ["border", "text"], custom_color),
+      )}>
+        {children}
+      </th>
+    ),
+    td: ({ children }: JSX.IntrinsicElements["td"]) => (
+      <td className={custom_css.td_class.length > 0 ? custom_css.td_class : classNames(
+        "border-2 p-2 font-sans text-sm",
+        classNameByTheme(theme_color, ["border", "text"], custom_color),
+      )}>
+        {children}
+      </td>
+    ),
+    blockquote: ({ children }: JSX.IntrinsicElements["blockquote"]) => (
+      <blockquote className={custom_css.blockquote_class.length > 0 ? custom_css.blockquote_class : classNames(
+        "border-l-4 pl-2 italic",
+        classNameByTheme(theme_color, ["border", "text"], custom_color),
+      )}>
+        {children}
+      </blockquote>
+    ),
+    // not an intrinsic element, so keep it out of the components type
+    ...({
+      "math-prerendered": ({ children, className }: JSX.IntrinsicElements["span"]) => {
+        const display = className === "math-prerendered-display";
+        const html = prerendered.current[mathKey(nodeText(children), display)];
+        const Tag = display ? "div" : "span";
+        if (html === undefined) {
+          return <Tag>{children}</Tag>;
+        }
+        return <Tag className={display ? "math math-display" : "math math-inline"} dangerouslySetInnerHTML={{ __html: html }} />;
+      },
+    } as {}),
+  },
+});
+
+export const createMarkdownProcessor = (
+  theme_color: ThemeColor = "green",
+  custom_color: CustomColor = {} as CustomColor,
+  custom_css: CustomCSS = {} as CustomCSS,
+  prerendered: { current: PrerenderedMath } = { current: {} },
+  plugins: RehypePlugins = {},
+) => {
+  const timed: RehypePlugins = {
+    katex: plugins.katex && timedPlugin("katex", plugins.katex),
+    highlight: plugins.highlight && timedPlugin("highlight", plugins.highlight),
+  };
+  return createHastProcessor(prerendered, timed)
+    .use(rehypeReact, rehypeReactOptions(theme_color, custom_color, custom_css, prerendered));
+};
+
+export type MarkdownProcessor = ReturnType<typeof createMarkdownProcessor>;
+
+/**
+ * Only the hast -> React half of the pipeline, for trees parsed in the worker.
+ */
+export const createHastCompiler = (
+  theme_color: ThemeColor = "green",
+  custom_color: CustomColor = {} as CustomColor,
+  custom_css: CustomCSS = {} as CustomCSS,
+  prerendered: { current: PrerenderedMath } = { current: {} },
+) => {
+  return unified()
+    .use(rehypeReact, rehypeReactOptions(theme_color, custom_color, custom_css, prerendered));
+};
+
+const MermaidConfigContext = createContext({ theme: "default" as MermaidTheme, themeCSS: "" });
+
 export const useMarkdownProcessor = (
   content: string,
   theme_color: ThemeColor = "green",
@@ -217,236 +474,200 @@ export const useMarkdownProcessor = (
   mermaid_theme_CSS: string | undefined = undefined,
   custom_color: CustomColor = {} as CustomColor,
   custom_css: CustomCSS = {} as CustomCSS,
+  incremental: boolean = false,
+  mermaid_cache_size: number = DEFAULT_MERMAID_CACHE_SIZE,
+  prerendered_math: PrerenderedMath = {},
+  virtualized: boolean = false,
+  height: number = DEFAULT_VIRTUAL_HEIGHT,
+  worker: boolean = false,
+  content_hash: string | undefined = undefined,
 ) => {
   useEffect(() => {
-    mermaid.initialize({ startOnLoad: false, theme: mermaid_theme, themeCSS: mermaid_theme_CSS });
-  }, [mermaid_theme, mermaid_theme_CSS]);
+    mermaidCache.resize(mermaid_cache_size);
+  }, [mermaid_cache_size]);
+  const mermaidConfig = useMemo(
+    () => ({ theme: mermaid_theme, themeCSS: mermaid_theme_CSS ?? "" }),
+    [mermaid_theme, mermaid_theme_CSS]
+  );
 
-  return useMemo(() => {
-    return unified()
-      .use(remarkParse)
-      .use(remarkGfm)
-      .use(remarkRehype)
-      .use(remarkMath)
-      .use(rehypeKatex)
-      .use(rehypeHighlight, { ignoreMissing: true })
-      .use(rehypeListItemParagraphToDiv)
-      .use(rehypeReact, {
-        createElement,
-        Fragment,
-        components: {
-          a: ({ href, children }: JSX.IntrinsicElements["a"]) => (
-            <a
-              href={href}
-              target="_blank"
-              rel="noreferrer"
-              className={custom_css.a_class.length > 0 ? custom_css.a_class : classNames(
-                ANCHOR_CLASS_NAME,
-                classNameByTheme(theme_color, ["text", "hover_text"], custom_color),
-              )}
-            >
-              {children}
-            </a>
-          ),
-          h1: ({ children, id }: JSX.IntrinsicElements["h1"]) => (
-            <h1
-              className={custom_css.h1_class.length > 0 ? custom_css.h1_class : classNames(
-                "font-sans font-semibold text-2xl mb-6 mt-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h1>
-          ),
-          h2: ({ children, id }: JSX.IntrinsicElements["h2"]) => (
-            <h2
-              className={custom_css.h2_class.length > 0 ? custom_css.h2_class : classNames(
-                "font-sans font-medium text-2xl mb-6 mt-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h2>
-          ),
-          h3: ({ children, id }: JSX.IntrinsicElements["h3"]) => (
-            <h3
-              className={custom_css.h3_class.length > 0 ? custom_css.h3_class : classNames(
-                "font-sans font-semibold text-xl mb-6 mt-2",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h3>
-          ),
-          h4: ({ children, id }: JSX.IntrinsicElements["h4"]) => (
-            <h4
-              className={custom_css.h4_class.length > 0 ? custom_css.td_class : classNames(
-                "font-sans font-medium text-xl my-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h4>
-          ),
-          h5: ({ children, id }: JSX.IntrinsicElements["h5"]) => (
-            <h5
-              className={custom_css.h5_class.length > 0 ? custom_css.h5_class : classNames(
-                "font-sans font-semibold text-lg my-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h5>
-          ),
-          h6: ({ children, id }: JSX.IntrinsicElements["h6"]) => (
-            <h6
-              className={custom_css.h6_class.length > 0 ? custom_css.h6_class : classNames(
-                "font-sans font-medium text-lg my-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}
-              id={id}
-            >
-              {children}
-            </h6>
-          ),
-          p: (props: JSX.IntrinsicElements["p"]) => {
-            return (
-              <p className={custom_css.p_class.length > 0 ? custom_css.p_class : classNames(
-                "font-sans text-sm mb-6",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )}>
-                {props.children}
-              </p>
-            );
-          },
-          strong: ({ children }: JSX.IntrinsicElements["strong"]) => (
-            <strong className={custom_css.strong_class.length > 0 ? custom_css.strong_class : classNames(
-              "font-semibold",
-              classNameByTheme(theme_color, ["text"], custom_color),
-            )}>
-              {children}
-            </strong>
-          ),
-          em: ({ children }: JSX.IntrinsicElements["em"]) => (
-            <em className={
-              custom_css.em_class.length > 0 ? custom_css.em_class : classNames(
-                "italic",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )
-            }>{children}</em>
-          ),
-          code: ({ children, className }: JSX.IntrinsicElements["code"]) => CodeBlock({ children, className }, theme_color, custom_color, custom_css),
-          pre: ({ children }: JSX.IntrinsicElements["pre"]) => {
-            return (
-              <div className="relative mb-6">
-                <pre className={custom_css.pre_class.length > 0 ? custom_css.pre_class : classNames(
-                  "p-4 rounded-lg border-2 [&>code.hljs]:p-0 [&>code.hljs]:bg-transparent font-code text-sm overflow-x-auto flex items-start",
-                  classNameByTheme(theme_color, ["border", "bg"], custom_color),
-                )}>
-                  {children}
-                </pre>
-              </div>
-            );
-          },
-          ul: ({ children }: JSX.IntrinsicElements["ul"]) => (
-            <ul className={custom_css.ul_class.length > 0 ? custom_css.ul_class : classNames(
-              "flex flex-col gap-3 my-6 pl-3 [&_ol]:my-3 [&_ul]:my-3",
-              classNameByTheme(theme_color, ["text"], custom_color),
-            )}>
-              {Children.map(
-                flattenChildren(children).filter(isValidElement),
-                (child, index) => (
-                  <li key={index} className="flex gap-2 items-start">
-                    <div className="w-1 h-1 rounded-full bg-current block shrink-0 mt-1" />
-                    {child}
-                  </li>
-                )
-              )}
-            </ul>
-          ),
-          ol: ({ children }: JSX.IntrinsicElements["ol"]) => (
-            <ol className={custom_css.ol_class.length > 0 ? custom_css.ol_class : classNames(
-              "flex flex-col gap-3 my-6 pl-3 [&_ol]:my-3 [&_ul]:my-3",
-              classNameByTheme(theme_color, ["text"], custom_color),
-            )}>
-              {Children.map(
-                flattenChildren(children).filter(isValidElement),
-                (child, index) => (
-                  <li key={index} className="flex gap-2 items-start">
-                    <div
-                      className={custom_css.li_class.length > 0 ? custom_css.li_class : classNames(
-                        "font-sans text-sm font-semibold shrink-0 min-w-[1.4ch]",
-                        classNameByTheme(theme_color, ["text"], custom_color),
-                      )}
-                      aria-hidden
-                    >
-                      {index + 1}.
-                    </div>
-                    {child}
-                  </li>
-                )
-              )}
-            </ol>
-          ),
-          li: ({ children }: JSX.IntrinsicElements["li"]) => (
-            <div className={
-              custom_css.li_class.length > 0 ? custom_css.li_class : classNames(
-                "font-sans text-sm",
-                classNameByTheme(theme_color, ["text"], custom_color),
-              )
-            }>{children}</div>
-          ),
-          table: ({ children }: JSX.IntrinsicElements["table"]) => (
-            <div className="overflow-x-auto mb-6">
-              <table className={custom_css.table_class.length > 0 ? custom_css.table_class : classNames(
-                "table-auto border-2",
-                classNameByTheme(theme_color, ["border"], custom_color),
-              )}>
-                {children}
-              </table>
-            </div>
-          ),
-          thead: ({ children }: JSX.IntrinsicElements["thead"]) => (
-            <thead className={custom_css.thead_class.length > 0 ? custom_css.thead_class : classNames(
-              classNameByTheme(theme_color, ["bg"], custom_color),
-            )}>{children}</thead>
-          ),
-          th: ({ children }: JSX.IntrinsicElements["th"]) => (
-            <th className={custom_css.th_class.length > 0 ? custom_css.th_class : classNames(
-              "border-2 p-2 font-sans text-sm font-semibold",
-              classNameByTheme(theme_color, ["border", "text"], custom_color),
-            )}>
-              {children}
-            </th>
-          ),
-          td: ({ children }: JSX.IntrinsicElements["td"]) => (
-            <td className={custom_css.td_class.length > 0 ? custom_css.td_class : classNames(
-              "border-2 p-2 font-sans text-sm",
-              classNameByTheme(theme_color, ["border", "text"], custom_color),
-            )}>
-              {children}
-            </td>
-          ),
-          blockquote: ({ children }: JSX.IntrinsicElements["blockquote"]) => (
-            <blockquote className={custom_css.blockquote_class.length > 0 ? custom_css.blockquote_class : classNames(
-              "border-l-4 pl-2 italic",
-              classNameByTheme(theme_color, ["border", "text"], custom_color),
-            )}>
-              {children}
-            </blockquote>
-          ),
-        },
-      })
-      .processSync(content).result;
-  }, [content, theme_color]);
+  // args are new objects on every render, compare them by value
+  const themeKey = JSON.stringify([theme_color, custom_color, custom_css]);
+  const prerendered = useRef<PrerenderedMath>(prerendered_math);
+  prerendered.current = prerendered_math;
+  const prerenderedKey = Object.keys(prerendered_math).join(",");
+  const blockMode = incremental || virtualized;
+  // a document the worker failed on is parsed on the main thread from then on
+  const [workerFailed, setWorkerFailed] = useState(false);
+  const inWorker = worker && !workerFailed && workerSupported();
+  // a cached document parsed before, by this iframe or another one of the tab
+  const cachedTrees = useMemo(
+    () => content_hash === undefined ? undefined : getRenderedTrees(content_hash, content),
+    [content_hash, content]
+  );
+  // KaTeX and highlight.js are loaded once the content needs them. Until then
+  // math and code are shown as plain text, so the first paint never waits.
+  // In the worker only their styles are needed here.
+  const [plugins, setPlugins] = useState<RehypePlugins>(loadedRehypePlugins);
+  useEffect(() => {
+    const missing = requiredRehypePlugins(content).filter((name) => plugins[name] === undefined);
+    if (missing.length === 0) {
+      return;
+    }
+    if (inWorker || cachedTrees) {
+      missing.forEach((name) => loadRehypeStyles(name).catch(console.error));
+      return;
+    }
+    let cancelled = false;
+    Promise.all(missing.map((name) => Promise.all([loadRehypePlugin(name), loadRehypeStyles(name)]))).then(() => {
+      if (!cancelled) {
+        setPlugins(loadedRehypePlugins());
+      }
+    }).catch(console.error);
+    return () => {
+      cancelled = true;
+    };
+  }, [content, plugins, inWorker, cachedTrees]);
+  const processor = useMemo(
+    () => createMarkdownProcessor(theme_color, custom_color, custom_css, prerendered, plugins),
+    [themeKey, plugins]
+  );
+  const compiler = useMemo(
+    () => createHastCompiler(theme_color, custom_color, custom_css, prerendered),
+    [themeKey]
+  );
+
+  const sources = useMemo(
+    () => blockMode ? splitMarkdownBlocks(content) : [content],
+    [content, blockMode]
+  );
+  // With `worker`, parsing and highlighting run off the main thread and the
+  // latest parsed trees are shown until the newer content comes back.
+  const channel = useId();
+  const [parsed, setParsed] = useState<ParseResult | null>(null);
+  useEffect(() => {
+    if (inWorker && !cachedTrees) {
+      parseInWorker(channel, sources, prerendered.current, setParsed, () => setWorkerFailed(true));
+    }
+  }, [inWorker, cachedTrees, sources, prerenderedKey]);
+  useEffect(() => () => cancelWorkerParse(channel), [channel]);
+
+  const blockCache = useRef<{ owner: unknown; blocks: Map<string, ReactNode> }>({
+    owner: null,
+    blocks: new Map(),
+  });
+
+  const tree = useMemo(() => {
+    const input = cachedTrees ?? (inWorker ? parsed : { sources, trees: null, plugins: "" });
+    if (input === null) {
+      return null;
+    }
+    // with a content hash, the trees parsed here are kept for the next mount
+    const built: Root[] = [];
+    const parse = (source: string, index: number): ReactNode => {
+      if (content_hash === undefined) {
+        return processor.processSync(source).result;
+      }
+      const hast = processor.runSync(processor.parse(source)) as Root;
+      built[index] = hast;
+      return processor.stringify(hast) as ReactNode;
+    };
+    const render = (source: string, index: number): ReactNode => {
+      if (input.trees) {
+        return compiler.stringify(input.trees[index] as Root) as ReactNode;
+      }
+      if (!renderMetricsEnabled()) {
+        return parse(source, index);
+      }
+      const start = performance.now();
+      const node = parse(source, index);
+      recordPhase("parse", performance.now() - start);
+      return node;
+    };
+    const store = () => {
+      if (content_hash === undefined || cachedTrees) {
+        return;
+      }
+      if (input.trees) {
+        // the worker answers for the latest document it was sent, which may not be this one yet
+        if (input.sources.length === sources.length && input.sources.every((source, index) => source === sources[index])) {
+          setRenderedTrees(content_hash, { sources: input.sources, trees: input.trees as Root[], plugins: input.plugins });
+        }
+      } else if (input.sources.every((_, index) => built[index] !== undefined)) {
+        // blocks reused from the previous content have no tree, only complete documents are kept
+        setRenderedTrees(content_hash, { sources: input.sources, trees: built, plugins: Object.keys(plugins).join(",") });
+      }
+    };
+    if (!blockMode) {
+      const node = render(input.sources[0], 0);
+      store();
+      return node;
+    }
+    // Finished blocks before the tail are frozen: they are looked up by their
+    // text and only new or changed blocks (usually the last one) are parsed.
+    const cache = blockCache.current;
+    const owner = input.trees ? `${input.plugins}|${themeKey}` : processor;
+    if (cache.owner !== owner) {
+      cache.owner = owner;
+      cache.blocks = new Map();
+    }
+    const nodes = new Map<string, ReactNode>();
+    const seen = new Map<string, number>();
+    const blocks: MarkdownBlockData[] = input.sources.map((source, index) => {
+      let node = nodes.get(source) ?? cache.blocks.get(source);
+      if (node === undefined) {
+        node = render(source, index);
+      }
+      nodes.set(source, node);
+      // Finished blocks are keyed by their content so they survive edits
+      // elsewhere in the document. The open tail block keeps a fixed key
+      // while it grows, instead of remounting on every token.
+      if (index === input.sources.length - 1) {
+        return { key: "tail", source, node };
+      }
+      const hash = hashString(source);
+      const count = seen.get(hash) ?? 0;
+      seen.set(hash, count + 1);
+      return { key: `${hash}-${count}`, source, node };
+    });
+    cache.blocks = nodes;
+    store();
+    if (virtualized) {
+      return <VirtualBlocks blocks={blocks} height={height} />;
+    }
+    return <>{blocks.map(({ key, node }) => <MarkdownBlock key={key} node={node} />)}</>;
+  }, [cachedTrees ?? (inWorker ? parsed : sources), content_hash, processor, compiler, blockMode, virtualized, height, prerenderedKey]);
+
+  return (
+    <MermaidConfigContext.Provider value={mermaidConfig}>
+      {tree}
+    </MermaidConfigContext.Provider>
+  );
 };
 
-const CodeBlock = ({ children, className }: JSX.IntrinsicElements["code"], theme_color: ThemeColor = "green", custom_color: CustomColor, custom_css: CustomCSS) => {
+// Cached blocks are the very same element, so memo skips re-rendering them.
+const MarkdownBlock = memo(function MarkdownBlock({ node }: { node: ReactNode }) {
+  return <>{node}</>;
+});
+
+type CodeBlockProps = JSX.IntrinsicElements["code"] & {
+  hash: string,
+  theme_color?: ThemeColor,
+  custom_color: CustomColor,
+  custom_css: CustomCSS,
+};
+
+// Code blocks are compared by the hash of their text instead of their freshly
+// parsed children, so an unchanged block keeps its highlighted DOM and its
+// rendered diagram when another part of the document updates.
+const sameCodeBlock = (prev: CodeBlockProps, next: CodeBlockProps) => (
+  prev.hash === next.hash &&
+  prev.className === next.className &&
+  prev.theme_color === next.theme_color &&
+  prev.custom_color === next.custom_color &&
+  prev.custom_css === next.custom_css
+);
+
+const CodeBlock = memo(function CodeBlock({ children, className, theme_color = "green", custom_color, custom_css }: CodeBlockProps) {
   const isMermaid = className ? className.includes("language-mermaid") : false;
   const isLatex = className ? className.includes("language-latex") : false;
 
@@ -472,12 +693,12 @@ const CodeBlock = ({ children, className }: JSX.IntrinsicElements["code"], theme
         {
           showLatexPreview ? (
             <div className={`flex-grow flex-shrink my-auto`}>
-              <Latex content={children?.toString() ?? ""} theme_color={theme_color} custom_color={custom_color} custom_css={custom_css}/>
+              <Latex content={nodeText(children)} theme_color={theme_color} custom_color={custom_color} custom_css={custom_css}/>
             </div>
           ) : (
             showMermaidPreview ? (
               <div className={`flex-grow flex-shrink my-auto`}>
-                <Mermaid content={children?.toString() ?? ""} theme_color={theme_color} custom_color={custom_color} custom_css={custom_css}/>
+                <Mermaid content={nodeText(children)} theme_color={theme_color} custom_color={custom_color} custom_css={custom_css}/>
               </div>
             ) : (
               <code ref={ref} className={custom_css.code_class.length > 0 ? custom_css.code_class : `${className} flex-grow flex-shrink my-auto`}>
@@ -558,21 +779,32 @@ const CodeBlock = ({ children, className }: JSX.IntrinsicElements["code"], theme
       {children}
     </code>
   );
-};
+}, sameCodeBlock);
 
-const Latex = ({ content, theme_color = "green", custom_color, custom_css }: { content: string, theme_color?: ThemeColor, custom_color: CustomColor, custom_css: CustomCSS }) => {
+const Latex = memo(function Latex({ content, theme_color = "green", custom_color, custom_css }: { content: string, theme_color?: ThemeColor, custom_color: CustomColor, custom_css: CustomCSS }) {
   const [diagram, setDiagram] = useState<string | boolean>(true);
 
   useEffect(() => {
-    try {
-      const generator = new HtmlGenerator({ hyphenate: false });
-      const fragment = parse(content, { generator: generator }).domFragment();
-      setDiagram(fragment.firstElementChild.outerHTML);
-    } catch (error) {
-      console.error(error);
-      setDiagram(false);
-    }
-    Streamlit.setFrameHeight()
+    let cancelled = false;
+    const render = async () => {
+      let html: string | false;
+      try {
+        const { HtmlGenerator, parse } = await loadLatex();
+        const generator = new HtmlGenerator({ hyphenate: false });
+        const fragment = parse(content, { generator: generator }).domFragment();
+        html = fragment.firstElementChild.outerHTML;
+      } catch (error) {
+        console.error(error);
+        html = false;
+      }
+      if (!cancelled) {
+        setDiagram(html);
+      }
+    };
+    render();
+    return () => {
+      cancelled = true;
+    };
   }, [content]);
 
   if (diagram === true) {
@@ -599,27 +831,36 @@ const Latex = ({ content, theme_color = "green", custom_color, custom_css }: { c
       )
     } dangerouslySetInnerHTML={{ __html: diagram ?? "" }} />;
   }
-};
+});
 
-const Mermaid = ({ content, theme_color = "green", custom_color, custom_css }: { content: string, theme_color?: ThemeColor, custom_color: CustomColor, custom_css: CustomCSS }) => {
+const Mermaid = memo(function Mermaid({ content, theme_color = "green", custom_color, custom_css }: { content: string, theme_color?: ThemeColor, custom_color: CustomColor, custom_css: CustomCSS }) {
   const [diagram, setDiagram] = useState<string | boolean>(true);
+  const { theme, themeCSS } = useContext(MermaidConfigContext);
+  // mermaid uses the id in CSS selectors, so keep it to [a-z0-9-]
+  const uid = useId().replace(/[^a-zA-Z0-9]/g, "");
 
   useEffect(() => {
+    let cancelled = false;
     const render = async () => {
-      // Generate a random ID for mermaid to use.
-      const id = `mermaid-svg-${Math.round(Math.random() * 10000000)}`;
-
-      // Confirm the diagram is valid before rendering.
-      if (await mermaid.parse(content, { suppressErrors: true })) {
-        const { svg } = await mermaid.render(id, content);
+      // Derive a stable ID from the diagram, unique per mounted block.
+      const id = `mermaid-svg-${hashString(content)}-${uid}`;
+      let svg: string | false;
+      try {
+        svg = await renderMermaid(id, content, theme, themeCSS);
+      } catch (error) {
+        console.error(error);
+        svg = false;
+      }
+      // a newer render has started while this one was pending
+      if (!cancelled) {
         setDiagram(svg);
-      } else {
-        setDiagram(false);
       }
-      Streamlit.setFrameHeight()
     };
     render();
-  }, [content]);
+    return () => {
+      cancelled = true;
+    };
+  }, [content, theme, themeCSS]);
 
   if (diagram === true) {
     return (
@@ -656,4 +897,4 @@ const Mermaid = ({ content, theme_color = "green", custom_color, custom_css }: {
       )
     } dangerouslySetInnerHTML={{ __html: diagram ?? "" }} />;
   }
-};
+});
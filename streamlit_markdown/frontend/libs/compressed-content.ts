@@ -0,0 +1,43 @@
+import { useEffect, useState } from "react";
+
+// Content over `compress_threshold` bytes arrives as zlib bytes in
+// `content_zlib` (see compression.py), inflated asynchronously by the
+// browser's DecompressionStream.
+
+export async function inflate(data: Uint8Array): Promise<string> {
+  if (typeof DecompressionStream === "undefined") {
+    throw new Error("this browser has no DecompressionStream, turn compress_threshold off");
+  }
+  // "deflate" is the zlib format of Python's zlib.compress
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return await new Response(stream).text();
+}
+
+/**
+ * The inflated content, or `fallback` when it is not compressed, and whether
+ * it is the content of `data` yet. The previous content stays on screen while
+ * newer bytes are inflated.
+ */
+export function useCompressedContent(data: Uint8Array | undefined, fallback: string): [string, boolean] {
+  const [inflated, setInflated] = useState<{ data?: Uint8Array; content: string }>({ content: "" });
+  useEffect(() => {
+    if (data === undefined) {
+      return;
+    }
+    let cancelled = false;
+    inflate(data).then((content) => {
+      if (!cancelled) {
+        setInflated({ data, content });
+      }
+    }).catch((error) => {
+      console.error(error);
+      if (!cancelled) {
+        setInflated({ data, content: `> ${error}` });
+      }
+    });
+    return () => {
+      cancelled = true;
+    };
+  }, [data]);
+  return data === undefined ? [fallback, true] : [inflated.content, inflated.data === data];
+}
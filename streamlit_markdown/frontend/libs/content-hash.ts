@@ -0,0 +1,35 @@
+import { Children, isValidElement, ReactNode } from "react";
+
+/**
+ * Helper function to hash a string (32-bit FNV-1a), as a short base-36 key
+ */
+export function hashString(text: string): string {
+  let hash = 0x811c9dc5;
+  for (let i = 0; i < text.length; i++) {
+    hash ^= text.charCodeAt(i);
+    hash = Math.imul(hash, 0x01000193);
+  }
+  return (hash >>> 0).toString(36);
+}
+
+/**
+ * Helper function to get the text content of rendered React children
+ */
+export function nodeText(node: ReactNode): string {
+  let text = "";
+  Children.forEach(node, (child) => {
+    if (typeof child === "string" || typeof child === "number") {
+      text += child;
+    } else if (isValidElement<{ children?: ReactNode }>(child)) {
+      text += nodeText(child.props.children);
+    }
+  });
+  return text;
+}
+
+/**
+ * Key of a prerendered formula, same as `math_key` in math_prerender.py
+ */
+export function mathKey(formula: string, display: boolean): string {
+  return hashString((display ? "display:" : "inline:") + formula.trim());
+}
@@ -0,0 +1,76 @@
+import { Streamlit } from "streamlit-component-lib";
+
+// Every frame height update of the iframe goes through here. StreamlitProvider
+// asks for one after each render, and the body is observed for diagrams,
+// math and images that change size later. Requests are coalesced into one
+// measurement per animation frame, and the height is only posted to Streamlit
+// when it changed, so streaming doesn't reflow the parent page on every token.
+
+type Listener = (height: number) => void;
+
+// rAF doesn't fire while the iframe is not painted, measure anyway after this
+const FALLBACK_DELAY_MS = 100;
+
+const listeners = new Set<Listener>();
+let post: ((height?: number) => void) | undefined;
+let frame: number | undefined;
+let fallback: ReturnType<typeof setTimeout> | undefined;
+let lastHeight: number | undefined;
+
+function measure() {
+  if (frame !== undefined) {
+    cancelAnimationFrame(frame);
+  }
+  clearTimeout(fallback);
+  frame = undefined;
+  fallback = undefined;
+  setHeight(document.body.scrollHeight);
+}
+
+function setHeight(height: number) {
+  if (height === lastHeight) {
+    return;
+  }
+  lastHeight = height;
+  post!(height);
+  listeners.forEach((listener) => listener(height));
+}
+
+/**
+ * Post the height of the document before the next paint, if it changed.
+ */
+export function requestFrameHeight() {
+  if (frame === undefined) {
+    frame = requestAnimationFrame(measure);
+    fallback = setTimeout(measure, FALLBACK_DELAY_MS);
+  }
+}
+
+/**
+ * Route `Streamlit.setFrameHeight` through the manager and watch the body
+ * for size changes. Once per iframe, before the first render.
+ */
+export function installFrameHeightManager() {
+  if (post !== undefined || typeof window === "undefined") {
+    return;
+  }
+  post = Streamlit.setFrameHeight;
+  Streamlit.setFrameHeight = (height?: number) => {
+    if (height === undefined) {
+      requestFrameHeight();
+    } else {
+      setHeight(height);
+    }
+  };
+  if (typeof ResizeObserver !== "undefined") {
+    new ResizeObserver(requestFrameHeight).observe(document.body);
+  }
+}
+
+/**
+ * Called with every height that is posted, returns the unsubscribe function.
+ */
+export function onFrameHeight(listener: Listener): () => void {
+  listeners.add(listener);
+  return () => listeners.delete(listener);
+}
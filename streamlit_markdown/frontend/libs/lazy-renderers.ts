@@ -0,0 +1,44 @@
+import { RehypePluginName } from "@/libs/rehype-plugins";
+
+// The styles of the lazy rehype plugins and latex.js are split out of the
+// main bundle too, so plain-text messages paint without waiting on them.
+
+const styles: Partial<Record<RehypePluginName, Promise<unknown>>> = {};
+
+const styleLoaders: Record<RehypePluginName, () => Promise<unknown>> = {
+  // `rehype-katex` does not import the CSS for you
+  // @ts-ignore global CSS is split into its own chunk by next
+  katex: () => import("katex/dist/katex.min.css"),
+  // @ts-ignore
+  highlight: () => import("highlight.js/styles/green-screen.css"),
+};
+
+/**
+ * The CSS of a rehype plugin, loaded alongside the plugin, or on its own
+ * when the plugin runs in the markdown worker.
+ */
+export function loadRehypeStyles(name: RehypePluginName): Promise<unknown> {
+  if (styles[name] === undefined) {
+    styles[name] = styleLoaders[name]().catch((error) => {
+      delete styles[name];
+      throw error;
+    });
+  }
+  return styles[name]!;
+}
+
+let latex: Promise<any> | undefined;
+
+/**
+ * latex.js, loaded on the first `latex` code block.
+ */
+export function loadLatex(): Promise<{ HtmlGenerator: any, parse: any }> {
+  if (latex === undefined) {
+    // @ts-expect-error
+    latex = import("latex.js").catch((error) => {
+      latex = undefined;
+      throw error;
+    });
+  }
+  return latex;
+}
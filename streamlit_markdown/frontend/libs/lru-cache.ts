@@ -0,0 +1,209 @@
+import { hashString } from "@/libs/content-hash";
+
+export type StorageLimits = {
+  // the stored entries take at most this many characters in total
+  maxChars?: number;
+  // larger entries are only kept in memory
+  maxEntryChars?: number;
+};
+
+// storage id (hash of the cache key), stored size in characters
+type IndexEntry = [string, number];
+
+/**
+ * A small least-recently-used cache with hit/miss counters.
+ *
+ * When `storageKey` is set, entries are persisted in sessionStorage so they
+ * survive iframe remounts within the same browser tab. Every entry is stored
+ * under its own key, next to a small index of the stored entries and their
+ * sizes from least to most recently used, so storing one only writes that
+ * entry and the index. Nothing is read before the first lookup, and a stored
+ * entry is only parsed when it is looked up. The index is read again on
+ * every write, since the other iframes of the tab update it too.
+ */
+export class LruCache<V> {
+  hits = 0;
+  misses = 0;
+  private entries = new Map<string, V>();
+  private legacyRemoved = false;
+
+  constructor(public maxSize: number, private storageKey?: string, private limits: StorageLimits = {}) {}
+
+  get size(): number {
+    return this.entries.size;
+  }
+
+  get(key: string): V | undefined {
+    let value = this.entries.get(key);
+    if (value === undefined) {
+      value = this.load(key);
+      if (value === undefined) {
+        this.misses++;
+        return undefined;
+      }
+    }
+    // move to the most recently used position
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    this.evict();
+    this.hits++;
+    return value;
+  }
+
+  set(key: string, value: V) {
+    this.entries.delete(key);
+    this.entries.set(key, value);
+    this.evict();
+    this.save([[key, value]]);
+  }
+
+  /**
+   * Add the entries that are not cached yet, given from least to most
+   * recently used, and write the index once.
+   */
+  merge(entries: Array<[string, V]>) {
+    const added = entries.filter(([key]) => !this.entries.has(key));
+    added.forEach(([key, value]) => this.entries.set(key, value));
+    if (added.length > 0) {
+      this.evict();
+      this.save(added);
+    }
+  }
+
+  resize(maxSize: number) {
+    if (maxSize !== this.maxSize) {
+      this.maxSize = maxSize;
+      this.evict();
+      this.save([]);
+    }
+  }
+
+  /**
+   * The entries in memory from least to most recently used, without touching the counters.
+   */
+  items(): Array<[string, V]> {
+    return Array.from(this.entries.entries());
+  }
+
+  clear() {
+    this.entries.clear();
+    this.hits = 0;
+    this.misses = 0;
+    const store = this.store();
+    if (store !== undefined) {
+      this.readIndex(store).forEach(([id]) => store.removeItem(this.entryKey(id)));
+      store.removeItem(this.indexKey());
+    }
+  }
+
+  stats() {
+    return { size: this.size, maxSize: this.maxSize, hits: this.hits, misses: this.misses };
+  }
+
+  private evict() {
+    while (this.entries.size > Math.max(this.maxSize, 0)) {
+      const oldest = this.entries.keys().next().value as string;
+      this.entries.delete(oldest);
+    }
+  }
+
+  private store(): Storage | undefined {
+    return this.storageKey && typeof sessionStorage !== "undefined" ? sessionStorage : undefined;
+  }
+
+  private indexKey(): string {
+    return `${this.storageKey}:index`;
+  }
+
+  private entryKey(id: string): string {
+    return `${this.storageKey}:${id}`;
+  }
+
+  private readIndex(store: Storage): IndexEntry[] {
+    try {
+      const stored = store.getItem(this.indexKey());
+      return stored ? JSON.parse(stored) : [];
+    } catch (error) {
+      console.warn(error);
+      return [];
+    }
+  }
+
+  private writeIndex(store: Storage, index: IndexEntry[]) {
+    try {
+      store.setItem(this.indexKey(), JSON.stringify(index));
+    } catch (error) {
+      console.warn(error);
+    }
+  }
+
+  private load(key: string): V | undefined {
+    const store = this.store();
+    if (store === undefined) {
+      return undefined;
+    }
+    const id = hashString(key);
+    const index = this.readIndex(store);
+    const position = index.findIndex(([stored]) => stored === id);
+    if (position < 0) {
+      return undefined;
+    }
+    let value: V | undefined;
+    try {
+      const stored = store.getItem(this.entryKey(id));
+      // the key is stored along, two keys may have the same hash
+      const [storedKey, storedValue] = stored ? JSON.parse(stored) : [];
+      value = storedKey === key ? storedValue : undefined;
+    } catch (error) {
+      console.warn(error);
+    }
+    if (value !== undefined) {
+      // now the most recently used
+      index.push(...index.splice(position, 1));
+      this.writeIndex(store, index);
+    }
+    return value;
+  }
+
+  private save(entries: Array<[string, V]>) {
+    const store = this.store();
+    if (store === undefined) {
+      return;
+    }
+    if (!this.legacyRemoved) {
+      // all the entries in one value, as stored by earlier versions
+      store.removeItem(this.storageKey!);
+      this.legacyRemoved = true;
+    }
+    const { maxChars, maxEntryChars } = this.limits;
+    let index = this.readIndex(store);
+    for (const [key, value] of entries) {
+      const id = hashString(key);
+      index = index.filter(([stored]) => stored !== id);
+      const serialized = JSON.stringify([key, value]);
+      if (this.maxSize <= 0 || (maxEntryChars !== undefined && serialized.length > maxEntryChars)) {
+        store.removeItem(this.entryKey(id));
+        continue;
+      }
+      let total = index.reduce((sum, [, size]) => sum + size, serialized.length);
+      while (index.length > 0 && (index.length >= this.maxSize || (maxChars !== undefined && total > maxChars))) {
+        const [oldest, size] = index.shift() as IndexEntry;
+        store.removeItem(this.entryKey(oldest));
+        total -= size;
+      }
+      try {
+        store.setItem(this.entryKey(id), serialized);
+        index.push([id, serialized.length]);
+      } catch (error) {
+        // most likely over quota, the in-memory cache keeps working
+        console.warn(error);
+      }
+    }
+    // a smaller maxSize also applies to what is stored
+    while (index.length > Math.max(this.maxSize, 0)) {
+      const [oldest] = index.shift() as IndexEntry;
+      store.removeItem(this.entryKey(oldest));
+    }
+    this.writeIndex(store, index);
+  }
+}
@@ -0,0 +1,56 @@
+const FENCE = /^ {0,3}(`{3,}|~{3,}|\$\$)/;
+const LIST_ITEM = /^ {0,3}([-+*]|\d{1,9}[.)])(\s|$)/;
+
+/**
+ * Split markdown into top-level blocks that can be parsed independently.
+ *
+ * A block ends at a blank line followed by a line that starts a new top-level
+ * block: not indented, not a list item continuing the current list, and not
+ * inside a fenced code or `$$` math block. Joining the blocks gives back the
+ * original content.
+ */
+export function splitMarkdownBlocks(content: string): string[] {
+  const blocks: string[] = [];
+  let current: string[] = [];
+  let fence: string | null = null;
+  let hasContent = false;
+  let afterBlank = false;
+  let inList = false;
+
+  for (const line of content.split("\n")) {
+    if (fence !== null) {
+      current.push(line);
+      if (line.trim().startsWith(fence)) {
+        fence = null;
+      }
+      continue;
+    }
+    if (line.trim().length === 0) {
+      current.push(line);
+      afterBlank = hasContent;
+      continue;
+    }
+    const topLevel = !/^\s/.test(line);
+    const listItem = topLevel && LIST_ITEM.test(line);
+    if (afterBlank && topLevel && !(listItem && inList)) {
+      blocks.push(current.join("\n"));
+      current = [];
+    }
+    if (topLevel) {
+      inList = listItem;
+    }
+    afterBlank = false;
+    hasContent = true;
+    current.push(line);
+    const match = FENCE.exec(line);
+    if (match) {
+      fence = match[1];
+      // `$$y=f(x)$$` on a single line opens and closes the block
+      if (fence === "$$" && line.trim().length > 2 && line.trim().endsWith("$$")) {
+        fence = null;
+      }
+    }
+  }
+  blocks.push(current.join("\n"));
+  return blocks;
+}
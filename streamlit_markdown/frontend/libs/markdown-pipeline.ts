@@ -0,0 +1,157 @@
+import { Element, ElementContent, Root } from "hast";
+import remarkGfm from "remark-gfm";
+import remarkMath from "remark-math";
+import remarkParse from "remark-parse";
+import remarkRehype from "remark-rehype";
+import { Plugin, unified } from "unified";
+import { visit } from "unist-util-visit";
+import { hashString, mathKey } from "@/libs/content-hash";
+import { RehypePlugin, RehypePlugins } from "@/libs/rehype-plugins";
+import { HighlightedCode, SharedMath, sharedCacheEnabled, sharedGet, sharedSet } from "@/libs/shared-render-cache";
+
+// The markdown -> hast half of the pipeline. It has no React in it, so it
+// runs the same on the main thread and in the markdown worker.
+
+export type PrerenderedMath = Record<string, string>;
+
+// Mixing arbitrary Markdown + Capsize leads to lots of challenges
+// with paragraphs and list items. This replaces paragraphs inside
+// list items into divs to avoid nesting Capsize.
+const rehypeListItemParagraphToDiv: Plugin<[], Root> = () => {
+  return (tree) => {
+    visit(tree, "element", (element) => {
+      if (element.tagName === "li") {
+        element.children = element.children.map((child) => {
+          if (child.type === "element" && child.tagName === "p") {
+            child.tagName = "div";
+          }
+          return child;
+        });
+      }
+    });
+    return tree;
+  };
+};
+
+// Math prerendered in Python is taken out of rehype-katex's way and turned
+// into `math-prerendered` elements, which splice in the prerendered HTML.
+const rehypePrerenderedMath: Plugin<[{ current: PrerenderedMath }], Root> = (prerendered) => {
+  return (tree) => {
+    visit(tree, "element", (element) => {
+      const className = element.properties?.className;
+      if (!Array.isArray(className)) {
+        return;
+      }
+      let display = className.includes("math-display");
+      if (!display && !className.includes("math-inline")) {
+        return;
+      }
+      const formula = element.children.map((child) => child.type === "text" ? child.value : "").join("");
+      // Python prerenders `$$...$$` within a line as display math, remark-math as inline math
+      if (!display && prerendered.current[mathKey(formula, false)] === undefined) {
+        display = prerendered.current[mathKey(formula, true)] !== undefined;
+      }
+      if (prerendered.current[mathKey(formula, display)] !== undefined) {
+        element.tagName = "math-prerendered";
+        element.properties = { className: [display ? "math-prerendered-display" : "math-prerendered-inline"] };
+      }
+    });
+    return tree;
+  };
+};
+
+const textOf = (element: Element) => element.children.map((child) => child.type === "text" ? child.value : "").join("");
+
+type SharedRenders = {
+  // elements filled from the cache, with the className to restore
+  hits: Array<[Element, string[]]>;
+  // elements left to the plugins, stored once they ran
+  misses: Array<{ element: Element; kind: "math" | "highlight"; key: string; source: string }>;
+};
+
+// With the shared render cache, math and code blocks another iframe already
+// rendered are filled in and hidden from rehype-katex and rehype-highlight.
+// The cache entries keep their source, so a hash collision is a miss.
+const rehypeSharedCacheLookup: Plugin<[RehypePlugins], Root> = (plugins) => {
+  return (tree, file) => {
+    if (!sharedCacheEnabled()) {
+      return;
+    }
+    const renders: SharedRenders = { hits: [], misses: [] };
+    visit(tree, "element", (element, _, parent) => {
+      const className = element.properties?.className;
+      if (!Array.isArray(className)) {
+        return;
+      }
+      const display = className.includes("math-display");
+      if (plugins.katex && (display || className.includes("math-inline"))) {
+        const source = textOf(element);
+        const key = mathKey(source, display);
+        const cached = sharedGet<SharedMath>("math", key);
+        if (cached?.source === source) {
+          renders.hits.push([element, className as string[]]);
+          element.properties!.className = className.filter((name) => name !== "math-display" && name !== "math-inline");
+          element.children = cached.children;
+        } else {
+          renders.misses.push({ element, kind: "math", key, source });
+        }
+        return;
+      }
+      const language = className.find((name) => String(name).startsWith("language-"));
+      if (plugins.highlight && language && element.tagName === "code" && parent?.type === "element" && parent.tagName === "pre") {
+        const source = `${language}\n${textOf(element)}`;
+        const key = hashString(source);
+        const cached = sharedGet<HighlightedCode>("highlight", key);
+        if (cached?.source === source) {
+          renders.hits.push([element, cached.className]);
+          element.properties!.className = ["no-highlight", ...cached.className];
+          element.children = cached.children;
+        } else {
+          renders.misses.push({ element, kind: "highlight", key, source });
+        }
+      }
+    });
+    file.data.sharedRenders = renders;
+  };
+};
+
+const rehypeSharedCacheStore: Plugin<[], Root> = () => {
+  return (tree, file) => {
+    const renders = file.data.sharedRenders as SharedRenders | undefined;
+    if (renders === undefined) {
+      return;
+    }
+    delete file.data.sharedRenders;
+    renders.hits.forEach(([element, className]) => {
+      element.properties!.className = className;
+    });
+    renders.misses.forEach(({ element, kind, key, source }) => {
+      const className = (element.properties?.className ?? []) as string[];
+      if (kind === "math") {
+        sharedSet(kind, key, { source, children: element.children } as SharedMath);
+      } else if (className.includes("hljs")) {
+        sharedSet(kind, key, { source, className, children: element.children } as HighlightedCode);
+      }
+    });
+  };
+};
+
+// Stands in for a lazy plugin that is not loaded yet
+const rehypeNoop: RehypePlugin = () => undefined;
+
+export const createHastProcessor = (
+  prerendered: { current: PrerenderedMath } = { current: {} },
+  plugins: RehypePlugins = {},
+) => {
+  return unified()
+    .use(remarkParse)
+    .use(remarkGfm)
+    .use(remarkRehype)
+    .use(remarkMath)
+    .use(rehypePrerenderedMath, prerendered)
+    .use(rehypeSharedCacheLookup, plugins)
+    .use(plugins.katex ?? rehypeNoop)
+    .use(plugins.highlight ?? rehypeNoop, { ignoreMissing: true })
+    .use(rehypeSharedCacheStore)
+    .use(rehypeListItemParagraphToDiv);
+};
@@ -0,0 +1,136 @@
+import { Root } from "hast";
+import { PrerenderedMath } from "@/libs/markdown-pipeline";
+import { recordPhase } from "@/libs/render-metrics";
+import { sharedCacheEnabled } from "@/libs/shared-render-cache";
+import type { ParseRequest, ParseResponse } from "@/workers/markdown.worker";
+
+export type ParseResult = {
+  sources: string[];
+  trees: Root[];
+  plugins: string;
+};
+
+type Job = {
+  channel: string;
+  sources: string[];
+  prerendered: PrerenderedMath;
+  start?: number;
+};
+
+// One worker per iframe, shared by all the documents in it
+let worker: Worker | undefined;
+let inFlight: Job | undefined;
+let nextId = 0;
+// At most one pending job per channel: a newer document replaces the pending
+// one, so parses made stale by streaming never reach the worker.
+const pending = new Map<string, Job>();
+const listeners = new Map<string, Listener>();
+// once the worker failed, every document is parsed on the main thread
+let failed = false;
+
+type Listener = {
+  onResult: (result: ParseResult) => void;
+  onError: () => void;
+};
+
+export function workerSupported(): boolean {
+  return !failed && typeof window !== "undefined" && typeof Worker !== "undefined";
+}
+
+function fail(error: unknown) {
+  console.error(error);
+  failed = true;
+  worker?.terminate();
+  worker = undefined;
+  inFlight = undefined;
+  pending.clear();
+  const waiting = Array.from(listeners.values());
+  listeners.clear();
+  waiting.forEach(({ onError }) => onError());
+}
+
+function getWorker(): Worker {
+  if (worker === undefined) {
+    worker = new Worker(new URL("../workers/markdown.worker.ts", import.meta.url));
+    worker.onmessage = (event: MessageEvent<ParseResponse>) => {
+      const job = inFlight!;
+      inFlight = undefined;
+      // wall time until the trees are back, most of it off the main thread
+      recordPhase("parse", performance.now() - job.start!);
+      const { trees, plugins, error } = event.data;
+      const listener = listeners.get(job.channel);
+      if (error !== undefined) {
+        console.error(error);
+        // this document is parsed on the main thread, the worker keeps serving the others
+        listener?.onError();
+      } else if (listener !== undefined) {
+        listener.onResult({ sources: job.sources, trees: trees!, plugins: plugins! });
+      }
+      next();
+    };
+    // the worker script failed to load or threw outside of a parse
+    worker.onerror = (event: ErrorEvent) => {
+      event.preventDefault();
+      fail(event.message || event);
+    };
+    // a response could not be deserialized
+    worker.onmessageerror = (event: MessageEvent) => fail(event);
+  }
+  return worker;
+}
+
+function next() {
+  if (inFlight !== undefined) {
+    return;
+  }
+  const [channel, job] = pending.entries().next().value ?? [];
+  if (job === undefined) {
+    return;
+  }
+  pending.delete(channel);
+  job.start = performance.now();
+  inFlight = job;
+  const request: ParseRequest = {
+    id: nextId++,
+    sources: job.sources,
+    prerendered: job.prerendered,
+    sharedCache: sharedCacheEnabled(),
+  };
+  try {
+    getWorker().postMessage(request);
+  } catch (error) {
+    // e.g. workers are blocked by a content security policy
+    fail(error);
+  }
+}
+
+/**
+ * Parse markdown blocks to hast in the worker.
+ *
+ * A parse that is already running in the worker can't be interrupted, its
+ * result is still delivered since it is newer than what is on screen. Jobs
+ * that are still waiting are dropped when the same channel asks again.
+ *
+ * `onError` is called when the worker can't parse the document, which must
+ * then be parsed on the main thread.
+ */
+export function parseInWorker(
+  channel: string,
+  sources: string[],
+  prerendered: PrerenderedMath,
+  onResult: (result: ParseResult) => void,
+  onError: () => void
+) {
+  if (failed) {
+    onError();
+    return;
+  }
+  listeners.set(channel, { onResult, onError });
+  pending.set(channel, { channel, sources, prerendered });
+  next();
+}
+
+export function cancelWorkerParse(channel: string) {
+  pending.delete(channel);
+  listeners.delete(channel);
+}
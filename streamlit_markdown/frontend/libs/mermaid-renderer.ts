@@ -0,0 +1,60 @@
+import { LruCache } from "@/libs/lru-cache";
+import { recordPhase } from "@/libs/render-metrics";
+import { registerSharedCache, sharedSet } from "@/libs/shared-render-cache";
+
+export const DEFAULT_MERMAID_CACHE_SIZE = 64;
+
+/**
+ * Rendered SVGs keyed by (diagram source, mermaid theme, mermaid theme CSS).
+ * Inspect `window.__streamlitMarkdownMermaidCache.stats()` for hit/miss counters.
+ */
+export const mermaidCache = new LruCache<string>(DEFAULT_MERMAID_CACHE_SIZE, "streamlit-markdown:mermaid-svg");
+
+registerSharedCache("mermaid", mermaidCache);
+
+if (typeof window !== "undefined") {
+  (window as any).__streamlitMarkdownMermaidCache = mermaidCache;
+}
+
+// mermaid is the largest dependency, it is only fetched for the first diagram
+let mermaidModule: Promise<typeof import("mermaid")> | undefined;
+
+function loadMermaid() {
+  if (mermaidModule === undefined) {
+    mermaidModule = import("mermaid").catch((error) => {
+      mermaidModule = undefined;
+      throw error;
+    });
+  }
+  return mermaidModule;
+}
+
+// mermaid's config is global, so renders run one after another with their own theme
+let pending: Promise<unknown> = Promise.resolve();
+
+/**
+ * Render a diagram to SVG, or `false` if it is not a valid diagram.
+ */
+export function renderMermaid(id: string, content: string, theme: string, themeCSS: string): Promise<string | false> {
+  const key = JSON.stringify([content, theme, themeCSS]);
+  const cached = mermaidCache.get(key);
+  if (cached !== undefined) {
+    return Promise.resolve(cached);
+  }
+  const result = pending.then(async () => {
+    const { default: mermaid } = await loadMermaid();
+    const start = performance.now();
+    mermaid.initialize({ startOnLoad: false, theme: theme as any, themeCSS });
+    // Confirm the diagram is valid before rendering.
+    if (!(await mermaid.parse(content, { suppressErrors: true }))) {
+      return false;
+    }
+    const { svg } = await mermaid.render(id, content);
+    recordPhase("mermaid", performance.now() - start);
+    // invalid diagrams are not cached, they are usually still being streamed
+    sharedSet("mermaid", key, svg);
+    return svg;
+  });
+  pending = result.catch(() => undefined);
+  return result;
+}
@@ -0,0 +1,62 @@
+import { Root } from "hast";
+import { Plugin } from "unified";
+
+// KaTeX and highlight.js are split out of the main bundle and only fetched
+// once a document needs them. This module has no CSS, so the markdown
+// worker can use it too; the styles are loaded by `lazy-renderers`.
+
+export type RehypePlugin = Plugin<any[], Root>;
+
+export type RehypePlugins = {
+  katex?: RehypePlugin;
+  highlight?: RehypePlugin;
+};
+
+export type RehypePluginName = keyof RehypePlugins;
+
+// A run of dollars closed by a run of the same length, neither escaped,
+// like remark-math parses it. A lone "$5" doesn't load KaTeX.
+const MATH = /(?:^|[^\\$])(\$+)(?!\$)[\s\S]*?[^\\$]\1(?!\$)/;
+const CODE_FENCE = /^ {0,3}(`{3,}|~{3,})/m;
+
+const loaded: RehypePlugins = {};
+const loading: Partial<Record<RehypePluginName, Promise<void>>> = {};
+
+const loaders: Record<RehypePluginName, () => Promise<RehypePlugin>> = {
+  katex: async () => (await import("rehype-katex")).default as RehypePlugin,
+  highlight: async () => (await import("rehype-highlight")).default as RehypePlugin,
+};
+
+/**
+ * The plugins loaded so far, as a new object so it can be used as React state.
+ */
+export function loadedRehypePlugins(): RehypePlugins {
+  return { ...loaded };
+}
+
+/**
+ * The plugins a document needs: KaTeX for math, highlight.js for code blocks.
+ */
+export function requiredRehypePlugins(content: string): RehypePluginName[] {
+  const required: RehypePluginName[] = [];
+  if (MATH.test(content)) {
+    required.push("katex");
+  }
+  if (CODE_FENCE.test(content)) {
+    required.push("highlight");
+  }
+  return required;
+}
+
+export function loadRehypePlugin(name: RehypePluginName): Promise<void> {
+  if (loading[name] === undefined) {
+    loading[name] = loaders[name]().then((plugin) => {
+      loaded[name] = plugin;
+    }).catch((error) => {
+      // allow a retry on the next render
+      delete loading[name];
+      throw error;
+    });
+  }
+  return loading[name]!;
+}
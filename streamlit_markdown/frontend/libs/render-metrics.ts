@@ -0,0 +1,100 @@
+import { Streamlit } from "streamlit-component-lib";
+import { onFrameHeight } from "@/libs/frame-height";
+import { RehypePlugin } from "@/libs/rehype-plugins";
+
+// Opt-in timings for `st_markdown(instrument=True)`. They are reported back
+// to Python as the component value, which reruns the script, so a report is
+// only sent once new work was measured, never for a rerender alone.
+
+export type PhaseName = "parse" | "katex" | "highlight" | "mermaid" | "commit";
+
+export type PhaseMetrics = {
+  count: number;
+  total_ms: number;
+  last_ms: number;
+};
+
+export type RenderMetrics = {
+  seq: number;
+  phases: Record<PhaseName, PhaseMetrics>;
+  frame_height: { updates: number; height: number | null };
+};
+
+const REPORT_DELAY_MS = 250;
+
+const emptyPhase = (): PhaseMetrics => ({ count: 0, total_ms: 0, last_ms: 0 });
+
+const metrics: RenderMetrics = {
+  seq: 0,
+  phases: {
+    parse: emptyPhase(),
+    katex: emptyPhase(),
+    highlight: emptyPhase(),
+    mermaid: emptyPhase(),
+    commit: emptyPhase(),
+  },
+  frame_height: { updates: 0, height: null },
+};
+
+let enabled = false;
+let reportTimer: ReturnType<typeof setTimeout> | undefined;
+
+export function renderMetricsEnabled(): boolean {
+  return enabled;
+}
+
+/**
+ * Start measuring, for the whole iframe. The frame heights posted to
+ * Streamlit are counted from here on.
+ */
+export function enableRenderMetrics() {
+  if (enabled) {
+    return;
+  }
+  enabled = true;
+  onFrameHeight((height) => {
+    metrics.frame_height.updates++;
+    metrics.frame_height.height = height;
+  });
+}
+
+export function recordPhase(name: PhaseName, ms: number) {
+  if (!enabled) {
+    return;
+  }
+  const phase = metrics.phases[name];
+  phase.count++;
+  phase.total_ms += ms;
+  phase.last_ms = ms;
+  scheduleReport();
+}
+
+function scheduleReport() {
+  // debounced, so a stream of updates sends one report once it settles
+  clearTimeout(reportTimer);
+  reportTimer = setTimeout(() => {
+    metrics.seq++;
+    Streamlit.setComponentValue({ metrics: JSON.parse(JSON.stringify(metrics)) });
+  }, REPORT_DELAY_MS);
+}
+
+/**
+ * A rehype plugin whose transform is timed as `name` once metrics are enabled.
+ */
+export function timedPlugin(name: PhaseName, plugin: RehypePlugin): RehypePlugin {
+  return function (this: any, ...options: any[]) {
+    const transform = (plugin as any).apply(this, options);
+    if (typeof transform !== "function") {
+      return transform;
+    }
+    return function (this: any, ...args: any[]) {
+      if (!enabled) {
+        return transform.apply(this, args);
+      }
+      const start = performance.now();
+      const result = transform.apply(this, args);
+      recordPhase(name, performance.now() - start);
+      return result;
+    };
+  } as RehypePlugin;
+}
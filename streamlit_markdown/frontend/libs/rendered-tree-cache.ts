@@ -0,0 +1,56 @@
+import { Root } from "hast";
+import { visit } from "unist-util-visit";
+import { LruCache } from "@/libs/lru-cache";
+import { requiredRehypePlugins } from "@/libs/rehype-plugins";
+
+// With `st_markdown(cached=True)`, Python sends a hash of the content and
+// the options it is rendered with. The parsed trees of such a document are
+// kept by that hash in sessionStorage, so a remounted iframe, or another one
+// of the tab, showing the same static document skips parsing, KaTeX and
+// highlight.js and only converts the trees to React.
+
+export type RenderedTrees = {
+  sources: string[];
+  trees: Root[];
+  // the plugins the trees were built with
+  plugins: string;
+};
+
+export const DEFAULT_RENDERED_TREE_CACHE_SIZE = 32;
+// sessionStorage holds about 5M characters per origin, shared with the other caches
+export const MAX_RENDERED_TREES_CHARS = 2_000_000;
+// larger documents are only kept in memory
+export const MAX_RENDERED_TREE_CHARS = 500_000;
+
+// created for the first document with a hash
+let renderedTrees: LruCache<RenderedTrees> | undefined;
+
+function cache(): LruCache<RenderedTrees> {
+  if (renderedTrees === undefined) {
+    renderedTrees = new LruCache<RenderedTrees>(DEFAULT_RENDERED_TREE_CACHE_SIZE, "streamlit-markdown:rendered-trees", {
+      maxChars: MAX_RENDERED_TREES_CHARS,
+      maxEntryChars: MAX_RENDERED_TREE_CHARS,
+    });
+  }
+  return renderedTrees;
+}
+
+/**
+ * The trees of the document with this hash, if they were built with every plugin it needs.
+ */
+export function getRenderedTrees(hash: string, content: string): RenderedTrees | undefined {
+  const entry = cache().get(hash);
+  if (entry === undefined) {
+    return undefined;
+  }
+  const plugins = entry.plugins.split(",");
+  return requiredRehypePlugins(content).every((name) => plugins.includes(name)) ? entry : undefined;
+}
+
+export function setRenderedTrees(hash: string, entry: RenderedTrees) {
+  // positions are not used to render and would double the stored size
+  entry.trees.forEach((tree) => visit(tree, (node) => {
+    delete node.position;
+  }));
+  cache().set(hash, entry);
+}
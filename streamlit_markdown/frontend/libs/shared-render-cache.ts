@@ -0,0 +1,134 @@
+import { ElementContent } from "hast";
+import { LruCache } from "@/libs/lru-cache";
+
+// With `shared_cache`, the iframes of a browser tab (and their markdown
+// workers) share what they rendered over a BroadcastChannel: mermaid SVGs,
+// highlighted code and typeset math, keyed by a hash of their source. A
+// diagram or snippet repeated across messages is then rendered once per tab.
+
+export type SharedCacheKind = "mermaid" | "highlight" | "math";
+
+export type HighlightedCode = {
+  source: string;
+  className: string[];
+  children: ElementContent[];
+};
+
+export type SharedMath = {
+  source: string;
+  children: ElementContent[];
+};
+
+// One member of the channel, the leader, answers the syncs of new members.
+// A new member that gets no answer in time, e.g. because the leader's iframe
+// was removed, claims the lead. The newest claim wins, concurrent claims are
+// settled by id, so every member agrees on the same leader.
+type Claim = { id: string; since: number };
+
+type Message =
+  | { type: "set"; kind: SharedCacheKind; key: string; value: unknown }
+  // a new iframe asks for what the others rendered so far
+  | { type: "sync"; id: string }
+  | { type: "entries"; id: string; leader: Claim; entries: Partial<Record<SharedCacheKind, Array<[string, unknown]>>> }
+  | { type: "lead"; leader: Claim };
+
+const CHANNEL_NAME = "streamlit-markdown:render-cache";
+// how long a new member waits for the leader before claiming the lead
+const SYNC_TIMEOUT_MS = 200;
+
+export const DEFAULT_SHARED_CACHE_SIZE = 256;
+
+const caches: Record<SharedCacheKind, LruCache<any>> = {
+  mermaid: new LruCache<string>(DEFAULT_SHARED_CACHE_SIZE),
+  highlight: new LruCache<HighlightedCode>(DEFAULT_SHARED_CACHE_SIZE),
+  math: new LruCache<SharedMath>(DEFAULT_SHARED_CACHE_SIZE),
+};
+
+let channel: BroadcastChannel | undefined;
+const self: Claim = { id: Math.random().toString(36).slice(2), since: 0 };
+let leader: Claim | undefined;
+let syncTimeout: ReturnType<typeof setTimeout> | undefined;
+
+function follow(claim: Claim) {
+  if (leader === undefined || claim.since > leader.since || (claim.since === leader.since && claim.id > leader.id)) {
+    leader = claim;
+  }
+}
+
+/**
+ * Use `cache` for `kind`, e.g. the persistent mermaid cache.
+ */
+export function registerSharedCache(kind: SharedCacheKind, cache: LruCache<any>) {
+  caches[kind] = cache;
+}
+
+export function sharedCacheEnabled(): boolean {
+  return channel !== undefined;
+}
+
+/**
+ * Join the tab's render cache, once per iframe or worker.
+ */
+export function enableSharedCache() {
+  if (channel !== undefined || typeof BroadcastChannel === "undefined") {
+    return;
+  }
+  channel = new BroadcastChannel(CHANNEL_NAME);
+  channel.onmessage = (event: MessageEvent<Message>) => {
+    const message = event.data;
+    if (message.type === "set") {
+      caches[message.kind].set(message.key, message.value);
+    } else if (message.type === "sync") {
+      if (leader === self) {
+        reply(message.id);
+      }
+    } else if (message.type === "entries") {
+      follow(message.leader);
+      if (message.id === self.id) {
+        clearTimeout(syncTimeout);
+        for (const [kind, entries] of Object.entries(message.entries)) {
+          // older entries first, so the LRU order is kept, and saved once per cache
+          caches[kind as SharedCacheKind].merge(entries!);
+        }
+      }
+    } else if (message.type === "lead") {
+      follow(message.leader);
+    }
+  };
+  channel.postMessage({ type: "sync", id: self.id } as Message);
+  syncTimeout = setTimeout(claimLead, SYNC_TIMEOUT_MS);
+}
+
+function claimLead() {
+  self.since = Date.now();
+  follow(self);
+  channel?.postMessage({ type: "lead", leader: self } as Message);
+}
+
+function reply(id: string) {
+  const entries: Partial<Record<SharedCacheKind, Array<[string, unknown]>>> = {};
+  for (const kind of Object.keys(caches) as SharedCacheKind[]) {
+    entries[kind] = caches[kind].items();
+  }
+  channel?.postMessage({ type: "entries", id, leader: self, entries } as Message);
+}
+
+export function sharedGet<V>(kind: SharedCacheKind, key: string): V | undefined {
+  return channel === undefined ? undefined : caches[kind].get(key);
+}
+
+/**
+ * Keep a render result, and hand it to the other iframes when shared.
+ */
+export function sharedSet(kind: SharedCacheKind, key: string, value: unknown) {
+  caches[kind].set(key, value);
+  if (channel === undefined) {
+    return;
+  }
+  try {
+    channel.postMessage({ type: "set", kind, key, value } as Message);
+  } catch (error) {
+    // not structured-cloneable, it stays local
+    console.warn(error);
+  }
+}
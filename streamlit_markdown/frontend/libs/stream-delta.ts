@@ -0,0 +1,99 @@
+/**
+ * Append-only stream payload sent by `st_streaming_markdown(delta_protocol=True)`.
+ * A delta carries all the text since the last snapshot, which ends at `offset`.
+ * Offsets are counted in code points, like `len(str)` in Python.
+ */
+export type StreamDelta = {
+  // a new id for every stream, e.g. on a rerun, whose seq starts over at 0
+  stream: string;
+  seq: number;
+  offset: number;
+  text: string;
+  snapshot: boolean;
+  done: boolean;
+};
+
+export type StreamState = {
+  stream: string;
+  seq: number;
+  // the content up to the offset of the last delta, and its length
+  base: string;
+  baseLength: number;
+  content: string;
+  length: number;
+};
+
+export const EMPTY_STREAM_STATE: StreamState = { stream: "", seq: -1, base: "", baseLength: 0, content: "", length: 0 };
+
+/**
+ * Helper function to count code points (not UTF-16 code units) of a string
+ */
+export function countCodePoints(text: string): number {
+  let count = 0;
+  for (let i = 0; i < text.length; i++) {
+    const code = text.charCodeAt(i);
+    // skip the low half of a surrogate pair
+    if (code < 0xdc00 || code > 0xdfff) {
+      count++;
+    }
+  }
+  return count;
+}
+
+/**
+ * The first `count` code points of a string
+ */
+export function codePointPrefix(text: string, count: number): string {
+  let index = 0;
+  for (; index < text.length && count > 0; index++) {
+    const code = text.charCodeAt(index);
+    if (code < 0xdc00 || code > 0xdfff) {
+      count--;
+    }
+  }
+  // keep the low half of a trailing surrogate pair
+  while (index < text.length) {
+    const code = text.charCodeAt(index);
+    if (code < 0xdc00 || code > 0xdfff) {
+      break;
+    }
+    index++;
+  }
+  return text.slice(0, index);
+}
+
+/**
+ * Rebuild the content from a delta. Duplicated or out-of-order deltas are
+ * ignored. A delta completes any content that reaches the end of the last
+ * snapshot, which is a prefix of it, so deltas dropped in between are
+ * harmless. Without that content, it is kept until the next snapshot arrives.
+ */
+export function applyStreamDelta(state: StreamState, delta: StreamDelta): StreamState {
+  if (delta.stream !== state.stream) {
+    // a new stream, the content of the previous one is not a prefix of it
+    state = { ...EMPTY_STREAM_STATE, stream: delta.stream };
+  }
+  if (delta.seq <= state.seq) {
+    return state;
+  }
+  if (delta.snapshot) {
+    const length = countCodePoints(delta.text);
+    return { stream: delta.stream, seq: delta.seq, base: delta.text, baseLength: length, content: delta.text, length };
+  }
+  let base: string;
+  if (delta.offset === state.baseLength) {
+    base = state.base;
+  } else if (delta.offset <= state.length) {
+    base = codePointPrefix(state.content, delta.offset);
+  } else {
+    return state;
+  }
+  return {
+    stream: delta.stream,
+    seq: delta.seq,
+    base,
+    baseLength: delta.offset,
+    content: base + delta.text,
+    length: delta.offset + countCodePoints(delta.text),
+  };
+}
@@ -0,0 +1,22 @@
+// Keep only the woff2 sources of @font-face rules. Every browser that runs
+// the component supports woff2, so the woff and ttf copies of the KaTeX
+// fonts would only be emitted to the bundle and never fetched.
+const FONT_SOURCE = /url\([^)]*\)(\s*format\([^)]*\))?/g;
+
+const woff2Only = () => ({
+  postcssPlugin: "woff2-only",
+  AtRule: {
+    "font-face": (rule) => {
+      rule.walkDecls("src", (decl) => {
+        const sources = decl.value.match(FONT_SOURCE) ?? [];
+        const woff2 = sources.filter((source) => /\.woff2(\?[^)]*)?\)|format\(\s*["']?woff2/.test(source));
+        if (woff2.length > 0 && woff2.length < sources.length) {
+          decl.value = woff2.join(", ");
+        }
+      });
+    },
+  },
+});
+woff2Only.postcss = true;
+
+module.exports = woff2Only;
@@ -2,5 +2,6 @@ module.exports = {
   plugins: {
     tailwindcss: {},
     autoprefixer: {},
+    "./postcss-plugins/woff2-only.js": {},
   },
 }
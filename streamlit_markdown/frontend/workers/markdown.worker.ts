@@ -0,0 +1,75 @@
+import { Root } from "hast";
+import { visit } from "unist-util-visit";
+import { createHastProcessor, PrerenderedMath } from "@/libs/markdown-pipeline";
+import { loadRehypePlugin, loadedRehypePlugins, requiredRehypePlugins } from "@/libs/rehype-plugins";
+import { enableSharedCache } from "@/libs/shared-render-cache";
+
+export type ParseRequest = {
+  id: number;
+  sources: string[];
+  prerendered: PrerenderedMath;
+  // join the tab's shared render cache
+  sharedCache: boolean;
+};
+
+export type ParseResponse = {
+  id: number;
+  trees?: Root[];
+  // the plugins the trees were built with, a change invalidates cached blocks
+  plugins?: string;
+  error?: string;
+};
+
+// the dom lib has no worker scope types, it talks to the page like a Worker
+const context = self as unknown as Worker;
+
+let cache = {
+  key: "",
+  processor: createHastProcessor(),
+  trees: new Map<string, Root>(),
+};
+
+function parse(sources: string[]): Root[] {
+  const trees = new Map<string, Root>();
+  const result = sources.map((source) => {
+    let tree = trees.get(source) ?? cache.trees.get(source);
+    if (tree === undefined) {
+      const processor = cache.processor;
+      tree = processor.runSync(processor.parse(source)) as Root;
+      // positions are not used to render and would double the transfer
+      visit(tree, (node) => {
+        delete node.position;
+      });
+    }
+    trees.set(source, tree);
+    return tree;
+  });
+  // only the blocks of the latest document are kept
+  cache.trees = trees;
+  return result;
+}
+
+context.onmessage = async (event: MessageEvent<ParseRequest>) => {
+  const { id, sources, prerendered, sharedCache } = event.data;
+  if (sharedCache) {
+    enableSharedCache();
+  }
+  try {
+    await Promise.all(requiredRehypePlugins(sources.join("\n")).map(loadRehypePlugin));
+    const plugins = loadedRehypePlugins();
+    const pluginNames = Object.keys(plugins).join(",");
+    const key = JSON.stringify([pluginNames, Object.keys(prerendered)]);
+    if (cache.key !== key) {
+      cache = {
+        key,
+        processor: createHastProcessor({ current: prerendered }, plugins),
+        trees: new Map(),
+      };
+    }
+    const response: ParseResponse = { id, trees: parse(sources), plugins: pluginNames };
+    context.postMessage(response);
+  } catch (error) {
+    const response: ParseResponse = { id, error: String(error) };
+    context.postMessage(response);
+  }
+};
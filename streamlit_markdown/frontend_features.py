@@ -0,0 +1,45 @@
+from __future__ import annotations
+import json
+import os
+from typing import *
+
+# The frontend ignores args it doesn't know. The options that send the
+# content in another form than `content` (stream deltas, compressed content,
+# batch messages) would then show an empty component, so they check that the
+# frontend served to the browser reads that form, and send plain `content`
+# otherwise. A frontend lists the forms it reads in features.json, which the
+# build copies from public/ to out/. Builds from before it read none.
+
+_FRONTEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend")
+BUILD_FEATURES_PATH = os.path.join(_FRONTEND_DIR, "out", "features.json")
+SOURCE_FEATURES_PATH = os.path.join(_FRONTEND_DIR, "public", "features.json")
+
+_features_path = BUILD_FEATURES_PATH
+_features: Optional[FrozenSet[str]] = None
+
+
+def load_frontend_features(path: str) -> FrozenSet[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return frozenset(json.load(f)["features"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return frozenset()
+
+
+def use_frontend_source():
+    """The dev server serves the frontend source, with every feature of it"""
+    global _features_path, _features
+    _features_path = SOURCE_FEATURES_PATH
+    _features = None
+
+
+def frontend_features() -> FrozenSet[str]:
+    global _features
+    if _features is None:
+        _features = load_frontend_features(_features_path)
+    return _features
+
+
+def frontend_supports(feature: str) -> bool:
+    """Whether the served frontend reads the args of `feature`, e.g. "stream" for stream deltas"""
+    return feature in frontend_features()
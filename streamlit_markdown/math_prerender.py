@@ -0,0 +1,217 @@
+from __future__ import annotations
+import html
+import re
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from typing import *
+
+from streamlit_markdown.content_hash import content_hash
+
+try:
+    from latex2mathml.converter import convert as _latex_to_mathml
+except ImportError:
+    _latex_to_mathml = None
+
+MathRenderer = Callable[[str, bool], str]
+"""Renders a formula to HTML, given the formula and whether it is display math.
+
+Renderings are cached process-wide by where the renderer is defined (module,
+qualified name and line), so that a lambda recreated on every rerun still
+hits the cache. It must only depend on its arguments; give it a `cache_name`
+attribute to name it explicitly.
+"""
+
+MATH_CACHE_SIZE = 4096
+
+_FENCE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_MATH_FENCE = re.compile(r"^ {0,3}\$\$([^$]*)$")
+_CODE_SPAN = re.compile(r"(`+).+?\1")
+# `$$...$$` is tried first, or `$$y=f(x)$$` would be inline math
+_INLINE_MATH = re.compile(r"(?<![\\$])(\$\$|\$)(?!\$)(.+?)(?<![\\$])\1(?!\$)")
+
+
+# What renderer output may contain: MathML, and the few HTML and SVG elements
+# HTML math renderers such as KaTeX use. The output is inserted as HTML in
+# the frontend, and formulas come from untrusted content (latex2mathml copies
+# \text{} into the MathML unescaped).
+_ELEMENTS = frozenset(
+    """
+    math maction annotation annotation-xml menclose merror mfenced mfrac mi
+    mmultiscripts mn mo mover mpadded mphantom mprescripts mroot mrow ms mspace
+    msqrt mstyle msub msubsup msup mtable mtd mtext mtr munder munderover none
+    semantics span div br svg path line
+    """.split()
+)
+_ATTRIBUTES = {
+    name.lower(): name
+    for name in """
+    accent accentunder align bevelled class close columnalign columnlines
+    columnspacing columnspan d depth dir display displaystyle encoding fence
+    form frame height largeop linethickness lspace mathbackground mathcolor
+    mathsize mathvariant maxsize minsize movablelimits notation open
+    preserveAspectRatio rowalign rowlines rowspacing rowspan rspace scriptlevel
+    separator separators stretchy style symmetric viewBox voffset width xmlns
+    x1 x2 y1 y2 stroke-width aria-hidden
+    """.split()
+}
+# their content is dropped along with them
+_DROPPED = frozenset(["script", "style", "template", "iframe", "object", "embed", "noscript"])
+_UNSAFE_STYLE = re.compile(r"url\s*\(|expression\s*\(|@import|javascript:", re.IGNORECASE)
+
+
+class _MathSanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.dropped = 0
+
+    def _tag(self, tag: str, attrs: List[Tuple[str, Optional[str]]], close: str) -> str:
+        allowed = []
+        for name, value in attrs:
+            name = _ATTRIBUTES.get(name)
+            value = value or ""
+            if name is None or (name == "style" and _UNSAFE_STYLE.search(value)):
+                continue
+            allowed.append(f' {name}="{html.escape(value)}"')
+        return f"<{tag}{''.join(allowed)}{close}>"
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _DROPPED:
+            self.dropped += 1
+        elif tag in _ELEMENTS and not self.dropped:
+            self.parts.append(self._tag(tag, attrs, ""))
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in _ELEMENTS and not self.dropped:
+            self.parts.append(self._tag(tag, attrs, "/"))
+
+    def handle_endtag(self, tag):
+        if tag in _DROPPED:
+            self.dropped = max(0, self.dropped - 1)
+        elif tag in _ELEMENTS and not self.dropped:
+            self.parts.append(f"</{tag}>")
+
+    def handle_data(self, data):
+        if not self.dropped:
+            self.parts.append(html.escape(data, quote=False))
+
+
+def sanitize_math_html(markup: str) -> str:
+    """Keep only the MathML (and basic HTML/SVG) elements and attributes of a rendering, text escaped"""
+    sanitizer = _MathSanitizer()
+    sanitizer.feed(markup)
+    sanitizer.close()
+    return "".join(sanitizer.parts)
+
+
+def mathml_renderer(formula: str, display: bool) -> str:
+    """Render with latex2mathml (`pip install latex2mathml`), as MathML the browser lays out natively"""
+    return _latex_to_mathml(formula, display="block" if display else "inline")
+
+
+def default_math_renderer() -> Optional[MathRenderer]:
+    return mathml_renderer if _latex_to_mathml is not None else None
+
+
+def math_key(formula: str, display: bool) -> str:
+    """The key the frontend looks a prerendered formula up with"""
+    return content_hash(("display:" if display else "inline:") + formula.strip())
+
+
+def extract_math(content: str) -> Iterator[Tuple[str, bool]]:
+    """Yield (formula, display) for the math in a markdown document, like remark-math.
+
+    `$$` fences on their own lines and `$$...$$` are display math, `$...$`
+    is inline math. Code blocks and code spans are skipped.
+    """
+    fence = None
+    display: Optional[List[str]] = None
+    for line in content.split("\n"):
+        if fence is not None:
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        if display is not None:
+            if line.strip().startswith("$$"):
+                yield "\n".join(display).strip(), True
+                display = None
+            else:
+                display.append(line)
+            continue
+        match = _FENCE.match(line)
+        if match:
+            fence = match.group(1)
+            continue
+        match = _MATH_FENCE.match(line)
+        if match:
+            display = [match.group(1)] if match.group(1).strip() else []
+            continue
+        for match in _INLINE_MATH.finditer(_CODE_SPAN.sub("", line)):
+            yield match.group(2).strip(), match.group(1) == "$$"
+
+
+def _renderer_key(renderer: MathRenderer) -> Hashable:
+    """Identifies a renderer across reruns, unlike the function object itself"""
+    name = getattr(renderer, "cache_name", None)
+    if name is not None:
+        return name
+    code = getattr(renderer, "__code__", None)
+    if code is None:
+        # callable objects are identified by the object
+        return renderer
+    return (renderer.__module__, renderer.__qualname__, code.co_firstlineno)
+
+
+class _MathCache:
+    """Bounded, process-wide cache of rendered formulas, shared by all sessions"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[str]:
+        with self.lock:
+            html = self.entries.get(key)
+            if html is not None:
+                self.entries.move_to_end(key)
+            return html
+
+    def set(self, key: Hashable, html: str):
+        with self.lock:
+            self.entries[key] = html
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+math_cache = _MathCache(MATH_CACHE_SIZE)
+
+
+def prerender_math(content: str, renderer: Optional[MathRenderer] = None) -> Dict[str, str]:
+    """Render the math of a document once, returns {math_key: html} for the frontend.
+
+    Formulas the renderer fails on are left out, the frontend renders them
+    with KaTeX as usual. The renderings are sanitized, see `sanitize_math_html`.
+    """
+    renderer = renderer or default_math_renderer()
+    if renderer is None:
+        return {}
+    renderer_key = _renderer_key(renderer)
+    prerendered = {}
+    for formula, display in extract_math(content):
+        if not formula:
+            continue
+        key = math_key(formula, display)
+        if key in prerendered:
+            continue
+        rendered = math_cache.get((renderer_key, display, formula))
+        if rendered is None:
+            try:
+                rendered = sanitize_math_html(renderer(formula, display))
+            except Exception:
+                continue
+            math_cache.set((renderer_key, display, formula), rendered)
+        prerendered[key] = rendered
+    return prerendered
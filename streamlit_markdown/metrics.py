@@ -0,0 +1,105 @@
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import *
+
+from streamlit_markdown.st_hack_common import dumps_args, last_serialization, session_scoped
+
+# id(session state) -> {component key: MarkdownMetrics}
+_metrics: Dict[int, Dict[Any, "MarkdownMetrics"]] = {}
+
+
+@dataclass
+class MarkdownMetrics:
+    """Timings of an instrumented component, see `st_markdown(instrument=True)`.
+
+    The Python side is measured on every call: `marshall_ms` is the whole
+    component call, `serialize_ms` the part spent serializing its args (None
+    when Streamlit serializes them, in st_markdown). `frontend` holds the
+    latest report of the iframe, with the count, total and last duration
+    of each phase (parse, katex, highlight, mermaid, commit) and the number
+    of frame height updates.
+    """
+
+    key: Any
+    calls: int = 0
+    marshall_ms: float = 0.0
+    serialize_ms: Optional[float] = None
+    payload_bytes: int = 0
+    cached: bool = False
+    total_marshall_ms: float = 0.0
+    total_payload_bytes: int = 0
+    frontend: Dict[str, Any] = field(default_factory=dict)
+
+
+MetricsCallback = Callable[[MarkdownMetrics], None]
+
+
+def session_metrics() -> Optional[Dict[Any, MarkdownMetrics]]:
+    return session_scoped(_metrics)
+
+
+def get_markdown_metrics(key: Any) -> Optional[MarkdownMetrics]:
+    """The metrics of the current session's instrumented component with this key"""
+    metrics = session_metrics()
+    return None if metrics is None else metrics.get(key)
+
+
+def _component_metrics(key: Any) -> MarkdownMetrics:
+    metrics = session_metrics()
+    if metrics is None:
+        # outside of a script run there is nothing to query them from
+        return MarkdownMetrics(key)
+    return metrics.setdefault(key, MarkdownMetrics(key))
+
+
+@contextmanager
+def instrumented(
+    key: Any,
+    args: Optional[Dict[str, Any]] = None,
+    on_metrics: Optional[MetricsCallback] = None,
+    binary_bytes: int = 0,
+):
+    """Time the component call in the block.
+
+    Components serialized by st_hack leave their stats in `last_serialization`,
+    their binary args are counted with `binary_bytes`. For the others, the
+    size of `args` is measured after the call.
+    """
+    last_serialization()
+    start = time.perf_counter()
+    yield
+    seconds = time.perf_counter() - start
+    metrics = _component_metrics(key)
+    stats = last_serialization()
+    if stats is not None:
+        metrics.serialize_ms = stats.seconds * 1000
+        metrics.payload_bytes = stats.payload_bytes + binary_bytes
+        metrics.cached = stats.cached
+    elif args is not None:
+        json_args = {name: value for name, value in args.items() if not isinstance(value, bytes)}
+        metrics.serialize_ms = None
+        metrics.payload_bytes = len(dumps_args(json_args).encode()) + sum(
+            len(value) for value in args.values() if isinstance(value, bytes)
+        )
+        metrics.cached = False
+    metrics.calls += 1
+    metrics.marshall_ms = seconds * 1000
+    metrics.total_marshall_ms += metrics.marshall_ms
+    metrics.total_payload_bytes += metrics.payload_bytes
+    if on_metrics is not None:
+        on_metrics(metrics)
+
+
+def record_frontend_metrics(key: Any, value: Any, on_metrics: Optional[MetricsCallback] = None) -> bool:
+    """Keep the report sent back by the frontend, returns whether `value` was one"""
+    if not isinstance(value, dict) or not isinstance(value.get("metrics"), dict):
+        return False
+    metrics = _component_metrics(key)
+    report = value["metrics"]
+    if report.get("seq") != metrics.frontend.get("seq"):
+        metrics.frontend = report
+        if on_metrics is not None:
+            on_metrics(metrics)
+    return True
@@ -0,0 +1,236 @@
+from __future__ import annotations
+import hashlib
+import json
+import marshal
+import threading
+import time
+import weakref
+from typing import *
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+Serializer = Callable[[Any], str]
+"""Serializes JSON-like component args to a JSON string."""
+
+# id(session state) -> {component key: (content_hash, default snapshot, serialized args)}
+_args_cache: Dict[int, Dict[Any, Tuple[str, Optional[bytes], str]]] = {}
+_session_lock = threading.Lock()
+_last_serialization = threading.local()
+
+
+class SerializationStats(NamedTuple):
+    seconds: float
+    payload_bytes: int
+    cached: bool
+
+
+def json_serializer(value: Any) -> str:
+    # ASCII-escaped like Streamlit's own json.dumps, so that lone surrogates
+    # (e.g. an emoji split across tokens) are written as \ud83d instead of
+    # failing to encode in the protobuf
+    return json.dumps(value, separators=(",", ":"))
+
+
+def orjson_serializer(value: Any) -> str:
+    try:
+        return orjson.dumps(value).decode()
+    except TypeError:
+        # ints over 64 bits, str subclasses, lone surrogates, ...
+        return json_serializer(value)
+
+
+def msgspec_serializer(value: Any) -> str:
+    try:
+        return msgspec.json.encode(value).decode()
+    except (TypeError, UnicodeEncodeError, msgspec.EncodeError):
+        return json_serializer(value)
+
+
+SERIALIZERS: Dict[str, Serializer] = {"json": json_serializer}
+if orjson is not None:
+    SERIALIZERS["orjson"] = orjson_serializer
+if msgspec is not None:
+    SERIALIZERS["msgspec"] = msgspec_serializer
+
+# the fastest installed backend
+_serializer: Serializer = SERIALIZERS.get("orjson") or SERIALIZERS.get("msgspec") or json_serializer
+
+
+def set_serializer(serializer: Union[str, Serializer]):
+    """Choose how component args are serialized, by backend name or as a function.
+
+    The built-in backends all write compact JSON that parses to the same
+    values, so the frontend sees no difference. `json` escapes non-ASCII
+    characters where orjson and msgspec write them as UTF-8, and falls back
+    to `json` for what they can't encode, like lone surrogates. None of them
+    is byte-identical to the `json.dumps(args)` Streamlit writes: no spaces
+    after separators, and dumps_args puts RawJSON values after the others.
+    """
+    global _serializer
+    if isinstance(serializer, str):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"serializer must be one of {list(SERIALIZERS)}, not {serializer!r}")
+        serializer = SERIALIZERS[serializer]
+    _serializer = serializer
+
+
+def get_serializer() -> Serializer:
+    return _serializer
+
+
+class RawJSON:
+    """An already serialized JSON value, spliced into the component args as is"""
+
+    __slots__ = ("json",)
+
+    def __init__(self, serialized: str):
+        self.json = serialized
+
+
+def dumps_args(json_args: Dict[str, Any]) -> str:
+    """Serialize the component args, with the RawJSON values copied in without reencoding them"""
+    raw = [(name, value) for name, value in json_args.items() if isinstance(value, RawJSON)]
+    if not raw:
+        return _serializer(json_args)
+    serialized = _serializer({name: value for name, value in json_args.items() if not isinstance(value, RawJSON)})
+    fragments = ",".join(f"{_serializer(name)}:{value.json}" for name, value in raw)
+    if serialized == "{}":
+        return "{" + fragments + "}"
+    return serialized[:-1] + "," + fragments + "}"
+
+
+# Version 2 writes every value in full: no back-references to shared or
+# interned objects, so equal args always give the same snapshot.
+_SNAPSHOT_VERSION = 2
+
+# str and bytes args longer than this are hashed with hash() in args_hash
+_LARGE_VALUE = 256
+
+
+def snapshot(json_args: Dict[str, Any]) -> Optional[bytes]:
+    """A cheap byte snapshot of the args, equal only if they serialize the same.
+
+    marshal copies strings as they are instead of escaping them, which makes
+    it several times faster than json.dumps. It keeps types apart too, unlike
+    `==` where `True == 1 == 1.0`. RawJSON values are taken by their JSON.
+    None if the args hold another non-builtin type.
+    """
+    try:
+        return marshal.dumps(json_args, _SNAPSHOT_VERSION)
+    except ValueError:
+        pass
+    if not any(isinstance(value, RawJSON) for value in json_args.values()):
+        return None
+    return snapshot({
+        name: ("RawJSON", value.json) if isinstance(value, RawJSON) else value
+        for name, value in json_args.items()
+    })
+
+
+def args_hash(args: Dict[str, Any]) -> str:
+    """A short hash of the args, for `content_hash`.
+
+    Long str and bytes values, i.e. the content, and RawJSON values are
+    hashed with hash(), which str and bytes objects cache: the same document
+    object kept across reruns, e.g. in session_state, is not read again. hash() is salted per process, so the
+    hash only holds within one server process; after a restart the frontend
+    misses its cache once.
+    """
+    # what stands for each arg in the hash
+    fingerprint = {}
+    for name, value in args.items():
+        if isinstance(value, RawJSON):
+            value = ("RawJSON", hash(value.json))
+        elif isinstance(value, (str, bytes)) and len(value) > _LARGE_VALUE:
+            value = ("hash", len(value), hash(value))
+        fingerprint[name] = value
+    data = snapshot(fingerprint)
+    if data is None:
+        data = dumps_args(fingerprint).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def session_scoped(
+    store: Dict[int, Dict[Any, Any]], on_close: Optional[Callable[[Dict[Any, Any]], None]] = None
+) -> Optional[Dict[Any, Any]]:
+    """The current session's entry of a per-session store, None outside of a script run
+
+    `on_close` is called with the entry once the session is gone.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None
+    # the SafeSessionState wrapper is recreated on every rerun, the state it wraps is not
+    state = getattr(ctx.session_state, "_state", ctx.session_state)
+    with _session_lock:
+        entry = store.get(id(state))
+        if entry is None:
+            # SessionState is an unhashable dataclass, so it can't key a
+            # WeakKeyDictionary. Drop its entry when the session goes away.
+            entry = store[id(state)] = {}
+            weakref.finalize(state, _drop_session, store, id(state), on_close)
+        return entry
+
+
+def _drop_session(store: Dict[int, Dict[Any, Any]], session_id: int, on_close: Optional[Callable]):
+    entry = store.pop(session_id, None)
+    if entry is not None and on_close is not None:
+        on_close(entry)
+
+
+def session_args_cache() -> Optional[Dict[Any, Tuple[str, Optional[bytes], str]]]:
+    """The serialized args of the current session's keyed components, None outside of a script run"""
+    return session_scoped(_args_cache)
+
+
+def serialize_args(key: Any, json_args: Dict[str, Any]) -> str:
+    """Serialize the component args, reusing the last run's string when they are unchanged.
+
+    Only keyed components with a `content_hash` arg (see args_hash) are
+    cached: the key identifies the component across reruns and the hash
+    stands for its args, so an unchanged component is neither compared nor
+    serialized again. Other components, such as streams whose args change on
+    every call, are serialized as they are.
+
+    With the `instrument` arg, the time and size of the serialization are
+    kept for `last_serialization`.
+    """
+    if not json_args.get("instrument"):
+        return _serialize_args(key, json_args)[0]
+    start = time.perf_counter()
+    serialized, cached = _serialize_args(key, json_args)
+    seconds = time.perf_counter() - start
+    _last_serialization.stats = SerializationStats(seconds, len(serialized.encode()), cached)
+    return serialized
+
+
+def last_serialization() -> Optional[SerializationStats]:
+    """The stats of the last instrumented serialize_args call of this thread, and forget them"""
+    stats = getattr(_last_serialization, "stats", None)
+    _last_serialization.stats = None
+    return stats
+
+
+def _serialize_args(key: Any, json_args: Dict[str, Any]) -> Tuple[str, bool]:
+    content_hash = json_args.get("content_hash")
+    cache = session_args_cache() if key is not None and content_hash is not None else None
+    if cache is None:
+        return dumps_args(json_args), False
+    # the default is not part of the hash, it is set apart from the args
+    default = snapshot({"default": json_args.get("default")})
+    cached = cache.get(key)
+    if cached is not None and cached[:2] == (content_hash, default):
+        return cached[2], True
+    serialized = dumps_args(json_args)
+    cache[key] = (content_hash, default, serialized)
+    return serialized, False
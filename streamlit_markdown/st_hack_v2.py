@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from streamlit.elements.form import current_form_id
+from streamlit.proto.Components_pb2 import SpecialArg
 from streamlit.proto.Element_pb2 import Element
 from streamlit.runtime.scriptrunner import get_script_run_ctx
 from streamlit.runtime.state import register_widget
@@ -19,7 +20,8 @@ from streamlit.runtime.state.common import (
     user_key_from_element_id,
 )
 from typing import *
-import json
+
+from streamlit_markdown.st_hack_common import serialize_args
 
 
 def marshall_component(
@@ -36,10 +38,17 @@ def marshall_component(
     json_args = {}
     special_args = []
     for arg_name, arg_val in all_args.items():
-        json_args[arg_name] = arg_val
+        if isinstance(arg_val, (bytes, bytearray, memoryview)):
+            # sent as is next to the JSON args, the frontend gets a Uint8Array
+            bytes_arg = SpecialArg()
+            bytes_arg.key = arg_name
+            bytes_arg.bytes = bytes(arg_val)
+            special_args.append(bytes_arg)
+        else:
+            json_args[arg_name] = arg_val
 
     try:
-        serialized_json_args = json.dumps(json_args)
+        serialized_json_args = serialize_args(key, json_args)
     except Exception as ex:
         raise MarshallComponentException("Could not convert component args to JSON", ex)
     element.component_instance.component_name = self.name
@@ -0,0 +1,631 @@
+from __future__ import annotations
+import abc
+import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+import uuid
+from typing import *
+
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from streamlit_markdown.st_hack_common import session_scoped
+
+
+class ContentBuffer:
+    """Accumulate a streamed document with amortized O(1) appends.
+
+    ``str +=`` copies the whole document on every token as soon as anything
+    else references it, which every render does. Tokens are kept as chunks
+    instead and only joined when the document is read, at flush points.
+    Small tokens are merged into blocks of about ``block_size`` characters,
+    which bounds the per-token object overhead of long streams.
+    """
+
+    def __init__(self, block_size: int = 4096):
+        self.block_size = block_size
+        self._blocks: List[str] = []
+        self._tail: List[str] = []
+        self._tail_chars = 0
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._tail.append(text)
+        self._tail_chars += len(text)
+        self._length += len(text)
+        if self._tail_chars >= self.block_size:
+            self._merge()
+
+    def getvalue(self) -> str:
+        """The whole document, kept as a single block until more is appended"""
+        self._merge()
+        if len(self._blocks) > 1:
+            self._blocks = ["".join(self._blocks)]
+        return self._blocks[0] if self._blocks else ""
+
+    def since(self, offset: int) -> str:
+        """The text appended after the first `offset` characters, without joining the rest"""
+        if offset >= self._length:
+            return ""
+        self._merge()
+        index, start = len(self._blocks), self._length
+        while start > offset:
+            index -= 1
+            start -= len(self._blocks[index])
+        text = "".join(self._blocks[index:])
+        return text[offset - start :] if offset > start else text
+
+    def _merge(self):
+        if self._tail:
+            self._blocks.append("".join(self._tail))
+            self._tail = []
+            self._tail_chars = 0
+
+
+class DeltaEncoder:
+    """Encode a growing document as append-only deltas for the frontend.
+
+    Instead of resending the whole document on every update, each payload
+    carries only the text appended since the last full snapshot, together
+    with the offset it must be appended at and a sequence number. Every
+    ``snapshot_every`` payloads (and always on the first and last one) a full
+    snapshot is sent so that a remounted iframe can resync.
+
+    Streamlit may drop an update that a newer one replaces before it is sent,
+    so deltas are cumulative: any one of them completes the last snapshot.
+    Every encoder has its own ``stream`` id, which tells the frontend that a
+    rerun started a new stream whose sequence numbers start over.
+
+    Offsets are counted in code points, like ``len(str)`` in Python.
+    """
+
+    def __init__(self, snapshot_every: int = 50):
+        if snapshot_every < 1:
+            raise ValueError(f"snapshot_every must be >= 1, not {snapshot_every}")
+        self.snapshot_every = snapshot_every
+        self.stream = uuid.uuid4().hex
+        self.seq = 0
+        # the length of the document at the last snapshot
+        self.offset = 0
+
+    def encode(self, content: Union[str, ContentBuffer], done: bool = False) -> Dict[str, Any]:
+        snapshot = done or self.seq % self.snapshot_every == 0
+        if snapshot:
+            offset, text = 0, content if isinstance(content, str) else content.getvalue()
+            self.offset = len(content)
+        elif isinstance(content, str):
+            offset, text = self.offset, content[self.offset :]
+        else:
+            # only the text since the snapshot is joined, the document is materialized on snapshots
+            offset, text = self.offset, content.since(self.offset)
+        payload = {
+            "stream": self.stream,
+            "seq": self.seq,
+            "offset": offset,
+            "text": text,
+            "snapshot": snapshot,
+            "done": done,
+        }
+        self.seq += 1
+        return payload
+
+
+class TokenCoalescer:
+    """Decide when buffered tokens are worth a rerender.
+
+    Tokens are flushed together at most once per ``flush_interval_ms`` and
+    only once at least ``min_chars`` characters are pending, unless the oldest
+    pending token has waited ``max_latency_ms``. The very first token is
+    flushed immediately so coalescing never delays the first paint.
+    """
+
+    def __init__(
+        self,
+        flush_interval_ms: float = 16,
+        min_chars: int = 0,
+        max_latency_ms: Optional[float] = 100,
+    ):
+        self.flush_interval = flush_interval_ms / 1000
+        self.min_chars = min_chars
+        self.max_latency = None if max_latency_ms is None else max_latency_ms / 1000
+        self.last_flush: Optional[float] = None
+        self.pending_since: Optional[float] = None
+        self.pending_chars = 0
+
+    @property
+    def pending(self) -> bool:
+        return self.pending_since is not None
+
+    def push(self, n_chars: int, now: Optional[float] = None) -> bool:
+        """Record a token of `n_chars` characters, returns whether to flush now"""
+        now = time.monotonic() if now is None else now
+        if self.pending_since is None:
+            self.pending_since = now
+        self.pending_chars += n_chars
+        return self.due(now)
+
+    def due(self, now: Optional[float] = None) -> bool:
+        if self.pending_since is None:
+            return False
+        if self.last_flush is None:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.max_latency is not None and now - self.pending_since >= self.max_latency:
+            return True
+        return (
+            now - self.last_flush >= self.flush_interval
+            and self.pending_chars >= self.min_chars
+        )
+
+    def deadline(self) -> Optional[float]:
+        """The monotonic time at which pending tokens must be flushed, if any"""
+        if self.pending_since is None:
+            return None
+        if self.last_flush is None:
+            return self.pending_since
+        deadlines = []
+        if self.max_latency is not None:
+            deadlines.append(self.pending_since + self.max_latency)
+        if self.pending_chars >= self.min_chars:
+            deadlines.append(self.last_flush + self.flush_interval)
+        return min(deadlines) if deadlines else None
+
+    def flushed(self, now: Optional[float] = None):
+        self.last_flush = time.monotonic() if now is None else now
+        self.pending_since = None
+        self.pending_chars = 0
+
+
+def script_interrupted() -> bool:
+    """Whether the running script has been asked to rerun or stop.
+
+    Streamlit only acts on such requests when the script thread sends the
+    next element, so long waits on a producer poll this instead.
+    """
+    return _pending_script_request(get_script_run_ctx()) in ("STOP", "RERUN")
+
+
+def _pending_script_request(ctx: Any) -> Optional[str]:
+    """The request pending for the script run of `ctx`: CONTINUE, STOP or RERUN.
+
+    Streamlit has no public way to peek at it without consuming it. The
+    ScriptRunContext of recent versions (checked up to 1.41) holds the
+    run's ScriptRequests, which keeps it in the private `_state`, a
+    ScriptRequestType. On versions laid out differently this returns None,
+    and a stalled stream is only interrupted once it sends its next element,
+    like any script.
+    """
+    requests = getattr(ctx, "script_requests", None)
+    state = getattr(requests, "_state", None)
+    name = getattr(state, "name", None)
+    return name if name in _SCRIPT_REQUESTS else None
+
+
+_SCRIPT_REQUESTS = ("CONTINUE", "STOP", "RERUN")
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+_DONE = object()
+
+
+class TokenProducer(abc.ABC):
+    """Feed tokens from a source into a bounded queue read by the script thread.
+
+    The producer waits when the queue is full, so a fast source can't run
+    ahead of the UI by more than ``maxsize`` tokens. Exceptions raised by the
+    source are re-raised in the consuming thread, and `cancel` stops the
+    producer and closes the source at the next token.
+    """
+
+    def __init__(self, token_stream: Any, maxsize: int = 256, poll_interval: float = 0.1):
+        self.token_stream = token_stream
+        self.queue: queue.Queue = queue.Queue(maxsize)
+        self.poll_interval = poll_interval
+        self.cancelled = threading.Event()
+
+    @abc.abstractmethod
+    def start(self) -> "TokenProducer":
+        """Start producing, returns self"""
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def tokens(self, deadline: Callable[[], Optional[float]]) -> Iterator[Any]:
+        """Yield tokens as they arrive.
+
+        An empty string is yielded whenever no token arrived before
+        `deadline()`, so that the caller gets a chance to flush. Iteration
+        stops when the stream ends or the script is interrupted.
+        """
+        try:
+            while True:
+                timeout = self.poll_interval
+                flush_at = deadline()
+                if flush_at is not None:
+                    timeout = min(timeout, max(0, flush_at - time.monotonic()))
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    if script_interrupted():
+                        return
+                    yield ""
+                    continue
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item
+        finally:
+            self.cancel()
+
+
+class ThreadedTokenProducer(TokenProducer):
+    """Drain a sync iterator in its own worker thread."""
+
+    def __init__(self, token_stream: Iterator[Any], maxsize: int = 256, poll_interval: float = 0.1):
+        super().__init__(token_stream, maxsize, poll_interval)
+        self.thread = threading.Thread(
+            target=self._run, name="streamlit-markdown-producer", daemon=True
+        )
+
+    def start(self) -> "ThreadedTokenProducer":
+        self.thread.start()
+        return self
+
+    def put(self, item: Any) -> bool:
+        """Put an item in the queue, waiting for room. Returns False once cancelled"""
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=self.poll_interval)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        try:
+            for token in self.token_stream:
+                if not self.put(token):
+                    return
+        except BaseException as ex:
+            self.put(_Failure(ex))
+        else:
+            self.put(_DONE)
+        finally:
+            close = getattr(self.token_stream, "close", None)
+            if callable(close):
+                close()
+
+
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """The process-wide event loop driving async token streams.
+
+    It runs in a single daemon thread, shared by every session, so any number
+    of async streams costs no extra thread.
+    """
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="streamlit-markdown-event-loop", daemon=True
+            ).start()
+            _event_loop = loop
+        return _event_loop
+
+
+class AsyncTokenProducer(TokenProducer):
+    """Drain an async iterator as a task on the shared event loop."""
+
+    def __init__(self, token_stream: AsyncIterator[Any], maxsize: int = 256, poll_interval: float = 0.1):
+        super().__init__(token_stream, maxsize, poll_interval)
+        self.future: Optional[concurrent.futures.Future] = None
+
+    def start(self) -> "AsyncTokenProducer":
+        self.future = asyncio.run_coroutine_threadsafe(self._run(), get_event_loop())
+        return self
+
+    def cancel(self):
+        super().cancel()
+        if self.future is not None:
+            self.future.cancel()
+
+    async def put(self, item: Any) -> bool:
+        """Put an item in the queue without blocking the loop. Returns False once cancelled"""
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except queue.Full:
+                await asyncio.sleep(self.poll_interval / 10)
+        return False
+
+    async def _run(self):
+        try:
+            async for token in self.token_stream:
+                if not await self.put(token):
+                    return
+        except asyncio.CancelledError:
+            raise
+        except BaseException as ex:
+            await self.put(_Failure(ex))
+        else:
+            await self.put(_DONE)
+        finally:
+            aclose = getattr(self.token_stream, "aclose", None)
+            if callable(aclose):
+                await aclose()
+
+
+class SharedStream:
+    """An append-only document filled by one producer and followed by any number of sessions.
+
+    The producer drains its token stream exactly once, in a worker thread (or
+    on the shared event loop for async iterators), whether or not anyone is
+    watching. Readers replay what has arrived so far and then follow along.
+    """
+
+    def __init__(self, stream_id: Hashable):
+        self.stream_id = stream_id
+        self.buffer = ContentBuffer()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.finished_at: Optional[float] = None
+        self.cancelled = threading.Event()
+        self._future: Optional[concurrent.futures.Future] = None
+        self._condition = threading.Condition()
+
+    def append(self, token: str):
+        with self._condition:
+            self.buffer.append(token)
+            self._condition.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+
+    def cancel(self):
+        """Stop the producer and close its source at the next token, what arrived so far is kept"""
+        self.cancelled.set()
+        if self._future is not None:
+            self._future.cancel()
+
+    @property
+    def content(self) -> str:
+        with self._condition:
+            return self.buffer.getvalue()
+
+    def read(self, offset: int, timeout: float) -> Tuple[str, int, bool]:
+        """The text after the first `offset` characters, waiting up to `timeout` for some.
+
+        Returns the text, the offset to read from next and whether the stream
+        is done, all taken together, so nothing appended before `finish` is missed.
+        """
+        with self._condition:
+            if offset >= len(self.buffer) and not self.done:
+                self._condition.wait(timeout)
+            return self.buffer.since(offset), len(self.buffer), self.done
+
+    def reader(self, poll_interval: float = 0.1) -> "SharedStreamReader":
+        return SharedStreamReader(self, poll_interval)
+
+    def _produce(self, token_stream: Any):
+        if callable(token_stream):
+            token_stream = token_stream()
+        if hasattr(token_stream, "__aiter__"):
+            self._future = asyncio.run_coroutine_threadsafe(self._drain_async(token_stream), get_event_loop())
+            return
+        threading.Thread(
+            target=self._drain, args=(token_stream,), name="streamlit-markdown-shared-stream", daemon=True
+        ).start()
+
+    def _append_token(self, token: Any):
+        if callable(token):
+            token = token()
+        if not isinstance(token, str):
+            raise TypeError(f"token must be str or callable[() -> str], not {type(token)}")
+        if token:
+            self.append(token)
+
+    def _drain(self, token_stream: Iterator[Any]):
+        try:
+            for token in token_stream:
+                self._append_token(token)
+                if self.cancelled.is_set():
+                    break
+        except BaseException as ex:
+            self.finish(ex)
+        else:
+            self.finish()
+        finally:
+            close = getattr(token_stream, "close", None)
+            if callable(close):
+                close()
+
+    async def _drain_async(self, token_stream: AsyncIterator[Any]):
+        try:
+            async for token in token_stream:
+                self._append_token(token)
+        except asyncio.CancelledError:
+            self.finish()
+            raise
+        except BaseException as ex:
+            self.finish(ex)
+        else:
+            self.finish()
+        finally:
+            aclose = getattr(token_stream, "aclose", None)
+            if callable(aclose):
+                await aclose()
+
+
+class SharedStreamReader(TokenProducer):
+    """Follows a SharedStream for one session, from its first token on.
+
+    Cancelling it only stops this reader, the shared producer keeps going.
+    """
+
+    def __init__(self, stream: SharedStream, poll_interval: float = 0.1):
+        super().__init__(stream, 0, poll_interval)
+        self.stream = stream
+
+    def start(self) -> "SharedStreamReader":
+        return self
+
+    def tokens(self, deadline: Callable[[], Optional[float]]) -> Iterator[Any]:
+        offset = 0
+        try:
+            while not self.cancelled.is_set():
+                timeout = self.poll_interval
+                flush_at = deadline()
+                if flush_at is not None:
+                    timeout = min(timeout, max(0, flush_at - time.monotonic()))
+                text, offset, done = self.stream.read(offset, timeout)
+                if text:
+                    # the backlog arrives as one token, so a late viewer catches up in one render
+                    yield text
+                if done:
+                    if self.stream.error is not None:
+                        raise self.stream.error
+                    return
+                if not text:
+                    if script_interrupted():
+                        return
+                    yield ""
+        finally:
+            self.cancel()
+
+
+class StreamRegistry:
+    """Process-wide SharedStreams by id.
+
+    Finished streams are kept for `ttl_seconds`, so viewers arriving later
+    still get the whole document, and then evicted. Streams still being
+    produced are never evicted.
+    """
+
+    def __init__(self, ttl_seconds: float = 600):
+        self.ttl_seconds = ttl_seconds
+        self._streams: Dict[Hashable, SharedStream] = {}
+        self._lock = threading.Lock()
+
+    def attach(self, stream_id: Hashable, token_stream: Any = None) -> SharedStream:
+        """The stream with this id, started from `token_stream` if there is none.
+
+        Pass a callable returning the token stream, so that only the session
+        that starts the stream calls it.
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            stream = self._streams.get(stream_id)
+            if stream is not None:
+                return stream
+            if token_stream is None:
+                raise KeyError(f"no shared stream {stream_id!r}, pass a token_stream to start it")
+            stream = self._streams[stream_id] = SharedStream(stream_id)
+        try:
+            stream._produce(token_stream)
+        except BaseException as ex:
+            stream.finish(ex)
+            # the next attach tries again
+            with self._lock:
+                if self._streams.get(stream_id) is stream:
+                    del self._streams[stream_id]
+            raise
+        return stream
+
+    def get(self, stream_id: Hashable) -> Optional[SharedStream]:
+        with self._lock:
+            self._evict(time.monotonic())
+            return self._streams.get(stream_id)
+
+    def evict(self, stream_id: Hashable):
+        """Forget a stream now, the next attach starts a new one"""
+        with self._lock:
+            self._streams.pop(stream_id, None)
+
+    def _evict(self, now: float):
+        expired = [
+            stream_id
+            for stream_id, stream in self._streams.items()
+            if stream.finished_at is not None and now - stream.finished_at >= self.ttl_seconds
+        ]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+
+shared_streams = StreamRegistry()
+
+
+def shared_stream(stream_id: Hashable, token_stream: Any = None) -> SharedStream:
+    """Attach to the process-wide stream `stream_id`, starting it from `token_stream` if needed.
+
+    Pass the result to st_streaming_markdown in every session that shows it.
+    """
+    return shared_streams.attach(stream_id, token_stream)
+
+
+# id(session state) -> {component key: SharedStream}
+_resumable_streams: Dict[int, Dict[Any, SharedStream]] = {}
+
+
+def _cancel_streams(streams: Dict[Any, SharedStream]):
+    for stream in streams.values():
+        stream.cancel()
+
+
+def resumable_stream(key: Any, token_stream: Callable[[], Any]) -> SharedStream:
+    """The current session's stream for `key`, started by calling `token_stream` on first use.
+
+    The stream is produced in the background and outlives the script run, so
+    a rerun gets the same stream back, with what arrived so far, instead of
+    starting the generation again. `token_stream` isn't called then. Streams
+    that failed or were cancelled are started again, and the session's
+    streams are cancelled when it ends.
+    """
+    if not callable(token_stream):
+        # a generator or SDK stream object passed in has already been created
+        # by this run, it would start a new generation on every rerun
+        raise TypeError(
+            f"a resumable token_stream must be a callable returning the stream, not {type(token_stream)}"
+        )
+    streams = session_scoped(_resumable_streams, on_close=_cancel_streams)
+    stream = None if streams is None else streams.get(key)
+    if stream is None or stream.error is not None or stream.cancelled.is_set():
+        stream = SharedStream(key)
+        if streams is not None:
+            streams[key] = stream
+        stream._produce(token_stream)
+    return stream
+
+
+def forget_resumable_stream(key: Any, stream: SharedStream):
+    """Forget the current session's `stream` for `key` once it was shown to completion"""
+    streams = session_scoped(_resumable_streams)
+    if streams is not None and streams.get(key) is stream:
+        del streams[key]
+
+
+def discard_resumable_stream(key: Any):
+    """Cancel and forget the current session's stream for `key`, the next run starts a new one"""
+    streams = session_scoped(_resumable_streams)
+    stream = None if streams is None else streams.pop(key, None)
+    if stream is not None:
+        stream.cancel()
@@ -0,0 +1,153 @@
+from __future__ import annotations
+import threading
+from dataclasses import dataclass
+from functools import cached_property
+from types import MappingProxyType
+from typing import *
+
+from streamlit_markdown.st_hack_common import RawJSON, get_serializer
+
+COLOR_KEYS = ("bg", "border", "text", "hover_bg", "hover_text")
+CSS_KEYS = (
+    "a_class",
+    "h1_class",
+    "h2_class",
+    "h3_class",
+    "h4_class",
+    "h5_class",
+    "h6_class",
+    "p_class",
+    "strong_class",
+    "em_class",
+    "code_class",
+    "code_button_class",
+    "code_latex_class",
+    "code_mermaid_class",
+    "pre_class",
+    "ul_class",
+    "ol_class",
+    "li_class",
+    "table_class",
+    "thead_class",
+    "th_class",
+    "td_class",
+    "blockquote_class",
+)
+
+
+@dataclass(frozen=True, eq=False)
+class ThemePreset:
+    """A named, immutable set of custom_color and custom_css classes.
+
+    Components get the preset's classes in full as custom_color and
+    custom_css, overridden by the classes given to them. The frontend has no
+    presets of its own and reads every class directly, so none may be left
+    out. Without overrides, the serialized classes of the preset are reused
+    by every component.
+    """
+
+    name: str
+    custom_color: Mapping[str, str]
+    custom_css: Mapping[str, str]
+    builtin: bool = False
+
+    def __post_init__(self):
+        custom_color = dict.fromkeys(COLOR_KEYS, "")
+        custom_color.update(self.custom_color)
+        custom_css = dict.fromkeys(CSS_KEYS, "")
+        custom_css.update(self.custom_css)
+        object.__setattr__(self, "custom_color", MappingProxyType(custom_color))
+        object.__setattr__(self, "custom_css", MappingProxyType(custom_css))
+
+    @cached_property
+    def custom_color_json(self) -> RawJSON:
+        return RawJSON(get_serializer()(dict(self.custom_color)))
+
+    @cached_property
+    def custom_css_json(self) -> RawJSON:
+        return RawJSON(get_serializer()(dict(self.custom_css)))
+
+    def args(
+        self,
+        custom_color: Optional[Mapping[str, str]] = None,
+        custom_css: Optional[Mapping[str, str]] = None,
+        raw: bool = True,
+    ) -> Dict[str, Any]:
+        """The component args selecting this preset, overridden by the given classes.
+
+        With `raw`, the classes of the preset are passed as pre-serialized
+        JSON when not overridden, which only the st_hack components understand.
+        """
+        args: Dict[str, Any] = {}
+        if custom_color:
+            args["custom_color"] = {**self.custom_color, **custom_color}
+        else:
+            args["custom_color"] = self.custom_color_json if raw else dict(self.custom_color)
+        if custom_css:
+            args["custom_css"] = {**self.custom_css, **custom_css}
+        else:
+            args["custom_css"] = self.custom_css_json if raw else dict(self.custom_css)
+        return args
+
+
+DEFAULT_THEME = ThemePreset(
+    "default",
+    custom_color={
+        "bg": "bg-gray-100",
+        "border": "border-gray-300",
+        "text": "text-green-900",
+        "hover_bg": "hover:bg-gray-200",
+        "hover_text": "hover:text-gray-900",
+    },
+    custom_css={},
+    builtin=True,
+)
+GRAY_THEME = ThemePreset(
+    "gray",
+    custom_color={
+        "bg": "bg-gray-100",
+        "border": "border-gray-300",
+        "text": "text-gray-900",
+        "hover_bg": "hover:bg-gray-200",
+        "hover_text": "hover:text-gray-900",
+    },
+    custom_css={},
+    builtin=True,
+)
+
+_themes: Dict[str, ThemePreset] = {theme.name: theme for theme in (DEFAULT_THEME, GRAY_THEME)}
+_themes_lock = threading.Lock()
+
+
+def register_theme(
+    name: str,
+    custom_color: Optional[Mapping[str, str]] = None,
+    custom_css: Optional[Mapping[str, str]] = None,
+    base: Union[str, ThemePreset] = "default",
+) -> ThemePreset:
+    """Register a theme preset for all sessions, returns it.
+
+    The classes not given are taken from `base`. Registering a name again
+    replaces the previous preset, built-in presets can't be replaced.
+    """
+    base = get_theme(base)
+    theme = ThemePreset(
+        name,
+        custom_color={**base.custom_color, **(custom_color or {})},
+        custom_css={**base.custom_css, **(custom_css or {})},
+    )
+    with _themes_lock:
+        current = _themes.get(name)
+        if current is not None and current.builtin:
+            raise ValueError(f"can't replace the built-in theme preset {name!r}")
+        _themes[name] = theme
+    return theme
+
+
+def get_theme(theme: Union[str, ThemePreset]) -> ThemePreset:
+    if isinstance(theme, ThemePreset):
+        return theme
+    try:
+        return _themes[theme]
+    except KeyError:
+        raise ValueError(f"unknown theme preset {theme!r}, register it with register_theme first") from None
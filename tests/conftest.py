@@ -0,0 +1,42 @@
+import json
+import textwrap
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import streamlit_markdown.frontend_features
+
+
+def component_args(at: AppTest):
+    """The args of every component the app shows, binary args included"""
+    args = []
+    for node in at.get("component_instance"):
+        values = json.loads(node.proto.json_args)
+        for special_arg in node.proto.special_args:
+            if special_arg.WhichOneof("value") == "bytes":
+                values[special_arg.key] = special_arg.bytes
+        args.append(values)
+    return args
+
+
+@pytest.fixture
+def run_app():
+    """Run a script, or rerun an AppTest, returns the AppTest and the args of its components"""
+
+    def run(script):
+        at = script if isinstance(script, AppTest) else AppTest.from_string(textwrap.dedent(script), default_timeout=30)
+        at.run()
+        assert not at.exception, at.exception
+        return at, component_args(at)
+
+    return run
+
+
+@pytest.fixture
+def frontend_features(monkeypatch):
+    """Set the features the served frontend reads, e.g. frontend_features("stream")"""
+
+    def set_features(*features):
+        monkeypatch.setattr(streamlit_markdown.frontend_features, "_features", frozenset(features))
+
+    return set_features
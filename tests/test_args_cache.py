@@ -0,0 +1,65 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import streamlit_markdown.st_hack_common as st_hack_common
+
+CACHED_APP = """
+import streamlit as st
+from streamlit_markdown import {function}
+
+content = st.session_state.get("content", "# a static document")
+{function}(content, key="doc", default=st.session_state.get("default"), cached={cached})
+"""
+
+
+@pytest.fixture
+def serializations(monkeypatch):
+    """The args serialized so far, by counting dumps_args calls"""
+    calls = []
+    dumps_args = st_hack_common.dumps_args
+
+    def counted(json_args):
+        calls.append(json_args)
+        return dumps_args(json_args)
+
+    monkeypatch.setattr(st_hack_common, "dumps_args", counted)
+    return calls
+
+
+@pytest.mark.parametrize("function", ["st_markdown", "st_hack_markdown"])
+def test_unchanged_cached_components_are_not_serialized_again(run_app, serializations, function):
+    at, [first] = run_app(CACHED_APP.format(function=function, cached=True))
+    assert len(serializations) == 1
+    _, [again] = run_app(at)
+    assert len(serializations) == 1
+    # the reused args are still sent
+    assert again == first
+
+    at.session_state["default"] = "changed"
+    _, [args] = run_app(at)
+    assert len(serializations) == 2
+    assert args["default"] == "changed"
+
+    at.session_state["content"] = "# another document"
+    _, [args] = run_app(at)
+    assert len(serializations) == 3
+    assert args["content"] == "# another document"
+    assert args["content_hash"] != first["content_hash"]
+
+
+def test_uncached_components_are_serialized_on_every_run(run_app, serializations):
+    at, _ = run_app(CACHED_APP.format(function="st_hack_markdown", cached=False))
+    run_app(at)
+    assert len(serializations) == 2
+
+
+def test_cached_components_need_a_key():
+    at = AppTest.from_string(
+        """
+from streamlit_markdown import st_markdown
+
+st_markdown("hi", cached=True)
+"""
+    )
+    at.run()
+    assert "key" in at.exception[0].message
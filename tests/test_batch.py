@@ -0,0 +1,48 @@
+import pytest
+
+from streamlit_markdown import st_markdown_batch
+from streamlit_markdown.math_prerender import math_key
+
+BATCH_APP = """
+from streamlit_markdown import st_markdown_batch
+
+st_markdown_batch(
+    ["# first", {"content": "second", "theme_color": "blue", "custom_css": None}],
+    key="history",
+)
+"""
+
+
+def test_batch_sends_the_messages(run_app, frontend_features):
+    frontend_features("messages")
+    _, [args] = run_app(BATCH_APP)
+    assert args["content"] == ""
+    # None overrides are dropped, the message uses the shared option
+    assert args["messages"] == [{"content": "# first"}, {"content": "second", "theme_color": "blue"}]
+    assert args["theme_color"] == "green"
+
+
+def test_batch_falls_back_to_one_document_with_an_older_frontend(run_app, frontend_features):
+    frontend_features()
+    _, [args] = run_app(BATCH_APP)
+    assert args["content"] == "# first\n\nsecond"
+    assert "messages" not in args
+
+
+def test_batch_prerenders_the_math_of_every_message(run_app, frontend_features):
+    frontend_features("messages")
+    _, [args] = run_app("""
+        from streamlit_markdown import st_markdown_batch
+
+        def renderer(formula, display):
+            return f"<mi>{formula}</mi>"
+
+        st_markdown_batch(["$a$", {"content": "$b$"}], key="history", prerender_math=True, math_renderer=renderer)
+    """)
+    assert args["prerendered_math"] == {math_key("a", False): "<mi>a</mi>", math_key("b", False): "<mi>b</mi>"}
+
+
+@pytest.mark.parametrize("message", [1, {"content": None}, {"theme_color": "blue"}])
+def test_batch_rejects_invalid_messages(message):
+    with pytest.raises(TypeError):
+        st_markdown_batch([message], key="history")
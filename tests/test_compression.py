@@ -0,0 +1,50 @@
+import zlib
+
+import pytest
+
+from streamlit_markdown.compression import content_args
+
+REPORT = "## Section\n\n" + "| a | b |\n|---|---|\n" + "| some cell | more text, déjà vu |\n" * 500
+
+
+def test_content_over_the_threshold_is_compressed(frontend_features):
+    frontend_features("content_zlib")
+    args = content_args(REPORT, compress_threshold=1000)
+    assert args["content"] == ""
+    assert len(args["content_zlib"]) < len(REPORT.encode())
+    assert zlib.decompress(args["content_zlib"]).decode() == REPORT
+
+
+@pytest.mark.parametrize(
+    "content, compress_threshold",
+    [
+        (REPORT, None),
+        # the threshold is in UTF-8 bytes, not characters
+        ("é" * 600, 1200),
+        # zlib's header makes short content larger
+        ("short", 1),
+    ],
+)
+def test_content_is_sent_as_is(frontend_features, content, compress_threshold):
+    frontend_features("content_zlib")
+    assert content_args(content, compress_threshold) == {"content": content}
+
+
+def test_content_is_sent_as_is_to_an_older_frontend(frontend_features):
+    frontend_features()
+    assert content_args(REPORT, compress_threshold=1000) == {"content": REPORT}
+
+
+COMPRESSED_APP = """
+from streamlit_markdown import st_markdown
+
+st_markdown("| cell |\\n" * 2000, compress_threshold=1000, key="report")
+"""
+
+
+def test_compressed_content_is_sent_as_a_binary_arg(run_app, frontend_features):
+    frontend_features("content_zlib")
+    at, [args] = run_app(COMPRESSED_APP)
+    [special_arg] = at.get("component_instance")[0].proto.special_args
+    assert special_arg.key == "content_zlib"
+    assert zlib.decompress(args["content_zlib"]).decode() == "| cell |\n" * 2000
@@ -0,0 +1,21 @@
+import pytest
+
+
+@pytest.mark.parametrize("function", ["st_markdown", "st_hack_markdown"])
+def test_key_and_default_keep_their_positions(run_app, function):
+    _, [args] = run_app(f"""
+        from streamlit_markdown import {function}
+
+        {function}("hi", True, "green", "forest", None, None, None, "positional-key", "positional-default")
+    """)
+    assert args["key"] == "positional-key"
+    assert args["default"] == "positional-default"
+    assert args["incremental"] is False
+
+
+def test_new_options_are_keyword_only():
+    from streamlit_markdown import st_hack_markdown, st_markdown
+
+    for function in [st_markdown, st_hack_markdown]:
+        with pytest.raises(TypeError):
+            function("hi", True, "green", "forest", None, None, None, "key", None, True)
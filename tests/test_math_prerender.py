@@ -0,0 +1,92 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from streamlit_markdown.math_prerender import (
+    _renderer_key,
+    extract_math,
+    math_key,
+    prerender_math,
+    sanitize_math_html,
+)
+
+
+@pytest.mark.parametrize(
+    "content, expected",
+    [
+        ("$a+b$", [("a+b", False)]),
+        ("$$y=f(x)$$", [("y=f(x)", True)]),
+        ("text $x$ and $$y$$", [("x", False), ("y", True)]),
+        ("$$\nE = mc^2\n$$", [("E = mc^2", True)]),
+        ("$$ a\nb\n$$", [("a\nb", True)]),
+        (r"costs \$5 and \$6", []),
+        ("`$x$` and\n```\n$$y$$\n```\n$z$", [("z", False)]),
+    ],
+)
+def test_extract_math(content, expected):
+    assert list(extract_math(content)) == expected
+
+
+@pytest.mark.parametrize(
+    "markup, expected",
+    [
+        ('<math display="block"><mi>x</mi></math>', '<math display="block"><mi>x</mi></math>'),
+        ("<mtext><script>alert(1)</script>a</mtext>", "<mtext>a</mtext>"),
+        ('<mi onclick="alert(1)" mathvariant="bold">x</mi>', '<mi mathvariant="bold">x</mi>'),
+        ('<span style="background: url(x)">x</span>', "<span>x</span>"),
+        ("<mtext>&lt;img src=x onerror=alert(1)&gt;</mtext>", "<mtext>&lt;img src=x onerror=alert(1)&gt;</mtext>"),
+        ('<svg viewBox="0 0 1 1"><path d="M0 0"/></svg>', '<svg viewBox="0 0 1 1"><path d="M0 0"/></svg>'),
+        ('<a href="javascript:alert(1)">x</a>', "x"),
+    ],
+)
+def test_sanitize_math_html(markup, expected):
+    assert sanitize_math_html(markup) == expected
+
+
+def test_prerender_math_keys_match_the_frontend():
+    def renderer(formula, display):
+        return f"<mi>{'D' if display else 'I'}{formula}</mi>"
+
+    prerendered = prerender_math("$x$ and $$y=f(x)$$", renderer)
+    assert prerendered == {
+        math_key("x", False): "<mi>Ix</mi>",
+        math_key("y=f(x)", True): "<mi>Dy=f(x)</mi>",
+    }
+
+
+def test_prerender_math_leaves_failed_formulas_to_katex():
+    def renderer(formula, display):
+        if formula == "bad":
+            raise ValueError(formula)
+        return f"<mi>{formula}</mi>"
+
+    assert prerender_math("$bad$ $good$", renderer) == {math_key("good", False): "<mi>good</mi>"}
+
+
+def test_renderings_are_cached_by_where_the_renderer_is_defined():
+    calls = []
+
+    def make_renderer():
+        def renderer(formula, display):
+            calls.append(formula)
+            return f"<mi>{formula}</mi>"
+
+        return renderer
+
+    # a renderer recreated on every rerun
+    first, second = make_renderer(), make_renderer()
+    assert _renderer_key(first) == _renderer_key(second)
+    prerender_math("$cached_formula$", first)
+    prerender_math("$cached_formula$", second)
+    assert calls == ["cached_formula"]
+
+
+def test_prerender_math_is_rejected_with_delta_protocol():
+    at = AppTest.from_string(
+        """
+from streamlit_markdown import st_streaming_markdown
+
+st_streaming_markdown((token for token in ["$x$"]), key="stream", delta_protocol=True, prerender_math=True)
+"""
+    )
+    at.run()
+    assert "prerender_math" in at.exception[0].message
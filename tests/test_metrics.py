@@ -0,0 +1,78 @@
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from streamlit_markdown.metrics import record_frontend_metrics
+
+INSTRUMENTED_APP = """
+import streamlit as st
+from streamlit_markdown import get_markdown_metrics, {function}
+
+{function}("# report " * 100, key="report", instrument=True, cached={cached})
+st.session_state["metrics"] = get_markdown_metrics("report")
+"""
+
+
+def test_st_markdown_measures_the_call(run_app):
+    at, [args] = run_app(INSTRUMENTED_APP.format(function="st_markdown", cached=False))
+    metrics = at.session_state["metrics"]
+    assert args["instrument"] is True
+    assert metrics.calls == 1
+    assert metrics.marshall_ms > 0
+    # Streamlit serializes the args of st_markdown, the size is measured afterwards
+    assert metrics.serialize_ms is None
+    assert metrics.payload_bytes > len("# report " * 100)
+    run_app(at)
+    assert at.session_state["metrics"].calls == 2
+    assert at.session_state["metrics"].total_payload_bytes == 2 * metrics.payload_bytes
+
+
+def test_st_hack_markdown_measures_the_serialization(run_app):
+    at, _ = run_app(INSTRUMENTED_APP.format(function="st_hack_markdown", cached=True))
+    metrics = at.session_state["metrics"]
+    assert metrics.serialize_ms is not None and metrics.serialize_ms <= metrics.marshall_ms
+    assert not metrics.cached
+    run_app(at)
+    assert at.session_state["metrics"].cached
+
+
+def test_frontend_reports_are_kept_once_per_seq():
+    reported = []
+    report = {"metrics": {"seq": 1, "phases": {"parse": {"count": 1, "total_ms": 2.0, "last_ms": 2.0}}}}
+    assert record_frontend_metrics("report", report, reported.append)
+    assert reported and reported[0].frontend == report["metrics"]
+    assert not record_frontend_metrics("report", "a component value", reported.append)
+    assert not record_frontend_metrics("report", {"metrics": None}, reported.append)
+    assert len(reported) == 1
+
+
+def test_frontend_reports_are_not_returned(run_app):
+    at, _ = run_app("""
+        import streamlit as st
+        import streamlit_markdown
+        from streamlit_markdown import get_markdown_metrics, st_hack_markdown
+
+        component = streamlit_markdown.st_hack_component
+        # what the frontend sends back once the rendering settled
+        streamlit_markdown.st_hack_component = lambda *args, **kwargs: {"metrics": {"seq": 3, "height_updates": 2}}
+        try:
+            st.session_state["value"] = st_hack_markdown("hi", key="report", default="default", instrument=True)
+        finally:
+            streamlit_markdown.st_hack_component = component
+        st.session_state["frontend"] = get_markdown_metrics("report").frontend
+    """)
+    assert at.session_state["value"] == "default"
+    assert at.session_state["frontend"] == {"seq": 3, "height_updates": 2}
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        # a frontend report would rerun the script mid-stream
+        'st_streaming_markdown((token for token in ["hi"]), key="answer", instrument=True)',
+        'st_markdown("hi", instrument=True)',
+    ],
+)
+def test_instrument_is_refused(call):
+    at = AppTest.from_string(f"from streamlit_markdown import st_markdown, st_streaming_markdown\n{call}")
+    at.run()
+    assert "instrument" in at.exception[0].message
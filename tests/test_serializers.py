@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import streamlit_markdown.st_hack_common as st_hack_common
+from streamlit_markdown.st_hack_common import SERIALIZERS, RawJSON, dumps_args, set_serializer
+
+
+class Name(str):
+    pass
+
+
+ARGS = {
+    "content": "# Title\n\nnaïve 数学 $y=f(x)$ 🎉 \"quoted\" \\ back",
+    "richContent": True,
+    "virtual_height": 600,
+    "ratio": 0.5,
+    "mermaid_theme_CSS": None,
+    "custom_color": {"bg": "bg-gray-100", "text": ""},
+    "messages": [{"content": "a"}, {"content": "b", "incremental": False}],
+}
+
+
+@pytest.fixture(params=["json", "orjson", "msgspec"])
+def backend(request, monkeypatch):
+    if request.param not in SERIALIZERS:
+        pytest.skip(f"{request.param} is not installed")
+    monkeypatch.setattr(st_hack_common, "_serializer", st_hack_common._serializer)
+    set_serializer(request.param)
+    return SERIALIZERS[request.param]
+
+
+def test_output_parses_to_the_args(backend):
+    serialized = backend(ARGS)
+    assert json.loads(serialized) == ARGS
+    assert json.loads(serialized) == json.loads(json.dumps(ARGS))
+    # compact, unlike Streamlit's json.dumps
+    assert ", " not in serialized and '": ' not in serialized
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        # half of an emoji, split across two streamed tokens
+        {"content": "partial \ud83d"},
+        {"seq": 2**70},
+        {Name("content"): Name("subclass")},
+    ],
+)
+def test_falls_back_on_what_it_cant_encode(backend, value):
+    serialized = backend(value)
+    serialized.encode("utf-8")
+    assert json.loads(serialized) == value
+
+
+def test_json_escapes_non_ascii():
+    assert SERIALIZERS["json"](ARGS).isascii()
+
+
+def test_dumps_args_appends_raw_json(backend):
+    args = {"content": "hi", "custom_css": RawJSON('{"p_class":"x"}'), "key": "k"}
+    serialized = dumps_args(args)
+    assert json.loads(serialized) == {"content": "hi", "custom_css": {"p_class": "x"}, "key": "k"}
+    assert list(json.loads(serialized)) == ["content", "key", "custom_css"]
+    assert json.loads(dumps_args({"custom_css": RawJSON("{}")})) == {"custom_css": {}}
+
+
+def test_set_serializer():
+    with pytest.raises(ValueError):
+        set_serializer("pickle")
+    previous = st_hack_common.get_serializer()
+    try:
+        set_serializer(lambda value: "{}")
+        assert dumps_args({"content": "hi"}) == "{}"
+    finally:
+        set_serializer(previous)
@@ -0,0 +1,285 @@
+import threading
+import time
+
+import pytest
+
+import streamlit_markdown.streaming as streaming
+from streamlit_markdown.streaming import (
+    ContentBuffer,
+    DeltaEncoder,
+    SharedStream,
+    ThreadedTokenProducer,
+    TokenCoalescer,
+    TokenProducer,
+    script_interrupted,
+)
+
+
+def no_deadline():
+    return None
+
+
+def wait_until(condition, timeout=2.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 4096])
+def test_content_buffer_since(block_size):
+    buffer = ContentBuffer(block_size=block_size)
+    document = ""
+    for token in ["ab", "c", "", "defg", "h", "ij"]:
+        buffer.append(token)
+        document += token
+        for offset in range(len(document) + 2):
+            assert buffer.since(offset) == document[offset:]
+    assert len(buffer) == len(document)
+    assert buffer.getvalue() == document
+    # reading the whole document joins the blocks, offsets still hold after that
+    buffer.append("kl")
+    assert buffer.since(5) == "fghijkl"
+
+
+def test_coalescer_flushes_first_token_immediately():
+    coalescer = TokenCoalescer(flush_interval_ms=100)
+    assert coalescer.push(1, now=0.0)
+    assert coalescer.deadline() == 0.0
+
+
+def test_coalescer_waits_for_flush_interval():
+    coalescer = TokenCoalescer(flush_interval_ms=100, max_latency_ms=None)
+    coalescer.push(1, now=0.0)
+    coalescer.flushed(now=0.0)
+    assert not coalescer.pending
+    assert not coalescer.push(1, now=0.05)
+    assert coalescer.deadline() == pytest.approx(0.1)
+    assert not coalescer.due(now=0.09)
+    assert coalescer.due(now=0.1)
+
+
+def test_coalescer_min_chars_until_max_latency():
+    coalescer = TokenCoalescer(flush_interval_ms=10, min_chars=5, max_latency_ms=200)
+    coalescer.push(1, now=0.0)
+    coalescer.flushed(now=0.0)
+    assert not coalescer.push(2, now=0.05)
+    # too few characters: only the latency bound is left
+    assert coalescer.deadline() == pytest.approx(0.25)
+    assert not coalescer.due(now=0.2)
+    assert coalescer.due(now=0.25)
+    assert coalescer.push(3, now=0.06)
+
+
+def test_producer_backpressure():
+    produced = []
+
+    def token_stream():
+        for index in range(100):
+            produced.append(index)
+            yield str(index)
+
+    producer = ThreadedTokenProducer(token_stream(), maxsize=2, poll_interval=0.01).start()
+    assert wait_until(lambda: producer.queue.full())
+    time.sleep(0.05)
+    # the queue is full and one more token waits to be put
+    assert len(produced) <= 3
+    tokens = [token for token in producer.tokens(no_deadline) if token]
+    assert tokens == [str(index) for index in range(100)]
+
+
+def test_producer_propagates_exceptions():
+    def token_stream():
+        yield "a"
+        raise ValueError("boom")
+
+    producer = ThreadedTokenProducer(token_stream(), poll_interval=0.01).start()
+    tokens = []
+    with pytest.raises(ValueError, match="boom"):
+        for token in producer.tokens(no_deadline):
+            tokens.append(token)
+    assert "".join(tokens) == "a"
+
+
+def test_producer_cancellation_closes_the_source():
+    closed = threading.Event()
+
+    def token_stream():
+        try:
+            while True:
+                yield "x"
+        finally:
+            closed.set()
+
+    producer = ThreadedTokenProducer(token_stream(), maxsize=4, poll_interval=0.01).start()
+    tokens = producer.tokens(no_deadline)
+    assert next(tokens) == "x"
+    # the script stops reading, e.g. on a rerun
+    tokens.close()
+    assert producer.cancelled.is_set()
+    producer.thread.join(timeout=2)
+    assert not producer.thread.is_alive()
+    assert closed.is_set()
+
+
+def test_shared_stream_reader_gets_everything_before_finish():
+    stream = SharedStream("test")
+    stream.append("hello ")
+    stream.append("world")
+    stream.finish()
+    assert list(stream.reader(poll_interval=0.01).tokens(no_deadline)) == ["hello world"]
+
+
+def test_shared_stream_reader_follows_producer():
+    stream = SharedStream("test")
+    expected = [f"token{index} " for index in range(200)]
+    stream._produce(iter(expected))
+    tokens = stream.reader(poll_interval=0.01).tokens(no_deadline)
+    assert "".join(tokens) == "".join(expected)
+    assert stream.done and stream.error is None
+
+
+def test_shared_stream_reader_raises_after_the_text():
+    stream = SharedStream("test")
+    stream.append("partial")
+    stream.finish(ValueError("boom"))
+    tokens = []
+    with pytest.raises(ValueError, match="boom"):
+        for token in stream.reader(poll_interval=0.01).tokens(no_deadline):
+            tokens.append(token)
+    assert tokens == ["partial"]
+
+
+def test_delta_encoder_deltas_are_cumulative():
+    encoder = DeltaEncoder(snapshot_every=3)
+    buffer = ContentBuffer(block_size=2)
+    payloads = []
+    for token in "abcdefgh":
+        buffer.append(token)
+        payloads.append(encoder.encode(buffer))
+    payloads.append(encoder.encode(buffer, done=True))
+    assert [payload["snapshot"] for payload in payloads] == [True, False, False, True, False, False, True, False, True]
+    assert len({payload["stream"] for payload in payloads}) == 1
+    snapshot = ""
+    for payload in payloads:
+        # any delta completes the last snapshot on its own
+        if payload["snapshot"]:
+            snapshot = payload["text"]
+        assert snapshot[: payload["offset"]] + payload["text"] == "abcdefgh"[: payload["seq"] + 1]
+    assert DeltaEncoder().stream != encoder.stream
+
+
+STREAM_APP = """
+from streamlit_markdown import st_streaming_markdown
+
+st_streaming_markdown((token for token in ["Hello", " world"]), key="stream", delta_protocol=True)
+"""
+
+
+def test_delta_protocol_with_a_frontend_that_reads_it(run_app, frontend_features):
+    frontend_features("stream")
+    _, [args] = run_app(STREAM_APP)
+    assert args["content"] == ""
+    assert args["stream"]["snapshot"] and args["stream"]["done"]
+    assert args["stream"]["text"] == "Hello world"
+
+
+def test_delta_protocol_falls_back_to_content_with_an_older_frontend(run_app, frontend_features):
+    frontend_features()
+    _, [args] = run_app(STREAM_APP)
+    assert args["content"] == "Hello world"
+    assert "stream" not in args
+
+
+def test_committed_build_features_match_the_source():
+    from streamlit_markdown.frontend_features import (
+        BUILD_FEATURES_PATH,
+        SOURCE_FEATURES_PATH,
+        load_frontend_features,
+    )
+
+    # out/ only lists what it was built with, which the source must still read
+    assert load_frontend_features(BUILD_FEATURES_PATH) <= load_frontend_features(SOURCE_FEATURES_PATH)
+
+
+STALLING_APP = """
+import time
+
+import streamlit as st
+import streamlit_markdown
+
+renders = []
+render = streamlit_markdown.st_hack_markdown
+
+
+def recorded(content, *args, **kwargs):
+    renders.append((time.monotonic(), content))
+    return render(content, *args, **kwargs)
+
+
+def token_stream():
+    yield "Hello"
+    time.sleep(0.005)
+    yield " world."
+    time.sleep(0.5)
+    yield " Done"
+
+
+streamlit_markdown.st_hack_markdown = recorded
+try:
+    start = time.monotonic()
+    streamlit_markdown.st_streaming_markdown(token_stream(), key="stream", background={background})
+finally:
+    streamlit_markdown.st_hack_markdown = render
+st.session_state["renders"] = [(at - start, content) for at, content in renders]
+"""
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_tokens_before_a_stall_are_shown_before_it_ends(run_app, background):
+    at, _ = run_app(STALLING_APP.format(background=background))
+    renders = at.session_state["renders"]
+    assert renders[-1][1] == "Hello world. Done"
+    shown = [at for at, content in renders if content == "Hello world."]
+    # the stall is 500 ms, max_latency_ms is 100
+    assert shown and shown[0] < 0.3
+
+
+def test_token_producer_is_abstract():
+    with pytest.raises(TypeError):
+        TokenProducer(iter([]))
+
+
+class FakeRequestType:
+    def __init__(self, name):
+        self.name = name
+
+
+class FakeScriptRequests:
+    def __init__(self, name):
+        self._state = FakeRequestType(name)
+
+
+class FakeContext:
+    def __init__(self, requests):
+        self.script_requests = requests
+
+
+@pytest.mark.parametrize(
+    "context, interrupted",
+    [
+        (None, False),
+        (FakeContext(FakeScriptRequests("CONTINUE")), False),
+        (FakeContext(FakeScriptRequests("RERUN")), True),
+        (FakeContext(FakeScriptRequests("STOP")), True),
+        # other Streamlit versions: not interrupted before the next element
+        (FakeContext(None), False),
+        (FakeContext(object()), False),
+        (FakeContext(FakeScriptRequests("SOMETHING_NEW")), False),
+    ],
+)
+def test_script_interrupted(monkeypatch, context, interrupted):
+    monkeypatch.setattr(streaming, "get_script_run_ctx", lambda: context)
+    assert script_interrupted() is interrupted
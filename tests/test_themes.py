@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from streamlit_markdown.st_hack_common import RawJSON
+from streamlit_markdown.themes import CSS_KEYS, DEFAULT_THEME, get_theme, register_theme
+
+
+def test_register_theme_fills_in_from_its_base():
+    theme = register_theme("test-ocean", custom_color={"text": "text-blue-900"}, custom_css={"h1_class": "text-3xl"}, base="gray")
+    assert get_theme("test-ocean") is theme
+    assert theme.custom_color == {**get_theme("gray").custom_color, "text": "text-blue-900"}
+    assert set(theme.custom_css) == set(CSS_KEYS)
+    assert theme.custom_css["h1_class"] == "text-3xl"
+    with pytest.raises(TypeError):
+        theme.custom_color["text"] = "text-red-900"
+
+
+def test_builtin_themes_cant_be_replaced():
+    with pytest.raises(ValueError):
+        register_theme("default", custom_color={"text": "text-red-900"})
+    assert DEFAULT_THEME.custom_color["text"] == "text-green-900"
+
+
+def test_unknown_theme():
+    with pytest.raises(ValueError, match="register_theme"):
+        get_theme("test-missing")
+
+
+def test_args_reuse_the_serialized_classes_without_overrides():
+    args = DEFAULT_THEME.args()
+    assert set(args) == {"custom_color", "custom_css"}
+    assert isinstance(args["custom_color"], RawJSON)
+    assert args["custom_color"] is DEFAULT_THEME.args()["custom_color"]
+    assert DEFAULT_THEME.args(raw=False)["custom_color"] == dict(DEFAULT_THEME.custom_color)
+
+
+def test_args_overrides_keep_every_class():
+    args = DEFAULT_THEME.args(custom_color={"bg": "bg-white"}, custom_css={"p_class": "text-sm"})
+    assert args["custom_color"] == {**DEFAULT_THEME.custom_color, "bg": "bg-white"}
+    assert set(args["custom_css"]) == set(CSS_KEYS)
+    assert args["custom_css"]["p_class"] == "text-sm"
+
+
+@pytest.mark.parametrize("function", ["st_markdown", "st_hack_markdown"])
+def test_components_get_the_full_classes_of_the_preset(run_app, function):
+    _, [args] = run_app(f"""
+        from streamlit_markdown import {function}, register_theme
+
+        register_theme("test-forest", custom_color={{"text": "text-emerald-900"}})
+        {function}("hi", custom_css={{"p_class": "text-sm"}}, key="themed", theme="test-forest")
+    """)
+    assert "theme_preset" not in args
+    assert args["custom_color"] == {**DEFAULT_THEME.custom_color, "text": "text-emerald-900"}
+    assert args["custom_css"] == {**dict.fromkeys(CSS_KEYS, ""), "p_class": "text-sm"}
+
+
+def test_serialized_classes_are_valid_json():
+    assert json.loads(DEFAULT_THEME.custom_css_json.json) == dict(DEFAULT_THEME.custom_css)